@@ -0,0 +1,14 @@
+"""report benchmarks: synthetic querylog generator, scenarios and results file
+
+usage:
+    python -m benchmarks generate --requests 1000000
+    python -m benchmarks run --repeat 3
+    python -m benchmarks compare
+    python -m benchmarks mqtt --requests 1000 --concurrency 50 --drop 0.01
+    python -m benchmarks broker --port 1883
+
+mqtt runs search and enrollment of mqtt_utils against local broker stand-in with
+simulated device (or against --broker), broker runs stand-in alone for manual tests
+
+sqlite database benchmark.sqlite3 is used by default,
+BENCHMARK_DATABASE=mysql uses local mysql database idenick_benchmark"""
@@ -0,0 +1,193 @@
+"""benchmarks command line"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'idenick_project.benchsettings')
+
+
+def _generate(args) -> None:
+    from django.core.management import call_command
+
+    from benchmarks import generator
+
+    call_command('migrate', verbosity=0)
+    params = generator.DatasetParams(
+        requests_count=args.requests, organizations=args.organizations,
+        employees=args.employees, seed=args.seed,
+        start=datetime.strptime(args.start, '%Y%m%d').date())
+    try:
+        generated = generator.generate(
+            params, on_progress=lambda count: print('Generated requests: %d' % count, end='\r'))
+    except ValueError as e:
+        sys.exit(str(e))
+    print('Generated requests: %d' % generated)
+
+
+def _run(args) -> None:
+    from benchmarks import runner, scenarios
+
+    selected = scenarios.get_scenarios()
+    if args.scenario:
+        selected = [s for s in selected if s.name in args.scenario]
+        if not selected:
+            sys.exit('Unknown scenarios: %s' % ', '.join(args.scenario))
+
+    print('%-32s %10s %10s %8s %12s' % ('scenario', 'min, s', 'median, s', 'queries',
+                                        'peak, KiB'))
+    results = runner.run(selected, args.repeat, args.results, on_result=lambda r: print(
+        '%-32s %10.4f %10.4f %8d %12d' % (r['scenario'], r['wall_time_min'],
+                                          r['wall_time_median'], r['queries'],
+                                          r['peak_memory'] // 1024)))
+
+    exceeded = runner.get_exceeded_budgets(results)
+    if exceeded:
+        sys.exit('Query budget exceeded: %s' % ', '.join(
+            '%s (%d > %d)' % (r['scenario'], r['queries'], r['max_queries']) for r in exceeded))
+
+
+def _compare(args) -> None:
+    from benchmarks import runner
+
+    print('%-8s %10s %-32s %12s %12s %10s %10s %10s' % (
+        'database', 'requests', 'scenario', 'commit', 'previous', 'time', 'queries',
+        'memory'))
+    for info in runner.compare(runner.load_results(args.results)):
+        previous = info['previous']
+
+        def change(name):
+            value = info.get(name + '_change')
+            return '-' if value is None else '%+.1f%%' % (value * 100)
+
+        print('%-8s %10d %-32s %12s %12s %10s %10s %10s' % (
+            info['database'], info['requests'], info['scenario'],
+            info['last']['commit'], '-' if previous is None else previous['commit'],
+            change('wall_time_median'), change('queries'), change('peak_memory')))
+
+
+def _get_device_script(args):
+    from benchmarks import mqtt_broker
+
+    return mqtt_broker.DeviceScript(
+        delay=args.delay, jitter=args.jitter, drop=args.drop, not_found=args.not_found,
+        duplicate=args.duplicate, low_quality=args.lowtq, seed=args.seed)
+
+
+def _broker(args) -> None:
+    import time
+
+    from benchmarks import mqtt_broker
+
+    broker = mqtt_broker.Broker(args.host, args.port).start()
+    simulator = mqtt_broker.DeviceSimulator(broker, _get_device_script(args))
+    print('Broker with simulated device listens on %s:%d' % (broker.host, broker.port))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print('Replies: %s' % simulator.replies)
+
+
+def _mqtt(args) -> None:
+    from django.core.management import call_command
+
+    from benchmarks import mqtt_broker, mqtt_load
+    from idenick_rest_api_v0.classes.utils import mqtt_utils
+
+    simulator = None
+    if args.broker is None:
+        broker = mqtt_broker.Broker().start()
+        simulator = mqtt_broker.DeviceSimulator(broker, _get_device_script(args))
+        mqtt_utils.HOST, mqtt_utils.PORT = broker.host, broker.port
+    else:
+        host, _, port = args.broker.partition(':')
+        mqtt_utils.HOST, mqtt_utils.PORT = host, int(port or 1883)
+
+    # registration looks up employees of replies
+    call_command('migrate', verbosity=0)
+    for operation in args.operation or mqtt_load.OPERATIONS:
+        result = mqtt_load.run(operation, args.requests, args.concurrency, args.timeout,
+                               args.devices)
+        print('\n'.join(mqtt_load.get_report(result)))
+        print()
+    if simulator is not None:
+        print('Device replies: %s' % simulator.replies)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generate_parser = subparsers.add_parser('generate', help='fill empty benchmark database')
+    generate_parser.add_argument('--requests', type=int, default=1000000)
+    generate_parser.add_argument('--organizations', type=int, default=2)
+    generate_parser.add_argument('--employees', type=int, default=500)
+    generate_parser.add_argument('--seed', type=int, default=1)
+    generate_parser.add_argument('--start', default='20200101', help='first day as YYYYMMDD')
+    generate_parser.set_defaults(handler=_generate)
+
+    run_parser = subparsers.add_parser('run', help='measure scenarios')
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--scenario', action='append',
+                            help='run only named scenario, can be repeated')
+    run_parser.set_defaults(handler=_run)
+
+    compare_parser = subparsers.add_parser(
+        'compare', help='compare last two runs of scenarios')
+    compare_parser.set_defaults(handler=_compare)
+
+    broker_parser = subparsers.add_parser(
+        'broker', help='run local MQTT broker with simulated biometry device')
+    broker_parser.add_argument('--host', default='127.0.0.1')
+    broker_parser.add_argument('--port', type=int, default=1883)
+    broker_parser.set_defaults(handler=_broker)
+
+    mqtt_parser = subparsers.add_parser(
+        'mqtt', help='load biometry commands against local or given broker')
+    mqtt_parser.add_argument('--operation', action='append', choices=('search', 'enroll'),
+                             help='run only given operation, can be repeated')
+    mqtt_parser.add_argument('--requests', type=int, default=1000)
+    mqtt_parser.add_argument('--concurrency', type=int, default=50)
+    mqtt_parser.add_argument('--timeout', type=float, default=5.0,
+                             help='deadline of command, seconds')
+    mqtt_parser.add_argument('--devices', type=int, default=1,
+                             help='enrollments are spread over devices')
+    mqtt_parser.add_argument('--broker', default=None,
+                             help='host:port of broker with devices instead of local one')
+    mqtt_parser.set_defaults(handler=_mqtt)
+
+    for subparser in (broker_parser, mqtt_parser):
+        subparser.add_argument('--delay', type=float, default=0.05,
+                               help='reply delay of device, seconds')
+        subparser.add_argument('--jitter', type=float, default=0.0,
+                               help='max random deviation of reply delay, seconds')
+        subparser.add_argument('--drop', type=float, default=0.0,
+                               help='share of commands without reply')
+        subparser.add_argument('--not-found', type=float, default=0.0,
+                               help='share of searches without !SEARCH_OK')
+        subparser.add_argument('--duplicate', type=float, default=0.0,
+                               help='share of enrollments answered with !DUPLICATE')
+        subparser.add_argument('--lowtq', type=float, default=0.0,
+                               help='share of enrollments answered with !LOWTQ')
+        subparser.add_argument('--seed', type=int, default=None)
+
+    for subparser in (run_parser, compare_parser):
+        subparser.add_argument('--results', default=None,
+                               help='results file, benchmarks/results.jsonl by default')
+
+    args = parser.parse_args()
+
+    import django
+
+    django.setup()
+
+    if getattr(args, 'results', None) is None:
+        from benchmarks import runner
+        args.results = runner.DEFAULT_RESULTS_FILE
+
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""deterministic synthetic data for benchmarks"""
+import random
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Callable, List, Optional, Tuple
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from idenick_app.classes.constants.identification import (algorithm_constants,
+                                                          request_constants,
+                                                          response_constants)
+from idenick_app.models import (Checkpoint, Checkpoint2Organization,
+                                Department, Device, Device2Organization,
+                                Employee, Employee2Department,
+                                Employee2Organization, EmployeeRequest, Login,
+                                Organization)
+
+ADMIN_USERNAME = 'benchmark_admin'
+CONTROLLER_USERNAME = 'benchmark_controller'
+
+_INSERT_BATCH_SIZE = 10000
+_DEVICES_PER_ORGANIZATION = 4
+_DEPARTMENTS_PER_ORGANIZATION = 6
+_TIMEZONES = (timedelta(hours=3), timedelta(hours=5), None, timedelta(hours=-4),)
+_TIMESHEETS = (('09:00', '18:00'), ('08:00', '17:00'), ('10:00', '19:00'),)
+_REQUEST_FIELDS = ('moment', 'request_type', 'response_type', 'description',
+                   'algorithm_type', 'employee', 'device', 'templatesid',)
+
+
+@dataclass
+class DatasetParams:
+    """params of generated dataset"""
+
+    def __init__(self, requests_count: int, organizations: int = 2, employees: int = 500,
+                 seed: int = 1, start: date = date(2020, 1, 1)):
+        self.requests_count = requests_count
+        self.organizations = organizations
+        self.employees = employees
+        self.seed = seed
+        self.start = start
+
+
+@dataclass
+class _EmployeeInfo:
+    def __init__(self, employee_id: int, devices: List[Tuple[int, Optional[timedelta]]],
+                 start: timedelta, end: timedelta):
+        self.employee_id = employee_id
+        self.devices = devices
+        self.start = start
+        self.end = end
+
+
+def _get_guid(rnd: random.Random) -> str:
+    return str(uuid.UUID(int=rnd.getrandbits(128)))
+
+
+def _to_duration(value: str) -> timedelta:
+    hours, minutes = value.split(':')
+    return timedelta(hours=int(hours), minutes=int(minutes))
+
+
+def _create_entities(rnd: random.Random, params: DatasetParams) -> List[_EmployeeInfo]:
+    organizations = []
+    for i in range(params.organizations):
+        timesheet_start, timesheet_end = _TIMESHEETS[i % len(_TIMESHEETS)]
+        organizations.append(Organization.objects.create(
+            guid=_get_guid(rnd), name='Organization %d' % (i + 1),
+            timesheet_start=timesheet_start, timesheet_end=timesheet_end))
+
+    organization_devices = {}
+    for organization in organizations:
+        checkpoints = [Checkpoint.objects.create(name='%s checkpoint %d' % (organization.name, i))
+                       for i in range(_DEVICES_PER_ORGANIZATION // 2)]
+        for checkpoint in checkpoints:
+            Checkpoint2Organization.objects.create(
+                checkpoint=checkpoint, organization=organization)
+
+        devices = []
+        for i in range(_DEVICES_PER_ORGANIZATION):
+            device = Device.objects.create(
+                mqtt='%s-%d' % (organization.guid, i),
+                name='%s device %d' % (organization.name, i),
+                checkpoint=checkpoints[i // 2],
+                timezone=_TIMEZONES[(organization.id + i // 2) % len(_TIMEZONES)])
+            Device2Organization.objects.create(
+                device=device, organization=organization)
+            devices.append((device.id, device.timezone))
+        organization_devices.update({organization.id: devices})
+
+    organization_departments = {
+        organization.id: [Department.objects.create(
+            organization=organization, name='Department %d' % i,
+            show_in_report=(i % 3 != 2))
+            for i in range(_DEPARTMENTS_PER_ORGANIZATION)]
+        for organization in organizations}
+
+    Employee.objects.bulk_create(
+        [Employee(guid=_get_guid(rnd), last_name='Surname%d' % i, first_name='Name%d' % i,
+                  patronymic='Patronymic%d' % i)
+         for i in range(params.employees)])
+    employees = list(Employee.objects.order_by('id'))
+
+    relations = []
+    departments_relations = []
+    result = []
+    for i, employee in enumerate(employees):
+        organization = organizations[i % len(organizations)]
+        employee_timesheet = rnd.choice(_TIMESHEETS) if rnd.random() < 0.1 else (None, None)
+        relations.append(Employee2Organization(
+            employee=employee, organization=organization,
+            timesheet_start=employee_timesheet[0], timesheet_end=employee_timesheet[1]))
+        for department in rnd.sample(organization_departments[organization.id], rnd.randint(1, 2)):
+            departments_relations.append(Employee2Department(
+                employee=employee, department=department))
+
+        result.append(_EmployeeInfo(
+            employee_id=employee.id,
+            devices=organization_devices[organization.id],
+            start=_to_duration(employee_timesheet[0] or organization.timesheet_start),
+            end=_to_duration(employee_timesheet[1] or organization.timesheet_end)))
+    Employee2Organization.objects.bulk_create(relations)
+    Employee2Department.objects.bulk_create(departments_relations)
+
+    admin = User.objects.create(username=ADMIN_USERNAME)
+    Login.objects.filter(user=admin).update(role=Login.ADMIN)
+    controller = User.objects.create(username=CONTROLLER_USERNAME)
+    Login.objects.filter(user=controller).update(
+        role=Login.CONTROLLER, organization=organizations[0])
+
+    return result
+
+
+def _get_request(moment: datetime, employee_id: Optional[int], device_id: int,
+                 response_type: int) -> tuple:
+    """values in order of _REQUEST_FIELDS"""
+    return (moment, request_constants.FINGER_SEARCH, response_type, None,
+            algorithm_constants.FINGER_ALGORITHM_1, employee_id, device_id, None)
+
+
+def _get_passage(rnd: random.Random, day: date, local_time: timedelta, employee_id: int,
+                 device: Tuple[int, Optional[timedelta]]) -> List[tuple]:
+    """successful identification, sometimes after failed attempt"""
+    device_id, timezone = device
+    moment = datetime.combine(day, datetime.min.time()) + local_time \
+        + timedelta(seconds=rnd.randint(0, 59))
+    if timezone is not None:
+        moment -= timezone
+
+    result = []
+    if rnd.random() < 0.03:
+        result.append(_get_request(moment, None, device_id, response_constants.NO_MATCH))
+        moment += timedelta(seconds=rnd.randint(3, 20))
+    result.append(_get_request(moment, employee_id, device_id, response_constants.SEARCH_OK))
+
+    return result
+
+
+def _get_day_requests(rnd: random.Random, day: date,
+                      employees: List[_EmployeeInfo]) -> List[tuple]:
+    """entry/exit pairs of employees: arrival near timesheet start, sometimes late,
+    lunch break, departure near timesheet end, sometimes forgotten"""
+    is_workday = day.weekday() < 5
+    result = []
+    for employee in employees:
+        if rnd.random() < (0.92 if is_workday else 0.04):
+            device = rnd.choice(employee.devices)
+            arrival = employee.start + timedelta(minutes=int(rnd.gauss(-10, 12)))
+            if rnd.random() < 0.08:
+                arrival += timedelta(minutes=rnd.randint(10, 90))
+            departure = employee.end + timedelta(minutes=int(rnd.gauss(10, 25)))
+
+            result.extend(_get_passage(rnd, day, arrival, employee.employee_id, device))
+            if rnd.random() < 0.3:
+                lunch = timedelta(hours=12, minutes=rnd.randint(0, 90))
+                result.extend(_get_passage(rnd, day, lunch, employee.employee_id,
+                                           rnd.choice(employee.devices)))
+                result.extend(_get_passage(
+                    rnd, day, lunch + timedelta(minutes=rnd.randint(20, 60)),
+                    employee.employee_id, rnd.choice(employee.devices)))
+            if rnd.random() > 0.03:
+                result.extend(_get_passage(rnd, day, departure, employee.employee_id, device))
+
+    result.sort(key=lambda values: values[0])
+
+    return result
+
+
+def _insert_requests(rows: List[tuple]) -> None:
+    """raw insert: ORM would override moment by auto_now_add and is slow for millions of rows"""
+    fields = [EmployeeRequest._meta.get_field(name) for name in _REQUEST_FIELDS]
+    quote_name = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        quote_name(EmployeeRequest._meta.db_table),
+        ', '.join(quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)))
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [(connection.ops.adapt_datetimefield_value(row[0]),) + row[1:]
+                                 for row in rows])
+
+
+def generate(params: DatasetParams,
+             on_progress: Optional[Callable[[int], None]] = None) -> int:
+    """fill empty database, return count of generated requests"""
+    if Organization.objects.exists() or EmployeeRequest.objects.exists():
+        raise ValueError('Database is not empty')
+    if (params.organizations < 1) or (params.employees < 1):
+        raise ValueError('Dataset needs organizations and employees')
+
+    rnd = random.Random(params.seed)
+    with transaction.atomic():
+        employees = _create_entities(rnd, params)
+
+    generated = 0
+    day = params.start
+    batch = []
+    while generated < params.requests_count:
+        day_requests = _get_day_requests(rnd, day, employees)
+        day_requests = day_requests[:params.requests_count - generated]
+        batch.extend(day_requests)
+        generated += len(day_requests)
+        day += timedelta(days=1)
+
+        if (len(batch) >= _INSERT_BATCH_SIZE) or (generated >= params.requests_count):
+            with transaction.atomic():
+                _insert_requests(batch)
+            batch = []
+            if on_progress is not None:
+                on_progress(generated)
+
+    return generated
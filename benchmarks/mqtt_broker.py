@@ -0,0 +1,250 @@
+"""local stand-in of MQTT broker and scripted biometry device for load tests of mqtt_utils
+
+broker implements MQTT 3.1.1 subset used by paho clients of mqtt_utils: connect,
+subscribe (with + and # wildcards), unsubscribe, publish with QoS 0 and 1, ping and
+disconnect; all messages are delivered with QoS 0, sessions are not kept"""
+import asyncio
+import random
+import struct
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from idenick_rest_api_v0.classes.utils import mqtt_utils
+
+_CONNECT = 1
+_PUBLISH = 3
+_SUBSCRIBE = 8
+_UNSUBSCRIBE = 10
+_PINGREQ = 12
+_DISCONNECT = 14
+
+
+def _encode_length(length: int) -> bytes:
+    result = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        result.append(byte | (0x80 if length else 0))
+        if not length:
+            break
+
+    return bytes(result)
+
+
+def _get_packet(packet_type: int, body: bytes, flags: int = 0) -> bytes:
+    return bytes([(packet_type << 4) | flags]) + _encode_length(len(body)) + body
+
+
+def _get_publish_packet(topic: str, payload: bytes) -> bytes:
+    topic_bytes = topic.encode('utf-8')
+    return _get_packet(_PUBLISH, struct.pack('!H', len(topic_bytes)) + topic_bytes + payload)
+
+
+def _read_string(body: bytes, position: int) -> Tuple[str, int]:
+    length = struct.unpack_from('!H', body, position)[0]
+    position += 2
+    return body[position:position + length].decode('utf-8'), position + length
+
+
+def is_topic_matched(topic_filter: str, topic: str) -> bool:
+    """topic matches filter with + and # wildcards"""
+    filter_levels = topic_filter.split('/')
+    topic_levels = topic.split('/')
+
+    result = True
+    for index, level in enumerate(filter_levels):
+        if level == '#':
+            break
+        if (index >= len(topic_levels)) or ((level != '+') and (level != topic_levels[index])):
+            result = False
+            break
+    else:
+        result = len(filter_levels) == len(topic_levels)
+
+    return result
+
+
+class Broker:
+    """broker in asyncio loop of background thread; listeners get published messages
+    of topics with prefix and can publish replies by publish()"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.host = host
+        self.port = port
+        self.loop = asyncio.new_event_loop()
+        self._subscriptions: Dict[asyncio.StreamWriter, Set[str]] = {}
+        self._listeners: List[Tuple[str, Callable[[str, bytes], None]]] = []
+        self._server = None
+        self._started = threading.Event()
+        self.published = 0
+        self.delivered = 0
+
+    def add_listener(self, topic_prefix: str, listener: Callable[[str, bytes], None]) -> None:
+        """listener(topic, payload) is called in loop of broker"""
+        self._listeners.append((topic_prefix, listener))
+
+    def start(self) -> 'Broker':
+        """start broker thread, port 0 is replaced by bound port"""
+        threading.Thread(target=self._run, name='mqtt-broker', daemon=True).start()
+        self._started.wait()
+
+        return self
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self._server = self.loop.run_until_complete(
+            asyncio.start_server(self._handle_client, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._started.set()
+        self.loop.run_forever()
+
+    def publish(self, topic: str, payload: bytes) -> None:
+        """deliver message to subscribers and listeners; must be called in loop of broker"""
+        self.published += 1
+        packet = None
+        for writer, topic_filters in self._subscriptions.items():
+            if any(is_topic_matched(topic_filter, topic) for topic_filter in topic_filters):
+                if packet is None:
+                    packet = _get_publish_packet(topic, payload)
+                writer.write(packet)
+                self.delivered += 1
+
+        for topic_prefix, listener in self._listeners:
+            if topic.startswith(topic_prefix):
+                listener(topic, payload)
+
+    async def _read_packet(self, reader: asyncio.StreamReader) -> Tuple[int, int, bytes]:
+        header = (await reader.readexactly(1))[0]
+        length = 0
+        multiplier = 1
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7f) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+
+        return header >> 4, header & 0x0f, await reader.readexactly(length)
+
+    def _handle_packet(self, writer: asyncio.StreamWriter, packet_type: int, flags: int,
+                       body: bytes) -> bool:
+        """handle packet of client, return False if connection must be closed"""
+        result = True
+        if packet_type == _CONNECT:
+            writer.write(_get_packet(2, b'\x00\x00'))
+        elif packet_type == _PUBLISH:
+            topic, position = _read_string(body, 0)
+            qos = (flags >> 1) & 0x03
+            if qos > 0:
+                # PUBACK, QoS 2 is answered as QoS 1
+                writer.write(_get_packet(4, body[position:position + 2]))
+                position += 2
+            self.publish(topic, body[position:])
+        elif packet_type == _SUBSCRIBE:
+            position = 2
+            granted = bytearray()
+            while position < len(body):
+                topic_filter, position = _read_string(body, position)
+                position += 1
+                self._subscriptions.setdefault(writer, set()).add(topic_filter)
+                granted.append(0)
+            writer.write(_get_packet(9, body[:2] + bytes(granted)))
+        elif packet_type == _UNSUBSCRIBE:
+            position = 2
+            while position < len(body):
+                topic_filter, position = _read_string(body, position)
+                self._subscriptions.get(writer, set()).discard(topic_filter)
+            writer.write(_get_packet(11, body[:2]))
+        elif packet_type == _PINGREQ:
+            writer.write(_get_packet(13, b''))
+        elif packet_type == _DISCONNECT:
+            result = False
+
+        return result
+
+    async def _handle_client(self, reader: asyncio.StreamReader,
+                             writer: asyncio.StreamWriter) -> None:
+        try:
+            connected = True
+            while connected:
+                packet_type, flags, body = await self._read_packet(reader)
+                connected = self._handle_packet(writer, packet_type, flags, body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._subscriptions.pop(writer, None)
+            writer.close()
+
+
+@dataclass
+class DeviceScript:
+    """behaviour of simulated device: reply delay, seconds, and shares of replies;
+    rest of searches are answered with !SEARCH_OK, rest of enrollments with !ENROLL_OK"""
+
+    def __init__(self, delay: float = 0.05, jitter: float = 0.0, drop: float = 0.0,
+                 not_found: float = 0.0, duplicate: float = 0.0, low_quality: float = 0.0,
+                 employee_id: int = 1, seed: Optional[int] = None):
+        self.delay = delay
+        self.jitter = jitter
+        self.drop = drop
+        self.not_found = not_found
+        self.duplicate = duplicate
+        self.low_quality = low_quality
+        self.employee_id = employee_id
+        self.seed = seed
+
+
+class DeviceSimulator:
+    """answers commands published to /BIOID/CLIENT/<id> on /BIOID/CLOUD/<id> by script;
+    search that is not found and dropped command are not answered"""
+
+    def __init__(self, broker: Broker, script: DeviceScript):
+        self.broker = broker
+        self.script = script
+        self.replies: Dict[str, int] = {}
+        self._random = random.Random(script.seed)
+        broker.add_listener(mqtt_utils.PUBLISH_TOPIC_THREAD, self._handle_command)
+
+    def _get_reply(self, command: bytes) -> Tuple[str, Optional[str]]:
+        """type of reply and reply, None if command is not answered"""
+        header = command.split(b'\r\n', 1)[0].decode('utf-8', 'replace')
+        # share of command is chosen by one random value
+        value = self._random.random()
+        script = self.script
+
+        result = ('unknown', None)
+        if value < script.drop:
+            result = ('dropped', None)
+        elif header.startswith('!FACE_SEARCH,'):
+            if value < script.drop + script.not_found:
+                result = ('not_found', None)
+            else:
+                result = ('!SEARCH_OK', '!SEARCH_OK,0,Search,Found,Employee,%d'
+                          % script.employee_id)
+        elif header.startswith(('!ENROLL,', '!FACE_ENROLL,', '!IDENROLL,')):
+            value -= script.drop
+            if value < script.duplicate:
+                result = ('!DUPLICATE', '!DUPLICATE,0,Duplicate,Found,Employee,%d'
+                          % script.employee_id)
+            elif value < script.duplicate + script.low_quality:
+                result = ('!LOWTQ', '!LOWTQ,0')
+            else:
+                result = ('!ENROLL_OK', '!ENROLL_OK,0,%s,0' % ','.join(header.split(',')[2:5]))
+
+        return result
+
+    def _handle_command(self, topic: str, payload: bytes) -> None:
+        reply_type, reply = self._get_reply(payload)
+        self.replies.update({reply_type: self.replies.get(reply_type, 0) + 1})
+        if reply is not None:
+            delay = max(self.script.delay + self._random.uniform(-self.script.jitter,
+                                                                 self.script.jitter), 0)
+            reply_topic = mqtt_utils.SUBSCRIBE_TOPIC_THREAD + \
+                topic[len(mqtt_utils.PUBLISH_TOPIC_THREAD):]
+            self.broker.loop.call_later(delay, self.broker.publish, reply_topic,
+                                        (reply + '\r\n').encode('utf-8'))
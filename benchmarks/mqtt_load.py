@@ -0,0 +1,160 @@
+"""load driver of biometry commands: latency histogram and throughput of check_biometry
+and registrate_biometry at given concurrency"""
+import base64
+import contextlib
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from idenick_app.models import Employee
+from idenick_rest_api_v0.classes.utils import mqtt_utils
+
+SEARCH = 'search'
+ENROLL = 'enroll'
+OPERATIONS = (SEARCH, ENROLL,)
+# upper bounds of histogram buckets, ms
+HISTOGRAM_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 80000)
+_TEMPLATE = bytes(range(256)) * 4
+
+
+@dataclass
+class LoadResult:
+    """latencies, seconds, and outcomes of calls"""
+
+    def __init__(self, operation: str, concurrency: int, duration: float,
+                 latencies: List[float], outcomes: Dict[str, int],
+                 stats: mqtt_utils.GatewayStats):
+        latencies = sorted(latencies)
+        self.operation = operation
+        self.requests = len(latencies)
+        self.concurrency = concurrency
+        self.duration = duration
+        self.throughput = self.requests / duration if duration else None
+        self.latencies = latencies
+        self.outcomes = outcomes
+        self.stats = stats
+
+    def get_percentile(self, percent: float) -> Optional[float]:
+        result = None
+        if self.latencies:
+            result = self.latencies[min(int(len(self.latencies) * percent / 100),
+                                        len(self.latencies) - 1)]
+
+        return result
+
+
+def get_histogram(latencies: List[float]) -> List[Tuple[Optional[int], int]]:
+    """counts of latencies by buckets of HISTOGRAM_BOUNDS, None bound is for rest"""
+    counts = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+    for latency in latencies:
+        milliseconds = latency * 1000
+        index = 0
+        while (index < len(HISTOGRAM_BOUNDS)) and (milliseconds > HISTOGRAM_BOUNDS[index]):
+            index += 1
+        counts[index] += 1
+
+    return list(zip(list(HISTOGRAM_BOUNDS) + [None], counts))
+
+
+def _search(timeout: float) -> str:
+    result = mqtt_utils.check_biometry(_TEMPLATE, timeout)
+
+    outcome = None
+    if result is None:
+        outcome = 'not connected'
+    elif result.exists:
+        outcome = 'found'
+    else:
+        outcome = 'not found'
+
+    return outcome
+
+
+def _enroll(employee: Employee, mqtt_id: str, timeout: float) -> str:
+    result = mqtt_utils.registrate_biometry(
+        employee, mqtt_id, base64.b64encode(_TEMPLATE).decode('ascii'),
+        mqtt_utils.BiometryType.FINGER, timeout)
+
+    return result.comment.split(',')[0] if result.comment.startswith('!') else result.comment
+
+
+def _get_employees(count: int) -> List[Employee]:
+    """employees of database, unsaved employees if there are not enough of them"""
+    result = list(Employee.objects.order_by('id')[:count])
+    for index in range(len(result), count):
+        result.append(Employee(last_name='Load', first_name='Test', patronymic=str(index)))
+
+    return result
+
+
+def run(operation: str, requests: int, concurrency: int, timeout: float,
+        devices: int = 1) -> LoadResult:
+    """call operation requests times by concurrency threads; enrollments are spread over
+    devices; prints of mqtt_utils are suppressed"""
+    employees = _get_employees(min(requests, 100)) if operation == ENROLL else []
+
+    def call(index: int) -> Tuple[float, str]:
+        started = time.perf_counter()
+        if operation == SEARCH:
+            outcome = _search(timeout)
+        else:
+            outcome = _enroll(employees[index % len(employees)],
+                              'load%d' % (index % devices), timeout)
+
+        return time.perf_counter() - started, outcome
+
+    latencies = []
+    outcomes = {}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        # connection of gateway is not measured
+        mqtt_utils.connect()
+
+        stats_before = mqtt_utils.get_stats()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            for latency, outcome in executor.map(call, range(requests)):
+                latencies.append(latency)
+                outcomes.update({outcome: outcomes.get(outcome, 0) + 1})
+        duration = time.perf_counter() - started
+
+    # commands of run only
+    stats = mqtt_utils.get_stats()
+    for name, value in vars(stats_before).items():
+        setattr(stats, name, getattr(stats, name) - value)
+
+    return LoadResult(operation, concurrency, duration, latencies, outcomes, stats)
+
+
+def get_report(result: LoadResult) -> List[str]:
+    """lines of summary, percentiles and histogram"""
+    lines = ['%s: %d calls, concurrency %d, %.2f s, %.1f calls/s' % (
+        result.operation, result.requests, result.concurrency, result.duration,
+        result.throughput or 0)]
+    lines.append('outcomes: ' + ', '.join(
+        '%s %d' % (name, count) for name, count in sorted(result.outcomes.items())))
+    if result.latencies:
+        lines.append('latency, ms: mean %.1f, p50 %.1f, p95 %.1f, p99 %.1f, max %.1f' % (
+            statistics.mean(result.latencies) * 1000, result.get_percentile(50) * 1000,
+            result.get_percentile(95) * 1000, result.get_percentile(99) * 1000,
+            result.latencies[-1] * 1000))
+
+    stats = result.stats
+    if stats.commands:
+        lines.append('gateway: %d commands, %d replied, %d expired, %d subscriptions, '
+                     'wait %.1f ms, %.1f loop iterations per command' % (
+                         stats.commands, stats.replies, stats.expired, stats.subscriptions,
+                         stats.wait / stats.commands * 1000,
+                         stats.iterations / stats.commands))
+
+    histogram = get_histogram(result.latencies)
+    widest = max([count for _, count in histogram] + [1])
+    for bound, count in histogram:
+        if count:
+            lines.append('%10s %8d %s' % (
+                '> %d' % HISTOGRAM_BOUNDS[-1] if bound is None else '<= %d' % bound,
+                count, '#' * max(round(40 * count / widest), 1)))
+
+    return lines
@@ -0,0 +1,135 @@
+"""run benchmark scenarios and keep results"""
+import json
+import os
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from django.core.cache import cache
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+
+from benchmarks.scenarios import Scenario
+from idenick_app.models import Employee, EmployeeRequest, Organization
+from idenick_rest_api_v0.classes.utils import report_cache_utils
+
+DEFAULT_RESULTS_FILE = os.path.join(os.path.dirname(__file__), 'results.jsonl')
+
+
+def _get_commit() -> Optional[str]:
+    """current commit, with '+' for uncommitted changes"""
+    result = None
+    try:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        changes = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                 cwd=root, capture_output=True, text=True,
+                                 check=True).stdout.strip()
+        if changes:
+            result += '+'
+    except (OSError, subprocess.CalledProcessError):
+        pass
+
+    return result
+
+
+def get_dataset_info() -> Dict[str, int]:
+    return {'organizations': Organization.objects.count(),
+            'employees': Employee.objects.count(),
+            'requests': EmployeeRequest.objects.count()}
+
+
+def measure(scenario: Scenario, repeat: int) -> dict:
+    """wall time and query count of cold runs (caches are cleared before each run),
+    peak memory of traced python allocations in separate run"""
+    times = []
+    queries = None
+    for _ in range(repeat):
+        cache.clear()
+        report_cache_utils.clear()
+        reset_queries()
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            scenario.run()
+            times.append(time.perf_counter() - started)
+        queries = len(context.captured_queries)
+
+    cache.clear()
+    report_cache_utils.clear()
+    tracemalloc.start()
+    try:
+        scenario.run()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'scenario': scenario.name,
+            'repeat': repeat,
+            'wall_time_min': round(min(times), 4),
+            'wall_time_median': round(statistics.median(times), 4),
+            'queries': queries,
+            'max_queries': scenario.max_queries,
+            'peak_memory': peak_memory}
+
+
+def run(scenarios: List[Scenario], repeat: int, results_file: str,
+        on_result=None) -> List[dict]:
+    """measure scenarios and append results to file as json lines"""
+    common = {'created': datetime.now().isoformat(timespec='seconds'),
+              'commit': _get_commit(),
+              'database': connection.vendor,
+              'dataset': get_dataset_info()}
+
+    results = []
+    for scenario in scenarios:
+        result = dict(common, **measure(scenario, repeat))
+        results.append(result)
+        with open(results_file, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(result) + '\n')
+        if on_result is not None:
+            on_result(result)
+
+    return results
+
+
+def get_exceeded_budgets(results: List[dict]) -> List[dict]:
+    """results with more queries than query budget of scenario"""
+    return [result for result in results
+            if (result.get('max_queries') is not None)
+            and (result['queries'] > result['max_queries'])]
+
+
+def load_results(results_file: str) -> List[dict]:
+    result = []
+    if os.path.exists(results_file):
+        with open(results_file, encoding='utf-8') as file:
+            result = [json.loads(line) for line in file if line.strip()]
+
+    return result
+
+
+def compare(results: List[dict]) -> List[dict]:
+    """last two runs of every scenario on same database and dataset"""
+    runs = {}
+    for result in results:
+        key = (result['database'], json.dumps(result['dataset'], sort_keys=True),
+               result['scenario'])
+        runs.setdefault(key, []).append(result)
+
+    comparison = []
+    for key in sorted(runs):
+        previous = runs[key][-2] if len(runs[key]) > 1 else None
+        last = runs[key][-1]
+        info = {'database': key[0], 'requests': last['dataset']['requests'],
+                'scenario': key[2], 'last': last, 'previous': previous}
+        if previous is not None:
+            for name in ('wall_time_median', 'queries', 'peak_memory'):
+                info.update({name + '_change': None if not previous[name]
+                             else round(last[name] / previous[name] - 1, 3)})
+        comparison.append(info)
+
+    return comparison
@@ -0,0 +1,163 @@
+"""benchmark scenarios: report and list endpoints called through views"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from django.contrib.auth.models import User
+from django.db.models import Max, Min
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from benchmarks import generator
+from idenick_app.classes.utils import attendance_utils
+from idenick_app.models import EmployeeRequest, Login
+from idenick_rest_api_v0 import views
+from idenick_rest_api_v0.classes.utils import report_utils
+
+
+@dataclass
+class Scenario:
+    """named call of endpoint; max_queries is query budget checked by run command"""
+
+    def __init__(self, name: str, run: Callable[[], None], description: str,
+                 max_queries: Optional[int] = None):
+        self.name = name
+        self.run = run
+        self.description = description
+        self.max_queries = max_queries
+
+
+def _get_user(username: str) -> User:
+    return User.objects.get(username=username)
+
+
+def _call(view, username: str, params: dict) -> None:
+    """call view and read whole response"""
+    request = APIRequestFactory().get('/', params)
+    force_authenticate(request, user=_get_user(username))
+    response = view(request)
+    if hasattr(response, 'render'):
+        response.render()
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    else:
+        len(response.content)
+    response.close()
+
+
+def _call_report_info(username: str, params: dict) -> None:
+    request = APIRequestFactory().get('/', params)
+    request.user = _get_user(username)
+    list(report_utils._get_report_info(request).lines)
+
+
+def _get_period() -> Dict[str, str]:
+    """last full month of data as report params"""
+    bounds = EmployeeRequest.objects.aggregate(first=Min('moment'), last=Max('moment'))
+    last: datetime = bounds['last']
+    month_end = last.date().replace(day=1) - timedelta(days=1)
+    if month_end < bounds['first'].date():
+        month_end = last.date()
+    month_start = month_end.replace(day=1)
+
+    return {'start': month_start.strftime('%Y%m%d'), 'end': month_end.strftime('%Y%m%d')}
+
+
+def _get_day() -> Dict[str, str]:
+    last = EmployeeRequest.objects.aggregate(last=Max('moment'))['last'].date()
+    value = last.strftime('%Y%m%d')
+
+    return {'start': value, 'end': value}
+
+
+def _get_year() -> Dict[str, str]:
+    last = EmployeeRequest.objects.aggregate(last=Max('moment'))['last'].date()
+
+    return {'start': (last - timedelta(days=364)).strftime('%Y%m%d'),
+            'end': last.strftime('%Y%m%d')}
+
+
+def get_scenarios() -> List[Scenario]:
+    """scenarios for generated dataset"""
+    admin = generator.ADMIN_USERNAME
+    controller = generator.CONTROLLER_USERNAME
+    organization_id = Login.objects.get(
+        user__username=controller).organization_id
+    month = _get_period()
+    day = _get_day()
+    year = _get_year()
+    # analytics are measured on built daily attendance summary
+    attendance_utils.update_daily_attendance()
+
+    organization_report = dict(type='ORGANIZATION', id=organization_id, **month)
+    first_page = {'from': 0, 'perPage': 50}
+    deep_page = {'from': 200, 'perPage': 50}
+    # requests list does not depend on page size, so pages share the budget
+    requests_queries_budget = 12
+    full_report = {'from': 0, 'perPage': 1000000}
+
+    employees_list = views.EmployeeViewSet.as_view({'get': 'list'})
+    devices_list = views.DeviceViewSet.as_view({'get': 'list'})
+
+    return [
+        Scenario('report_info_month_page',
+                 lambda: _call_report_info(controller, dict(organization_report, **first_page)),
+                 'report lines of first page for month of organization'),
+        Scenario('report_info_year_deep_page',
+                 lambda: _call_report_info(controller, dict(
+                     organization_report, **year, **deep_page)),
+                 'report lines of page 200 for year of organization'),
+        Scenario('report_info_year_full',
+                 lambda: _call_report_info(controller, dict(
+                     organization_report, **year, **full_report)),
+                 'all report lines for year of organization'),
+        Scenario('report_info_day_full',
+                 lambda: _call_report_info(controller, dict(
+                     organization_report, **day, **full_report)),
+                 'all report lines for day of organization'),
+        Scenario('report_json_month_page',
+                 lambda: _call(views.get_report, controller,
+                               dict(organization_report, **first_page)),
+                 'report endpoint, first page for month'),
+        Scenario('report_file_month',
+                 lambda: _call(views.get_report_file, controller,
+                               dict(organization_report, **full_report)),
+                 'xlsx report of month'),
+        Scenario('report_file_month_stream',
+                 lambda: _call(views.get_report_file, controller,
+                               dict(organization_report, stream='', **full_report)),
+                 'streaming xlsx report of month'),
+        Scenario('report_file_month_split',
+                 lambda: _call(views.get_report_file, controller,
+                               dict(organization_report, split='department', stream='')),
+                 'streaming xlsx report of month, sheet of every department'),
+        Scenario('employees_requests_first_page',
+                 lambda: _call(views.get_employees_requests, admin,
+                               dict(type='ALL', **first_page)),
+                 'first page of all requests with exact count', requests_queries_budget),
+        Scenario('employees_requests_large_page',
+                 lambda: _call(views.get_employees_requests, admin,
+                               dict(type='ALL', showdevice='', **{'from': 0, 'perPage': 1000})),
+                 'first page of 1000 requests with devices', requests_queries_budget),
+        Scenario('employees_requests_deep_page',
+                 lambda: _call(views.get_employees_requests, admin,
+                               dict(type='ALL', **{'from': 1000, 'perPage': 50})),
+                 'page 1000 of all requests with exact count', requests_queries_budget),
+        Scenario('employees_requests_cursor',
+                 lambda: _call(views.get_employees_requests, admin,
+                               dict(type='ALL', cursor='', perPage=50)),
+                 'first cursor page of all requests', requests_queries_budget),
+        Scenario('employees_requests_csv_month',
+                 lambda: _call(views.get_employees_requests, controller,
+                               dict(type='ALL', format='csv', **month)),
+                 'csv export of organization requests for month'),
+        Scenario('attendance_analytics_year',
+                 lambda: _call(views.get_attendance_analytics, controller, year),
+                 'lateness and presence analytics of organization for year'),
+        Scenario('employees_list',
+                 lambda: _call(employees_list, admin, {'page': 0, 'perPage': 50}),
+                 'first page of employees list'),
+        Scenario('devices_list',
+                 lambda: _call(devices_list, admin, {'page': 0, 'perPage': 50}),
+                 'first page of devices list'),
+    ]
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class IdenickAppConfig(AppConfig):
     name = 'idenick_app'
+
+    def ready(self):
+        # register receivers of devices changes
+        from idenick_app.classes.utils import querylog_utils
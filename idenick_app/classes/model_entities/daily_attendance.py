@@ -0,0 +1,51 @@
+"""daily attendance summary models"""
+import json
+from typing import List
+
+from django.db import models
+
+
+class DailyAttendance(models.Model):
+    """Summary of employee requests in organization by local date.
+    Maintained by attendance utils from querylog, do not edit manually"""
+    id = models.AutoField(primary_key=True, db_index=True,)
+    organization = models.ForeignKey(
+        'Organization', db_column='companyid', related_name='daily_attendances',
+        on_delete=models.CASCADE,)
+    employee = models.ForeignKey(
+        'Employee', db_column='usersid', related_name='daily_attendances',
+        on_delete=models.CASCADE,)
+    date = models.DateField(db_index=True,)
+    # json list of [incoming id, incoming moment, outcoming id, outcoming moment];
+    # moments are UTC in iso format, outcoming values are null for last unpaired request
+    pairs = models.TextField(default='[]',)
+    first_in = models.DateTimeField()
+    last_out = models.DateTimeField(null=True, blank=True,)
+    is_later = models.BooleanField(default=False,)
+    requests_count = models.IntegerField(default=0,)
+    # minutes of day of first_in and last_out, sum of durations of pairs for analytics
+    first_in_minute = models.SmallIntegerField(default=0,)
+    last_out_minute = models.SmallIntegerField(null=True, blank=True,)
+    presence_minutes = models.IntegerField(default=0,)
+
+    def get_pairs(self) -> List[list]:
+        return json.loads(self.pairs)
+
+    def __str__(self):
+        return ('id[%s] [%s] in [%s] at [%s] from [%s] to [%s]'
+                % (self.id, self.employee_id, self.organization_id, self.date,
+                   self.first_in, self.last_out))
+
+    class Meta:
+        unique_together = (('organization', 'employee', 'date'),)
+        index_together = (('organization', 'date'),)
+
+
+class SummaryWatermark(models.Model):
+    """Last processed querylog id of summary"""
+    id = models.AutoField(primary_key=True, db_index=True,)
+    name = models.CharField(max_length=64, unique=True,)
+    last_request_id = models.IntegerField(default=0,)
+
+    def __str__(self):
+        return 'id[%s] [%s] at [%s]' % (self.id, self.name, self.last_request_id)
@@ -4,6 +4,7 @@ import uuid
 from typing import List, Optional
 
 from django.db import models
+from django.db.models import Exists, OuterRef
 
 from idenick_app.classes.constants.identification import algorithm_constants
 from idenick_app.classes.model_entities.abstract_entries import AbstractEntry
@@ -14,7 +15,31 @@ from idenick_app.classes.model_entities.relations.employee2department import \
     Employee2Department
 from idenick_app.classes.model_entities.relations.employee2organization import \
     Employee2Organization
-from idenick_app.classes.utils.models_utils import get_related_entities_count
+from idenick_app.classes.utils.models_utils import (
+    get_related_entities_count, get_related_entities_count_expression)
+
+_FINGER_ALGORITHMS = [algorithm_constants.FINGER_ALGORITHM_1,
+                      algorithm_constants.FINGER_ALGORITHM_2,
+                      algorithm_constants.FINGER_ALGORITHM_3]
+
+
+class EmployeeQuerySet(models.QuerySet):
+    """Employees queryset"""
+
+    def with_serialized_info(self):
+        """annotate organizations count and existence of identification templates,
+        so serialization of employees does not query them per employee"""
+        def template_exists(algorithm_types: List[int]):
+            return Exists(IndentificationTepmplate.objects.filter(
+                employee_id=OuterRef('pk'), dropped_at=None, algorithm_type__in=algorithm_types))
+
+        return self.annotate(
+            active_organizations_count=get_related_entities_count_expression(
+                Employee2Organization, 'employee', 'organization'),
+            card_exists=template_exists([algorithm_constants.CARD_ALGORITHM]),
+            photo_exists=template_exists([algorithm_constants.EMPLOYEE_AVATAR]),
+            finger_exists=template_exists(_FINGER_ALGORITHMS),
+            face_exists=template_exists([algorithm_constants.FACE_ALGORITHM]))
 
 
 class Employee(AbstractEntry):
@@ -27,6 +52,8 @@ class Employee(AbstractEntry):
         db_column='firstname', max_length=64, db_index=True,)
     patronymic = models.CharField(max_length=64, db_index=True,)
 
+    objects = EmployeeQuerySet.as_manager()
+
     def __str__(self):
         return self._str() + self.full_name
 
@@ -59,14 +86,14 @@ class Employee(AbstractEntry):
     @property
     def has_card(self) -> bool:
         """return true if employee has active card identification"""
-        return self._has_identification_template(
-            one_type=algorithm_constants.CARD_ALGORITHM)
+        return self.card_exists if hasattr(self, 'card_exists') \
+            else self._has_identification_template(one_type=algorithm_constants.CARD_ALGORITHM)
 
     @property
     def has_photo(self) -> bool:
         """return true if employee has active photo avatar"""
-        return self._has_identification_template(
-            one_type=algorithm_constants.EMPLOYEE_AVATAR)
+        return self.photo_exists if hasattr(self, 'photo_exists') \
+            else self._has_identification_template(one_type=algorithm_constants.EMPLOYEE_AVATAR)
 
     @property
     def photo(self) -> str:
@@ -78,8 +105,9 @@ class Employee(AbstractEntry):
 
     @property
     def organizations_count(self) -> int:
-        return get_related_entities_count(Employee2Organization, {'employee_id': self.id},
-                                          Organization, 'organization')
+        return self.active_organizations_count if hasattr(self, 'active_organizations_count') \
+            else get_related_entities_count(Employee2Organization, {'employee_id': self.id},
+                                            Organization, 'organization')
 
     def get_departments_count(self,
                               organization: Optional[Organization] = None,
@@ -143,15 +171,14 @@ class Employee(AbstractEntry):
     @property
     def has_finger(self) -> bool:
         """return true if employee has active finger identification"""
-        return self._has_identification_template(
-            many_types=[algorithm_constants.FINGER_ALGORITHM_1,
-                        algorithm_constants.FINGER_ALGORITHM_2,
-                        algorithm_constants.FINGER_ALGORITHM_3])
+        return self.finger_exists if hasattr(self, 'finger_exists') \
+            else self._has_identification_template(many_types=_FINGER_ALGORITHMS)
 
     @property
     def has_face(self) -> bool:
         """return true if employee has active face identification"""
-        return self._has_identification_template(one_type=algorithm_constants.FACE_ALGORITHM)
+        return self.face_exists if hasattr(self, 'face_exists') \
+            else self._has_identification_template(one_type=algorithm_constants.FACE_ALGORITHM)
 
     class Meta:
         db_table = 'users'
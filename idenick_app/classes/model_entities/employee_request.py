@@ -4,6 +4,8 @@ import datetime
 from typing import Optional
 
 from django.db import models
+from django.db.models import ExpressionWrapper, F, Value
+from django.db.models.functions import Coalesce
 
 from idenick_app.classes.constants.identification import (algorithm_constants,
                                                           request_constants,
@@ -12,6 +14,19 @@ from idenick_app.classes.utils import date_utils
 from idenick_app.classes.utils.models_utils import DELETED_STATUS
 
 
+class EmployeeRequestQuerySet(models.QuerySet):
+    """Employee requests queryset"""
+
+    def with_local_moment(self):
+        """annotate device_timezone and local_moment (moment in device timezone)
+        computed by database, so date info of requests does not load devices"""
+        return self.annotate(
+            device_timezone=F('device__timezone'),
+            local_moment=ExpressionWrapper(
+                F('moment') + Coalesce(F('device__timezone'), Value(datetime.timedelta())),
+                output_field=models.DateTimeField()))
+
+
 class EmployeeRequest(models.Model):
     """Employee request model. READ ONLY"""
     id = models.AutoField(editable=False, primary_key=True, db_index=True,)
@@ -26,10 +41,17 @@ class EmployeeRequest(models.Model):
     algorithm_type = models.IntegerField(
         editable=False, db_column='algorithm', choices=algorithm_constants.ALGORITHM_TYPE,)
     employee = models.ForeignKey(
-        'Employee', db_column='usersid', on_delete=models.CASCADE, null=True, db_index=True,)
+        'Employee', db_column='usersid', on_delete=models.CASCADE, null=True, db_index=True,
+        db_constraint=False,)
     device = models.ForeignKey(
-        'Device', db_column='devicesid', on_delete=models.CASCADE, null=True, db_index=True,)
+        'Device', db_column='devicesid', on_delete=models.CASCADE, null=True, db_index=True,
+        db_constraint=False,)
     templatesid = models.IntegerField(editable=False, null=True)
+    # moment in device timezone, filled by database triggers, see migration 0031
+    local_date = models.DateField(editable=False, null=True)
+    local_minute = models.SmallIntegerField(editable=False, null=True)
+
+    objects = EmployeeRequestQuerySet.as_manager()
 
     @property
     def checkpoint_name(self):
@@ -49,11 +71,14 @@ class EmployeeRequest(models.Model):
         return result
 
     def get_date_info(self) -> date_utils.DateInfo:
-        utc = None
-        if (self.device is not None) and (self.device.timezone is not None):
-            utc = date_utils.duration_to_str(self.device.timezone)
+        result = None
+        if hasattr(self, 'local_moment'):
+            result = date_utils.get_local_date_info(self.local_moment, self.device_timezone)
+        else:
+            result = date_utils.get_date_info(
+                self.moment, None if self.device is None else self.device.timezone)
 
-        return date_utils.DateInfo(self.related_moment, utc)
+        return result
 
     @property
     def date_info(self) -> dict:
@@ -76,9 +101,13 @@ class EmployeeRequest(models.Model):
 
     @property
     def related_moment(self) -> datetime.datetime:
-        result = self.moment
-        if (self.device is not None) and (self.device.timezone is not None):
-            result = result + self.device.timezone
+        result = None
+        if hasattr(self, 'local_moment'):
+            result = self.local_moment
+        else:
+            result = self.moment
+            if (self.device is not None) and (self.device.timezone is not None):
+                result = result + self.device.timezone
 
         return result
 
@@ -88,4 +117,42 @@ class EmployeeRequest(models.Model):
                    self.response_type, self.description))
 
     class Meta:
+        # MySQL table is partitioned by month of stamp, see migration 0033;
+        # partitioned tables do not support foreign key constraints
         db_table = 'querylog'
+        indexes = [
+            models.Index(fields=['local_date', 'employee', 'device'],
+                         name='querylog_local_date_idx'),
+        ]
+
+
+class EmployeeRequestArchive(models.Model):
+    """Requests moved from querylog after archive horizon, see querylog utils. READ ONLY"""
+    id = models.IntegerField(editable=False, primary_key=True,)
+    moment = models.DateTimeField(editable=False, db_column='stamp', db_index=True,)
+    request_type = models.IntegerField(
+        editable=False, db_column='request', choices=request_constants.REQUEST_TYPE,)
+    response_type = models.IntegerField(
+        editable=False, db_column='result', choices=response_constants.RESPONSE_TYPE,)
+    description = models.CharField(
+        editable=False, max_length=500, blank=True, null=True)
+    algorithm_type = models.IntegerField(
+        editable=False, db_column='algorithm', choices=algorithm_constants.ALGORITHM_TYPE,)
+    employee = models.ForeignKey(
+        'Employee', db_column='usersid', on_delete=models.DO_NOTHING, null=True,
+        db_constraint=False, related_name='archived_requests',)
+    device = models.ForeignKey(
+        'Device', db_column='devicesid', on_delete=models.DO_NOTHING, null=True,
+        db_constraint=False, related_name='archived_requests',)
+    templatesid = models.IntegerField(editable=False, null=True)
+    local_date = models.DateField(editable=False, null=True)
+    local_minute = models.SmallIntegerField(editable=False, null=True)
+
+    def __str__(self):
+        return ('id[%s] [%s] with [%s] in [%s] do [%s] with result [%s] (%s)'
+                % (self.id, self.employee_id, self.device_id, self.moment, self.request_type,
+                   self.response_type, self.description))
+
+    class Meta:
+        db_table = 'querylog_archive'
+        index_together = (('local_date', 'employee', 'device'),)
@@ -60,6 +60,7 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    """create user info record"""
-    instance.login.save()
+def save_user_profile(sender, instance, update_fields=None, **kwargs):
+    """create user info record; login of user (last_login update) does not change it"""
+    if update_fields != frozenset(('last_login',)):
+        instance.login.save()
@@ -0,0 +1,261 @@
+"""daily attendance summary utils"""
+import json
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from django.db import transaction
+from django.db.models import Min
+
+from idenick_app.classes.utils import date_utils, querylog_utils
+from idenick_app.models import (DailyAttendance, Device, Device2Organization,
+                                Employee2Organization, EmployeeRequest,
+                                Organization, SummaryWatermark)
+
+DAILY_ATTENDANCE_WATERMARK = 'daily_attendance'
+DEFAULT_BATCH_SIZE = 10000
+
+
+def _load_day_requests(day: date, employees_ids: Set[int]) -> Dict[int, List[dict]]:
+    """requests of employees with local date equal to day, by employee, ordered by moment"""
+    requests = querylog_utils.filter_local_dates(EmployeeRequest.objects, day, day)\
+        .filter(employee_id__in=employees_ids)\
+        .exclude(device=None)\
+        .order_by('moment', 'id')\
+        .with_local_moment()\
+        .values('id', 'moment', 'employee_id', 'device_id', 'local_moment')
+
+    result = {}
+    for request in requests:
+        result.setdefault(request['employee_id'], []).append(request)
+
+    return result
+
+
+def _build_attendance(organization: Organization, employee_id: int, day: date,
+                      requests: List[dict],
+                      timesheet_start: Optional[timedelta]) -> DailyAttendance:
+    """odd requests of day are incoming, even are outcoming"""
+    pairs = []
+    last_out = None
+    presence = timedelta()
+    for i in range(0, len(requests), 2):
+        incoming = requests[i]
+        outcoming = requests[i + 1] if (i + 1) < len(requests) else None
+        pairs.append([incoming['id'], incoming['moment'].isoformat(),
+                      None if outcoming is None else outcoming['id'],
+                      None if outcoming is None else outcoming['moment'].isoformat()])
+        if outcoming is not None:
+            last_out = outcoming['local_moment']
+            presence += outcoming['moment'] - incoming['moment']
+
+    first_in = requests[0]['local_moment']
+    is_later = (timesheet_start is not None) \
+        and (timedelta(hours=first_in.hour, minutes=first_in.minute) > timesheet_start)
+
+    return DailyAttendance(organization=organization,
+                           employee_id=employee_id,
+                           date=day,
+                           pairs=json.dumps(pairs),
+                           first_in=first_in,
+                           last_out=last_out,
+                           is_later=is_later,
+                           requests_count=len(requests),
+                           first_in_minute=first_in.hour * 60 + first_in.minute,
+                           last_out_minute=None if last_out is None
+                           else last_out.hour * 60 + last_out.minute,
+                           presence_minutes=int(presence.total_seconds() // 60))
+
+
+def _iterate_attendances(keys: Set[Tuple[int, date]]) \
+        -> Iterator[Tuple[date, Set[int], Dict[Tuple[int, int], DailyAttendance]]]:
+    """(day, employees of day, attendances by (organization, employee)) of
+    (employee, local date) keys calculated from querylog"""
+    employees_by_day: Dict[date, Set[int]] = {}
+    for employee_id, day in keys:
+        employees_by_day.setdefault(day, set()).add(employee_id)
+    employees_ids = set(employee_id for employee_id, _ in keys)
+
+    employee_organizations: Dict[int, Dict[int, Optional[str]]] = {}
+    for employee_id, organization_id, timesheet_start in Employee2Organization.objects\
+            .filter(employee_id__in=employees_ids)\
+            .values_list('employee_id', 'organization_id', 'timesheet_start'):
+        employee_organizations.setdefault(employee_id, {}).update(
+            {organization_id: timesheet_start})
+
+    organizations_ids = set()
+    for organizations in employee_organizations.values():
+        organizations_ids.update(organizations)
+    organizations = Organization.objects.in_bulk(organizations_ids)
+
+    device_organizations: Dict[int, Set[int]] = {}
+    for device_id, organization_id in Device2Organization.objects\
+            .filter(organization_id__in=organizations_ids)\
+            .values_list('device_id', 'organization_id'):
+        device_organizations.setdefault(device_id, set()).add(organization_id)
+
+    for day, day_employees_ids in employees_by_day.items():
+        requests_by_employee = _load_day_requests(day, day_employees_ids)
+
+        actual = {}
+        for employee_id, requests in requests_by_employee.items():
+            for organization_id, employee_timesheet in employee_organizations\
+                    .get(employee_id, {}).items():
+                organization_requests = [
+                    r for r in requests
+                    if organization_id in device_organizations.get(r['device_id'], ())]
+                if organization_requests:
+                    organization = organizations[organization_id]
+                    timesheet_start = organization.timesheet_start_as_duration \
+                        if employee_timesheet is None \
+                        else date_utils.str_to_duration(employee_timesheet)
+                    actual.update({(organization_id, employee_id): _build_attendance(
+                        organization, employee_id, day, organization_requests,
+                        timesheet_start)})
+
+        yield day, day_employees_ids, actual
+
+
+def build_daily_attendance(keys: Set[Tuple[int, date]]) -> List[DailyAttendance]:
+    """summary of (employee, local date) keys calculated from querylog, not saved"""
+    return [attendance for _, _, actual in _iterate_attendances(keys)
+            for attendance in actual.values()]
+
+
+def rebuild_daily_attendance(keys: Set[Tuple[int, date]]) -> None:
+    """recalculate summary of (employee, local date) keys from querylog"""
+    for day, day_employees_ids, actual in _iterate_attendances(keys):
+        existing = {(a.organization_id, a.employee_id): a for a in DailyAttendance.objects
+                    .filter(date=day, employee_id__in=day_employees_ids)}
+
+        DailyAttendance.objects.filter(
+            id__in=[existing[key].id for key in existing if key not in actual]).delete()
+
+        updated = []
+        for key, attendance in actual.items():
+            if key in existing:
+                attendance.id = existing[key].id
+                updated.append(attendance)
+        DailyAttendance.objects.bulk_update(
+            updated, ['pairs', 'first_in', 'last_out', 'is_later', 'requests_count',
+                      'first_in_minute', 'last_out_minute', 'presence_minutes'])
+        DailyAttendance.objects.bulk_create(
+            [attendance for key, attendance in actual.items() if key not in existing])
+
+
+def get_watermark() -> int:
+    """id of last request processed into summary"""
+    return SummaryWatermark.objects.filter(name=DAILY_ATTENDANCE_WATERMARK)\
+        .values_list('last_request_id', flat=True).first() or 0
+
+
+def get_unprocessed_dates(queryset) -> Set[date]:
+    """local dates of requests of queryset which are not processed into summary yet;
+    summary of other dates is complete"""
+    return set(queryset.filter(id__gt=get_watermark())
+               .order_by()
+               .values_list('local_date', flat=True)
+               .distinct())
+
+
+def update_daily_attendance(batch_size: int = DEFAULT_BATCH_SIZE,
+                            max_batches: Optional[int] = None) -> int:
+    """process querylog after watermark, return count of processed requests"""
+    processed = 0
+    batches = 0
+    while (max_batches is None) or (batches < max_batches):
+        with transaction.atomic():
+            watermark, _ = SummaryWatermark.objects.select_for_update()\
+                .get_or_create(name=DAILY_ATTENDANCE_WATERMARK)
+            requests = list(EmployeeRequest.objects
+                            .filter(id__gt=watermark.last_request_id)
+                            .exclude(employee=None)
+                            .order_by('id')
+                            .values('id', 'employee_id', 'local_date')
+                            [:batch_size])
+            if not requests:
+                break
+
+            rebuild_daily_attendance(set(
+                (r['employee_id'], r['local_date']) for r in requests))
+
+            watermark.last_request_id = requests[-1]['id']
+            watermark.save()
+
+        processed += len(requests)
+        batches += 1
+
+    return processed
+
+
+def _apply_timezone_change(name: str, batch_size: int) -> int:
+    """refill local dates of requests of device by batches after watermark of change"""
+    device_id = int(name[len(querylog_utils.TIMEZONE_CHANGE_WATERMARK_PREFIX):])
+    updated = 0
+    while True:
+        with transaction.atomic():
+            watermark = SummaryWatermark.objects.select_for_update().filter(name=name).first()
+            if watermark is None:
+                break
+            device = Device.objects.filter(id=device_id).first()
+            requests = [] if device is None else list(
+                EmployeeRequest.objects
+                .filter(device_id=device_id, id__gt=watermark.last_request_id)
+                .order_by('id')
+                .values('id', 'employee_id', 'local_date')
+                [:batch_size])
+            if not requests:
+                watermark.delete()
+                break
+
+            batch = EmployeeRequest.objects.filter(device_id=device_id,
+                                                   id__gt=watermark.last_request_id,
+                                                   id__lte=requests[-1]['id'])
+            batch.update(**querylog_utils.get_local_moment_values(device.timezone))
+
+            # summary of days which requests left and of days which they moved to
+            keys = set((r['employee_id'], r['local_date']) for r in requests)
+            keys.update(batch.values_list('employee_id', 'local_date'))
+            rebuild_daily_attendance(set(key for key in keys if key[0] is not None))
+
+            watermark.last_request_id = requests[-1]['id']
+            watermark.save()
+
+        updated += len(requests)
+
+    return updated
+
+
+def apply_timezone_changes(batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """refill local dates of requests of devices with changed timezone and rebuild
+    their summary, return count of updated requests"""
+    updated = 0
+    for name in SummaryWatermark.objects\
+            .filter(name__startswith=querylog_utils.TIMEZONE_CHANGE_WATERMARK_PREFIX)\
+            .values_list('name', flat=True):
+        updated += _apply_timezone_change(name, batch_size)
+
+    if updated:
+        querylog_utils.requests_changed.send(sender=EmployeeRequest)
+
+    return updated
+
+
+def reset_daily_attendance(from_date: Optional[date] = None) -> None:
+    """remove summary from date and move watermark before requests of date"""
+    with transaction.atomic():
+        watermark, _ = SummaryWatermark.objects.select_for_update()\
+            .get_or_create(name=DAILY_ATTENDANCE_WATERMARK)
+
+        attendances = DailyAttendance.objects.all()
+        last_request_id = 0
+        if from_date is not None:
+            attendances = attendances.filter(date__gte=from_date)
+            first_request_id = querylog_utils\
+                .filter_local_dates(EmployeeRequest.objects, from_date)\
+                .aggregate(first=Min('id'))['first']
+            last_request_id = watermark.last_request_id if first_request_id is None \
+                else min(watermark.last_request_id, first_request_id - 1)
+        attendances.delete()
+
+        watermark.last_request_id = last_request_id
+        watermark.save()
@@ -1,8 +1,9 @@
 """date utils"""
 import re
 from dataclasses import dataclass
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
 
 DEFAULT_DATE_FORMAT = '%Y-%m-%d %H:%M:%S%z'
 
@@ -69,6 +70,53 @@ class DateInfo:
         self.time = time
 
 
+def get_date_info(moment: datetime, timezone: Optional[timedelta] = None) -> DateInfo:
+    """date info of moment in timezone"""
+    utc = None
+    if timezone is not None:
+        moment = moment + timezone
+        utc = duration_to_str(timezone)
+
+    return DateInfo(moment, utc)
+
+
+def get_local_date_info(local_moment: datetime,
+                        timezone: Optional[timedelta] = None) -> DateInfo:
+    """date info of moment already shifted to timezone"""
+    return DateInfo(local_moment, None if timezone is None else duration_to_str(timezone))
+
+
+@lru_cache(maxsize=1024)
+def get_day_names(day: date) -> Tuple[str, str, str]:
+    """week day, day and month names of DateInfo; cached, so names are shared"""
+    return day.strftime('%a'), day.strftime('%d.%m.%Y'), day.strftime('%B %Y')
+
+
+@lru_cache(maxsize=256)
+def get_utc_name(timezone: Optional[timedelta]) -> Optional[str]:
+    """utc name of DateInfo of timezone"""
+    utc = None if timezone is None else duration_to_str(timezone)
+    return None if utc is None else 'UTC' + utc
+
+
+def get_time_name(moment: datetime) -> str:
+    """time name of DateInfo"""
+    return '%02d:%02d' % (moment.hour, moment.minute)
+
+
+def get_local_date_info_values(local_moment: datetime,
+                               timezone: Optional[timedelta] = None) -> Dict[str, Optional[str]]:
+    """values of get_local_date_info as strings; names of days and timezones are cached"""
+    week_day, day, month = get_day_names(local_moment.date())
+
+    return {'utc': get_utc_name(timezone),
+            'date': str(local_moment),
+            'week_day': week_day,
+            'day': day,
+            'month': month,
+            'time': get_time_name(local_moment)}
+
+
 UTC = [
     '+14:00',
     '+13:45',
@@ -1,7 +1,8 @@
 """models"""
 
 from idenick_app.models import AbstractEntry
-from django.db.models import fields
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value, fields
+from django.db.models.functions import Coalesce
 
 DELETED_STATUS = 'удален'
 
@@ -16,6 +17,20 @@ def get_related_entities_count(Relation_class: AbstractEntry,
 
     return Object_class.objects.filter(id__in=ids, dropped_at=None).count()
 
+
+def get_related_entities_count_expression(Relation_class: AbstractEntry,
+                                          owner_field: str,
+                                          relation_field: str):
+    """get_related_entities_count of every owner for annotation of owners queryset"""
+    counts = Relation_class.objects\
+        .filter(**{owner_field: OuterRef('pk'), 'dropped_at': None,
+                   relation_field + '__dropped_at': None})\
+        .values(owner_field)\
+        .annotate(count=Count(relation_field, distinct=True))\
+        .values('count')
+
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
 class TinyIntegerField(fields.SmallIntegerField):
     def db_type(self, connection):
         return "tinyint"
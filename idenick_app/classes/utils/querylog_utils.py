@@ -0,0 +1,230 @@
+"""querylog utils"""
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import DateTimeField, ExpressionWrapper, F, Max, Min, Q
+from django.db.models.functions import ExtractHour, ExtractMinute, TruncDate
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from idenick_app.models import (Device, EmployeeRequest,
+                                EmployeeRequestArchive, SummaryWatermark)
+
+DEFAULT_BATCH_SIZE = 50000
+# watermark of device with changed timezone, its requests are refilled by id
+TIMEZONE_CHANGE_WATERMARK_PREFIX = 'device_timezone:'
+
+# sent after requests are updated or removed in bulk, querylog does not send model signals
+requests_changed = Signal()
+
+# local date differs from date of UTC stamp at most by one day (timezones are within 14 hours)
+_LOCAL_DATE_MARGIN = timedelta(days=1)
+_FUTURE_PARTITION = 'pfuture'
+_FIRST_COMPLETE_DATE_KEY = 'querylog:first_complete_date'
+
+
+def get_local_moment_values(timezone: Optional[timedelta]) -> dict:
+    """update values of local date and minute for requests of devices in timezone"""
+    local_moment = F('moment') if timezone is None else ExpressionWrapper(
+        F('moment') + timezone, output_field=DateTimeField())
+
+    return {'local_date': TruncDate(local_moment),
+            'local_minute': ExtractHour(local_moment) * 60 + ExtractMinute(local_moment)}
+
+
+def get_stamp_filter(from_date: Optional[date] = None, to_date: Optional[date] = None) -> Q:
+    """bounds of stamp for requests with local date in range; stamp is partition key of
+    querylog, so MySQL reads only partitions of months of range"""
+    result = Q()
+    if from_date is not None:
+        result &= Q(moment__gte=datetime.combine(from_date - _LOCAL_DATE_MARGIN,
+                                                 datetime.min.time()))
+    if to_date is not None:
+        result &= Q(moment__lt=datetime.combine(to_date + timedelta(days=1) + _LOCAL_DATE_MARGIN,
+                                                datetime.min.time()))
+
+    return result
+
+
+def filter_local_dates(queryset, from_date: Optional[date] = None,
+                       to_date: Optional[date] = None):
+    """requests of queryset with local date in range, pruned by stamp"""
+    result = queryset.filter(get_stamp_filter(from_date, to_date))
+    if from_date is not None:
+        result = result.filter(local_date__gte=from_date)
+    if to_date is not None:
+        result = result.filter(local_date__lte=to_date)
+
+    return result
+
+
+def fill_local_moments(only_empty: bool = True, device_id: Optional[int] = None,
+                       batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """set local date and minute by device timezone, return count of updated requests"""
+    requests = EmployeeRequest.objects.all()
+    if only_empty:
+        requests = requests.filter(local_date=None)
+    if device_id is not None:
+        requests = requests.filter(device_id=device_id)
+
+    devices_by_timezone: Dict[timedelta, List[int]] = {}
+    for device, timezone in Device.objects.exclude(timezone=None).values_list('id', 'timezone'):
+        devices_by_timezone.setdefault(timezone, []).append(device)
+    devices_with_timezone = [device for devices in devices_by_timezone.values()
+                             for device in devices]
+
+    bounds = requests.aggregate(first=Min('id'), last=Max('id'))
+    updated = 0
+    if bounds['first'] is not None:
+        for batch_start in range(bounds['first'], bounds['last'] + 1, batch_size):
+            batch = requests.filter(id__gte=batch_start, id__lt=batch_start + batch_size)
+            for timezone, devices in devices_by_timezone.items():
+                updated += batch.filter(device_id__in=devices)\
+                    .update(**get_local_moment_values(timezone))
+            updated += batch.exclude(device_id__in=devices_with_timezone)\
+                .update(**get_local_moment_values(None))
+
+    return updated
+
+
+def _add_months(day: date, months: int) -> date:
+    """first day of month shifted by months"""
+    month = day.year * 12 + day.month - 1 + months
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def _get_partition_name(bound: date) -> str:
+    """partition of month before bound"""
+    return 'p' + _add_months(bound, -1).strftime('%Y%m')
+
+
+def get_partitions() -> List[Tuple[str, Optional[date]]]:
+    """names and upper bounds of querylog partitions, bound of last partition is None;
+    empty list if querylog is not partitioned"""
+    result = []
+    if connection.vendor == 'mysql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS '
+                'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s '
+                'AND PARTITION_NAME IS NOT NULL ORDER BY PARTITION_ORDINAL_POSITION',
+                [EmployeeRequest._meta.db_table])
+            for name, description in cursor.fetchall():
+                bound = None
+                if description != 'MAXVALUE':
+                    bound = datetime.fromisoformat(description.strip("'")).date()
+                result.append((name, bound))
+
+    return result
+
+
+def roll_partitions(months_ahead: Optional[int] = None) -> List[str]:
+    """split future partition into monthly partitions up to months ahead of current month
+    (QUERYLOG_PARTITIONS_AHEAD by default), return names of created partitions"""
+    if months_ahead is None:
+        months_ahead = settings.QUERYLOG_PARTITIONS_AHEAD
+    partitions = get_partitions()
+    last_bound = _add_months(date.today().replace(day=1), months_ahead + 1)
+
+    created = []
+    if partitions:
+        bounds = [bound for _, bound in partitions if bound is not None]
+        bound = _add_months(max(bounds), 1) if bounds \
+            else _add_months(date.today().replace(day=1), 1)
+        definitions = []
+        while bound <= last_bound:
+            created.append(_get_partition_name(bound))
+            definitions.append("PARTITION %s VALUES LESS THAN ('%s')"
+                               % (created[-1], bound.isoformat()))
+            bound = _add_months(bound, 1)
+
+        if definitions:
+            definitions.append('PARTITION %s VALUES LESS THAN (MAXVALUE)' % _FUTURE_PARTITION)
+            with connection.cursor() as cursor:
+                cursor.execute('ALTER TABLE %s REORGANIZE PARTITION %s INTO (%s)'
+                               % (EmployeeRequest._meta.db_table, _FUTURE_PARTITION,
+                                  ', '.join(definitions)))
+
+    return created
+
+
+def get_archive_horizon(months: Optional[int] = None) -> date:
+    """first day of month from which requests are kept in querylog,
+    QUERYLOG_ARCHIVE_MONTHS before current month by default"""
+    if months is None:
+        months = settings.QUERYLOG_ARCHIVE_MONTHS
+
+    return _add_months(date.today().replace(day=1), -months)
+
+
+def get_first_complete_date() -> Optional[date]:
+    """first local date with all its requests in querylog, None if archive is empty;
+    requests of earlier dates are moved to archive. Date is cached for COUNTS_CACHE_TTL
+    seconds and dropped by archive_requests"""
+    cached = cache.get(_FIRST_COMPLETE_DATE_KEY)
+    if cached is None:
+        last_archived = EmployeeRequestArchive.objects.aggregate(last=Max('moment'))['last']
+        cached = (None if last_archived is None
+                  else (last_archived + _LOCAL_DATE_MARGIN).date() + timedelta(days=1),)
+        cache.set(_FIRST_COMPLETE_DATE_KEY, cached, settings.COUNTS_CACHE_TTL)
+
+    return cached[0]
+
+
+def _copy_to_archive(cursor, condition: str, params: list, ignore: bool = False) -> int:
+    columns = ', '.join(connection.ops.quote_name(field.column)
+                        for field in EmployeeRequestArchive._meta.concrete_fields)
+    cursor.execute('INSERT %sINTO %s (%s) SELECT %s FROM %s %s'
+                   % ('IGNORE ' if ignore else '', EmployeeRequestArchive._meta.db_table,
+                      columns, columns, EmployeeRequest._meta.db_table, condition), params)
+
+    return cursor.rowcount
+
+
+def archive_requests(horizon: date) -> int:
+    """move requests with stamp before horizon to archive table, return count of moved
+    requests; partitions of months before horizon are copied and dropped as a whole.
+    Reports skip dates before get_first_complete_date"""
+    partitions = get_partitions()
+    table = EmployeeRequest._meta.db_table
+
+    moved = 0
+    with connection.cursor() as cursor:
+        if partitions:
+            for name, bound in partitions:
+                if (bound is not None) and (bound <= horizon):
+                    # DROP PARTITION commits implicitly, copy of interrupted run is ignored
+                    moved += _copy_to_archive(cursor, 'PARTITION (%s)' % name, [], ignore=True)
+                    cursor.execute('ALTER TABLE %s DROP PARTITION %s' % (table, name))
+        else:
+            condition = 'WHERE %s < %%s' % connection.ops.quote_name(
+                EmployeeRequest._meta.get_field('moment').column)
+            params = [datetime.combine(horizon, datetime.min.time())]
+            with transaction.atomic():
+                moved += _copy_to_archive(cursor, condition, params)
+                cursor.execute('DELETE FROM %s %s' % (table, condition), params)
+
+    if moved:
+        cache.delete(_FIRST_COMPLETE_DATE_KEY)
+        requests_changed.send(sender=EmployeeRequest)
+
+    return moved
+
+
+@receiver(pre_save, sender=Device)
+def _on_device_saving(sender, instance: Device, **kwargs):
+    instance._saved_timezone = None if instance.pk is None else Device.objects\
+        .filter(pk=instance.pk).values_list('timezone', flat=True).first()
+
+
+@receiver(post_save, sender=Device)
+def _on_device_saved(sender, instance: Device, created: bool, **kwargs):
+    """local dates of device requests follow its current timezone; requests are refilled
+    by update_daily_attendance command, refill of previous change is restarted"""
+    if (not created) and (instance.timezone != getattr(instance, '_saved_timezone', None)):
+        SummaryWatermark.objects.update_or_create(
+            name=TIMEZONE_CHANGE_WATERMARK_PREFIX + str(instance.pk),
+            defaults={'last_request_id': 0})
@@ -0,0 +1,26 @@
+"""rebuild daily attendance summary"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from idenick_app.classes.utils import attendance_utils
+
+
+class Command(BaseCommand):
+    help = 'Rebuild daily attendance summary from querylog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='from_date', default=None,
+                            help='first rebuilt local date as YYYYMMDD, all dates by default')
+        parser.add_argument('--batch-size', type=int,
+                            default=attendance_utils.DEFAULT_BATCH_SIZE,
+                            help='count of requests processed in one transaction')
+
+    def handle(self, *args, **options):
+        from_date = None
+        if options['from_date'] is not None:
+            from_date = datetime.strptime(options['from_date'], '%Y%m%d').date()
+
+        attendance_utils.reset_daily_attendance(from_date)
+        processed = attendance_utils.update_daily_attendance(options['batch_size'])
+        self.stdout.write('Processed requests: %d' % processed)
@@ -0,0 +1,23 @@
+"""fill local dates of querylog requests"""
+from django.core.management.base import BaseCommand
+
+from idenick_app.classes.utils import querylog_utils
+
+
+class Command(BaseCommand):
+    help = 'Set local date and minute of querylog requests by device timezone'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='recompute filled requests too, only empty by default')
+        parser.add_argument('--device', type=int, default=None,
+                            help='id of device, all devices by default')
+        parser.add_argument('--batch-size', type=int,
+                            default=querylog_utils.DEFAULT_BATCH_SIZE,
+                            help='range of request ids updated by one query')
+
+    def handle(self, *args, **options):
+        updated = querylog_utils.fill_local_moments(
+            only_empty=not options['all'], device_id=options['device'],
+            batch_size=options['batch_size'])
+        self.stdout.write('Updated requests: %d' % updated)
@@ -0,0 +1,28 @@
+"""roll querylog partitions and archive old requests"""
+from django.core.management.base import BaseCommand
+
+from idenick_app.classes.utils import attendance_utils, querylog_utils
+
+
+class Command(BaseCommand):
+    help = 'Create monthly querylog partitions ahead and move old requests to archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=None,
+                            help='months of partitions ahead of current month, '
+                            'QUERYLOG_PARTITIONS_AHEAD by default')
+        parser.add_argument('--archive-months', type=int, default=None,
+                            help='months kept in querylog, QUERYLOG_ARCHIVE_MONTHS by default')
+        parser.add_argument('--no-archive', action='store_true',
+                            help='only create partitions')
+
+    def handle(self, *args, **options):
+        created = querylog_utils.roll_partitions(options['ahead'])
+        self.stdout.write('Created partitions: %s' % (', '.join(created) or '-'))
+
+        if not options['no_archive']:
+            # archived requests are not read by summary, so it is completed before
+            attendance_utils.update_daily_attendance()
+            horizon = querylog_utils.get_archive_horizon(options['archive_months'])
+            moved = querylog_utils.archive_requests(horizon)
+            self.stdout.write('Archived requests before %s: %d' % (horizon, moved))
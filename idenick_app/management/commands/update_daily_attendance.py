@@ -0,0 +1,20 @@
+"""update daily attendance summary with new requests"""
+from django.core.management.base import BaseCommand
+
+from idenick_app.classes.utils import attendance_utils
+
+
+class Command(BaseCommand):
+    help = 'Refill local dates of devices with changed timezone, ' \
+        'add requests after watermark to daily attendance summary'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=attendance_utils.DEFAULT_BATCH_SIZE,
+                            help='count of requests processed in one transaction')
+
+    def handle(self, *args, **options):
+        updated = attendance_utils.apply_timezone_changes(options['batch_size'])
+        self.stdout.write('Updated requests of devices with changed timezone: %d' % updated)
+        processed = attendance_utils.update_daily_attendance(options['batch_size'])
+        self.stdout.write('Processed requests: %d' % processed)
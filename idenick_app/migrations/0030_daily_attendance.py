@@ -0,0 +1,40 @@
+# Generated by Django 3.2.25 on 2026-10-17 01:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('idenick_app', '0029_auto_20200320_1749'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SummaryWatermark',
+            fields=[
+                ('id', models.AutoField(db_index=True, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('last_request_id', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyAttendance',
+            fields=[
+                ('id', models.AutoField(db_index=True, primary_key=True, serialize=False)),
+                ('date', models.DateField(db_index=True)),
+                ('pairs', models.TextField(default='[]')),
+                ('first_in', models.DateTimeField()),
+                ('last_out', models.DateTimeField(blank=True, null=True)),
+                ('is_later', models.BooleanField(default=False)),
+                ('requests_count', models.IntegerField(default=0)),
+                ('employee', models.ForeignKey(db_column='usersid', on_delete=django.db.models.deletion.CASCADE, related_name='daily_attendances', to='idenick_app.employee')),
+                ('organization', models.ForeignKey(db_column='companyid', on_delete=django.db.models.deletion.CASCADE, related_name='daily_attendances', to='idenick_app.organization')),
+            ],
+            options={
+                'unique_together': {('organization', 'employee', 'date')},
+                'index_together': {('organization', 'date')},
+            },
+        ),
+    ]
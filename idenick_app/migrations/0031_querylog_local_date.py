@@ -0,0 +1,110 @@
+# Generated by Django 3.2.25 on 2026-10-17 02:06
+
+from django.db import migrations, models
+from django.db.models import DateTimeField, ExpressionWrapper, F, Max, Min
+from django.db.models.functions import ExtractHour, ExtractMinute, TruncDate
+
+_BATCH_SIZE = 50000
+
+# devices write querylog directly, so local date of new request is set by trigger
+_MYSQL_TRIGGER = '''
+CREATE TRIGGER {name} BEFORE {event} ON querylog FOR EACH ROW
+BEGIN
+    DECLARE local_stamp DATETIME(6);
+    SET local_stamp = NEW.stamp + INTERVAL COALESCE(
+        (SELECT timezone FROM devices WHERE id = NEW.devicesid), 0) MICROSECOND;
+    SET NEW.local_date = DATE(local_stamp);
+    SET NEW.local_minute = HOUR(local_stamp) * 60 + MINUTE(local_stamp);
+END
+'''
+
+_SQLITE_SHIFT = "printf('%+d seconds', COALESCE(" \
+    "(SELECT timezone FROM devices WHERE id = NEW.devicesid), 0) / 1000000)"
+
+_SQLITE_TRIGGER = '''
+CREATE TRIGGER {name} AFTER {event} ON querylog FOR EACH ROW
+BEGIN
+    UPDATE querylog SET
+        local_date = date(NEW.stamp, {shift}),
+        local_minute = CAST(strftime('%H', NEW.stamp, {shift}) AS INTEGER) * 60
+            + CAST(strftime('%M', NEW.stamp, {shift}) AS INTEGER)
+    WHERE id = NEW.id;
+END
+'''
+
+# update of stamp or device by sqlite trigger does not fire trigger again
+_EVENTS = {'mysql': ('INSERT', 'UPDATE'), 'sqlite': ('INSERT', 'UPDATE OF stamp, devicesid')}
+
+
+def _get_trigger_name(event):
+    return 'querylog_local_date_' + event.split()[0].lower()
+
+
+def _create_triggers(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for event in _EVENTS.get(vendor, ()):
+        sql = _MYSQL_TRIGGER if vendor == 'mysql' else _SQLITE_TRIGGER
+        schema_editor.execute(sql.format(name=_get_trigger_name(event), event=event,
+                                         shift=_SQLITE_SHIFT), params=None)
+
+
+def _drop_triggers(apps, schema_editor):
+    for event in _EVENTS.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute('DROP TRIGGER IF EXISTS ' + _get_trigger_name(event), params=None)
+
+
+def _get_local_moment_values(timezone):
+    local_moment = F('moment') if timezone is None else ExpressionWrapper(
+        F('moment') + timezone, output_field=DateTimeField())
+
+    return {'local_date': TruncDate(local_moment),
+            'local_minute': ExtractHour(local_moment) * 60 + ExtractMinute(local_moment)}
+
+
+def _fill_local_moments(apps, schema_editor):
+    employee_request_model = apps.get_model('idenick_app', 'EmployeeRequest')
+    device_model = apps.get_model('idenick_app', 'Device')
+    requests = employee_request_model.objects.using(schema_editor.connection.alias)\
+        .filter(local_date=None)
+
+    devices_by_timezone = {}
+    for device, timezone in device_model.objects.using(schema_editor.connection.alias)\
+            .exclude(timezone=None).values_list('id', 'timezone'):
+        devices_by_timezone.setdefault(timezone, []).append(device)
+    devices_with_timezone = [device for devices in devices_by_timezone.values()
+                             for device in devices]
+
+    bounds = requests.aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is not None:
+        for batch_start in range(bounds['first'], bounds['last'] + 1, _BATCH_SIZE):
+            batch = requests.filter(id__gte=batch_start, id__lt=batch_start + _BATCH_SIZE)
+            for timezone, devices in devices_by_timezone.items():
+                batch.filter(device_id__in=devices).update(**_get_local_moment_values(timezone))
+            batch.exclude(device_id__in=devices_with_timezone)\
+                .update(**_get_local_moment_values(None))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('idenick_app', '0030_daily_attendance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employeerequest',
+            name='local_date',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='employeerequest',
+            name='local_minute',
+            field=models.SmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='employeerequest',
+            index=models.Index(fields=['local_date', 'employee', 'device'], name='querylog_local_date_idx'),
+        ),
+        migrations.RunPython(_create_triggers, _drop_triggers),
+        migrations.RunPython(_fill_local_moments, migrations.RunPython.noop),
+    ]
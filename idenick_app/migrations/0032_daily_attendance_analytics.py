@@ -0,0 +1,62 @@
+# Generated by Django 3.2.25 on 2026-10-17 02:28
+
+import json
+from datetime import datetime
+
+from django.db import migrations, models
+
+_BATCH_SIZE = 5000
+
+
+def _fill_analytics_values(apps, schema_editor):
+    """minutes of existing summary from local moments and moments of pairs"""
+    daily_attendance_model = apps.get_model('idenick_app', 'DailyAttendance')
+    attendances = daily_attendance_model.objects.using(schema_editor.connection.alias)\
+        .order_by('id')
+
+    last_id = 0
+    while True:
+        batch = list(attendances.filter(id__gt=last_id)[:_BATCH_SIZE])
+        if not batch:
+            break
+
+        for attendance in batch:
+            seconds = 0
+            for pair in json.loads(attendance.pairs):
+                if pair[3] is not None:
+                    seconds += (datetime.fromisoformat(pair[3])
+                                - datetime.fromisoformat(pair[1])).total_seconds()
+            attendance.first_in_minute = attendance.first_in.hour * 60 \
+                + attendance.first_in.minute
+            attendance.last_out_minute = None if attendance.last_out is None \
+                else attendance.last_out.hour * 60 + attendance.last_out.minute
+            attendance.presence_minutes = int(seconds // 60)
+        daily_attendance_model.objects.using(schema_editor.connection.alias)\
+            .bulk_update(batch, ['first_in_minute', 'last_out_minute', 'presence_minutes'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('idenick_app', '0031_querylog_local_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyattendance',
+            name='first_in_minute',
+            field=models.SmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dailyattendance',
+            name='last_out_minute',
+            field=models.SmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='dailyattendance',
+            name='presence_minutes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(_fill_analytics_values, migrations.RunPython.noop),
+    ]
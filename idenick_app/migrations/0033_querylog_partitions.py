@@ -0,0 +1,114 @@
+# Generated by Django 3.2.25 on 2026-10-17 02:33
+
+from datetime import date
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# querylog rows older than first partition bound are kept in first partition
+_MAX_INITIAL_MONTHS = 120
+_MONTHS_AHEAD = 3
+
+
+def _add_months(day, months):
+    month = day.year * 12 + day.month - 1 + months
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def _get_partition_sql(bound):
+    return "PARTITION p%s VALUES LESS THAN ('%s')" \
+        % (_add_months(bound, -1).strftime('%Y%m'), bound.isoformat())
+
+
+def _get_foreign_keys(cursor):
+    cursor.execute("SELECT CONSTRAINT_NAME FROM information_schema.TABLE_CONSTRAINTS "
+                   "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'querylog' "
+                   "AND CONSTRAINT_TYPE = 'FOREIGN KEY'")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _partition_querylog(apps, schema_editor):
+    """monthly RANGE COLUMNS partitions of stamp from first request to few months ahead;
+    partition column must be part of primary key and foreign keys are not supported"""
+    if schema_editor.connection.vendor == 'mysql':
+        with schema_editor.connection.cursor() as cursor:
+            for name in _get_foreign_keys(cursor):
+                schema_editor.execute('ALTER TABLE querylog DROP FOREIGN KEY `%s`' % name,
+                                      params=None)
+            schema_editor.execute('ALTER TABLE querylog DROP PRIMARY KEY, '
+                                  'ADD PRIMARY KEY (id, stamp)', params=None)
+
+            current_month = date.today().replace(day=1)
+            cursor.execute('SELECT MIN(stamp) FROM querylog')
+            first = cursor.fetchone()[0]
+            first_month = current_month if first is None else first.date().replace(day=1)
+            first_month = max(first_month, _add_months(current_month, -_MAX_INITIAL_MONTHS))
+
+        partitions = []
+        bound = _add_months(first_month, 1)
+        while bound <= _add_months(current_month, _MONTHS_AHEAD + 1):
+            partitions.append(_get_partition_sql(bound))
+            bound = _add_months(bound, 1)
+        partitions.append('PARTITION pfuture VALUES LESS THAN (MAXVALUE)')
+        schema_editor.execute('ALTER TABLE querylog PARTITION BY RANGE COLUMNS(stamp) (%s)'
+                              % ', '.join(partitions), params=None)
+
+
+def _unpartition_querylog(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        employee_model = apps.get_model('idenick_app', 'Employee')
+        device_model = apps.get_model('idenick_app', 'Device')
+        schema_editor.execute('ALTER TABLE querylog REMOVE PARTITIONING', params=None)
+        schema_editor.execute('ALTER TABLE querylog DROP PRIMARY KEY, ADD PRIMARY KEY (id)',
+                              params=None)
+        for column, model in (('usersid', employee_model), ('devicesid', device_model)):
+            schema_editor.execute(
+                'ALTER TABLE querylog ADD CONSTRAINT querylog_%s_fk FOREIGN KEY (%s) '
+                'REFERENCES %s (id)' % (column, column, model._meta.db_table), params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('idenick_app', '0032_daily_attendance_analytics'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='employeerequest',
+                    name='device',
+                    field=models.ForeignKey(db_column='devicesid', db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='idenick_app.device'),
+                ),
+                migrations.AlterField(
+                    model_name='employeerequest',
+                    name='employee',
+                    field=models.ForeignKey(db_column='usersid', db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='idenick_app.employee'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(_partition_querylog, _unpartition_querylog),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EmployeeRequestArchive',
+            fields=[
+                ('id', models.IntegerField(editable=False, primary_key=True, serialize=False)),
+                ('moment', models.DateTimeField(db_column='stamp', db_index=True, editable=False)),
+                ('request_type', models.IntegerField(choices=[(0, 'Не существующий тип пакета'), (1, 'Запрошенная команда не поддерживается'), (2, 'Запрос версии протокола'), (3, 'PING сервера'), (10, 'Запрос на удаление записи по изображению отпечатка'), (11, 'Запрос на регистрацию записи по изображению отпечатка'), (12, 'Запрос на поиск записи по изображению ранее зарегистрированного отпечатка'), (20, 'Запрос на удаление записи по идентификатору, полученному со считывателя карт'), (21, 'Запрос на регистрацию записи по идентификатору, полученному со считывателя карт'), (22, 'Запрос на поиск записи по идентификатору, полученному со считывателя карт'), (30, 'Запрос на удаление записи по шаблону отпечатка'), (31, 'Запрос на регистрацию записи по шаблону отпечатка'), (32, 'Запрос на поиск записи по ранее зарегистрированному шаблону отпечатка'), (40, 'Запрос на удаление записи по изображению лица'), (41, 'Запрос на регистрацию записи по изображению лица'), (42, 'Запрос на поиск записи по изображению ранее зарегистрированного лица')], db_column='request', editable=False)),
+                ('response_type', models.IntegerField(choices=[(0, 'Не существующий тип пакета'), (1, 'Запрошенная команда не поддерживается'), (2, 'Ошибка при выполнении запроса'), (3, 'Запрос версии или PING сервера'), (10, 'Удаление отпечатка выполнено успешно'), (11, 'Регистрация выполнена успешно'), (12, 'Найдено совпадение'), (13, 'Регистрация невозможна так как обнаружено совпадение'), (14, 'Идентификация невозможна из-за низкого качества идентификационных данных'), (15, 'Совпадение не обнаружено среди ранее зарегистрированных шаблонов')], db_column='result', editable=False)),
+                ('description', models.CharField(blank=True, editable=False, max_length=500, null=True)),
+                ('algorithm_type', models.IntegerField(choices=[(0, 'Не существующий тип пакета'), (1, 'По отпечатку, возможно в основе его лежит стороний алгоритм'), (2, 'По отпечатку, основной используемый алгоритм идентификации'), (3, 'По отпечатку, не реализован в настоящей сборке'), (4, 'Не распознавание лиц'), (10, 'Фото сотрудника, не используется для авторизации'), (5, 'По номеру карты, дополнительный используемый алгоритм идентификации')], db_column='algorithm', editable=False)),
+                ('templatesid', models.IntegerField(editable=False, null=True)),
+                ('local_date', models.DateField(editable=False, null=True)),
+                ('local_minute', models.SmallIntegerField(editable=False, null=True)),
+                ('device', models.ForeignKey(db_column='devicesid', db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='archived_requests', to='idenick_app.device')),
+                ('employee', models.ForeignKey(db_column='usersid', db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='archived_requests', to='idenick_app.employee')),
+            ],
+            options={
+                'db_table': 'querylog_archive',
+                'index_together': {('local_date', 'employee', 'device')},
+            },
+        ),
+    ]
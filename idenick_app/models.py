@@ -3,6 +3,7 @@ from idenick_app.classes.model_entities.abstract_entries import *
 from idenick_app.classes.model_entities.department import *
 from idenick_app.classes.model_entities.device import *
 from idenick_app.classes.model_entities.checkpoint import *
+from idenick_app.classes.model_entities.daily_attendance import *
 from idenick_app.classes.model_entities.employee import *
 from idenick_app.classes.model_entities.employee_request import *
 from idenick_app.classes.model_entities.indentification_tepmplate import *
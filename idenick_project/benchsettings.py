@@ -0,0 +1,18 @@
+"""settings for benchmarks: separate sqlite (default) or mysql database"""
+import os
+
+from .settings import *
+
+if os.environ.get('BENCHMARK_DATABASE', 'sqlite') == 'mysql':
+    DATABASES['default'].update(
+        NAME=os.environ.get('BENCHMARK_DATABASE_NAME', 'idenick_benchmark'))
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'benchmark.sqlite3'),
+        }
+    }
+
+# reports of benchmark database are profiled by Server-Timing header
+REPORT_TIMING_HEADER = True
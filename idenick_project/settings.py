@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
 
     'idenick_app',
+    'idenick_rest_api_v0',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -141,3 +142,63 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
     ),
 }
+
+# Background report jobs: results are kept in REPORT_JOBS_ROOT for REPORT_JOBS_TTL seconds;
+# queued or running jobs without updates for REPORT_JOBS_STALE_TIMEOUT seconds are failed
+REPORT_JOBS_ROOT = os.path.join(BASE_DIR, 'report_jobs')
+REPORT_JOBS_WORKERS = 2
+REPORT_JOBS_START_METHOD = 'spawn'
+REPORT_JOBS_TTL = 24 * 60 * 60
+REPORT_JOBS_STALE_TIMEOUT = 60 * 60
+
+# Report file split by departments (split=department): sheets are built in worker processes
+REPORT_SPLIT_WORKERS = os.cpu_count() or 1
+REPORT_SPLIT_START_METHOD = 'spawn'
+
+# Cached list and report counts and first date of querylog after archive live
+# COUNTS_CACHE_TTL seconds; changes of entities in other processes are visible after TTL
+# unless CACHES is shared between processes
+COUNTS_CACHE_TTL = 60
+
+# Lines of report pages are found by per-day line counts of report scope; index is
+# updated by days of new requests and rebuilt after REPORT_PAGE_INDEX_TTL seconds
+REPORT_PAGE_INDEX_TTL = 60 * 60
+
+# Rendered reports are cached in process memory: least recently used are evicted when
+# total size exceeds REPORT_CACHE_MAX_SIZE bytes, entries live REPORT_CACHE_TTL seconds
+REPORT_CACHE_MAX_SIZE = 64 * 1024 * 1024
+REPORT_CACHE_MAX_ENTRY_SIZE = 8 * 1024 * 1024
+REPORT_CACHE_TTL = 60
+
+# Standard reports (yesterday, month to date) of organizations are pre-generated by
+# generate_standard_reports into REPORT_STORE_ROOT and served while they are younger than
+# REPORT_STORE_MAX_AGE seconds; with REPORT_STORE_SENDFILE_HEADER ('X-Sendfile' or
+# 'X-Accel-Redirect') files are sent by web server, X-Accel-Redirect uses internal
+# location REPORT_STORE_SENDFILE_URL mapped to REPORT_STORE_ROOT
+REPORT_STORE_ROOT = os.path.join(BASE_DIR, 'report_store')
+REPORT_STORE_MAX_AGE = 24 * 60 * 60
+REPORT_STORE_SENDFILE_HEADER = None
+REPORT_STORE_SENDFILE_URL = '/report_store/'
+
+# Report views add Server-Timing header with time and SQL of pipeline stages when
+# REPORT_TIMING_HEADER is set (header exposes SQL, so it is off in production); with
+# REPORT_TIMING_LOG samples are appended to rotating log file summarized by
+# report_timings command
+REPORT_TIMING_HEADER = False
+REPORT_TIMING_LOG = None
+REPORT_TIMING_LOG_MAX_BYTES = 10 * 1024 * 1024
+REPORT_TIMING_LOG_BACKUPS = 5
+
+# Biometry commands of mqtt_utils end at MQTT_COMMAND_TIMEOUT seconds after call (waits of
+# gateway connection, reply topic subscription and device reply), gateway connection is
+# waited at most MQTT_CONNECT_TIMEOUT; wait and network loop iterations of commands are
+# logged by idenick.mqtt logger
+MQTT_CONNECT_TIMEOUT = 10.0
+MQTT_COMMAND_TIMEOUT = 80.0
+
+# querylog is partitioned by month on MySQL: roll_querylog_partitions keeps
+# QUERYLOG_PARTITIONS_AHEAD months ahead and moves months older than
+# QUERYLOG_ARCHIVE_MONTHS to querylog_archive table; reports, lists and exports start
+# after archived dates
+QUERYLOG_PARTITIONS_AHEAD = 3
+QUERYLOG_ARCHIVE_MONTHS = 24
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class IdenickRestApiV0Config(AppConfig):
     name = 'idenick_rest_api_v0'
+
+    def ready(self):
+        # register receivers of entities changes
+        from idenick_rest_api_v0.classes.utils import count_utils
@@ -71,9 +71,10 @@ class ModelSerializer(serializers.ModelSerializer):
         return None if obj.timezone is None else date_utils.duration_to_str(obj.timezone)
 
     def get_organizations_count(self, obj: Device):
-        return get_related_entities_count(Device2Organization,
-                                          {'device_id': obj.id}, Organization,
-                                          'organization')
+        return obj.active_organizations_count if hasattr(obj, 'active_organizations_count') \
+            else get_related_entities_count(Device2Organization,
+                                            {'device_id': obj.id}, Organization,
+                                            'organization')
 
     class Meta:
         model = Device
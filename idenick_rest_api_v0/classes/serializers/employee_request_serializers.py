@@ -1,9 +1,24 @@
 """Serializers for employee request model"""
+from typing import Optional
 
 from rest_framework import serializers
 
+from idenick_app.classes.constants.identification import (algorithm_constants,
+                                                          request_constants,
+                                                          response_constants)
+from idenick_app.classes.utils import date_utils
 from idenick_app.models import EmployeeRequest
 
+REQUEST_TYPES = dict(request_constants.REQUEST_TYPE)
+RESPONSE_TYPES = dict(response_constants.RESPONSE_TYPE)
+ALGORITHM_TYPES = dict(algorithm_constants.ALGORITHM_TYPE)
+
+# values of EmployeeRequest.objects.with_local_moment() for serialize_values
+VALUES_FIELDS = ('id', 'employee_id', 'device_id', 'moment', 'request_type', 'response_type',
+                 'description', 'algorithm_type', 'local_moment', 'device_timezone',)
+
+_MOMENT_FIELD = serializers.DateTimeField()
+
 
 class ModelSerializer(serializers.ModelSerializer):
     """Serializer for employee-request-model"""
@@ -59,3 +74,21 @@ class HumanReadableSerializer(serializers.ModelSerializer):
             'algorithm_type',
             'date_info',
         ]
+
+
+def _get_display(labels: dict, value: Optional[int]):
+    return labels.get(value, value)
+
+
+def serialize_values(values: dict) -> dict:
+    """same data as ModelSerializer from VALUES_FIELDS values without model instances"""
+    return {'id': values['id'],
+            'employee': values['employee_id'],
+            'device': values['device_id'],
+            'moment': _MOMENT_FIELD.to_representation(values['moment']),
+            'request_type': _get_display(REQUEST_TYPES, values['request_type']),
+            'response_type': _get_display(RESPONSE_TYPES, values['response_type']),
+            'description': values['description'],
+            'algorithm_type': _get_display(ALGORITHM_TYPES, values['algorithm_type']),
+            'date_info': date_utils.get_local_date_info_values(
+                values['local_moment'], values['device_timezone'])}
@@ -0,0 +1,273 @@
+"""attendance analytics: lateness, arrival and presence aggregated by numpy"""
+import itertools
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy
+
+from idenick_app.classes.utils import attendance_utils, querylog_utils
+from idenick_app.models import (DailyAttendance, Department,
+                                Device2Organization, Employee2Department,
+                                Employee2Organization, EmployeeRequest, Login,
+                                Organization)
+from idenick_rest_api_v0.classes.utils import login_utils, request_utils
+
+DEFAULT_PERCENTILES = (50, 90)
+
+_ROW_DTYPE = numpy.dtype([('employee', numpy.int64), ('date', 'datetime64[D]'),
+                          ('first_in', numpy.int16), ('last_out', numpy.int16),
+                          ('is_later', numpy.bool_), ('presence', numpy.int32)])
+# last out minute of day without outcoming request
+_NO_MINUTE = -1
+
+
+def _minutes_to_str(value: float) -> Optional[str]:
+    result = None
+    if not numpy.isnan(value):
+        minutes = int(round(value))
+        result = '%02d:%02d' % (minutes // 60, minutes % 60)
+
+    return result
+
+
+def _get_organization(request) -> Optional[Organization]:
+    """organization of controller and registrator or organization param for admin"""
+    login = login_utils.get_login(request.user)
+    organization_id = request_utils.get_request_param(request, 'organization', True)
+    if (login.role == Login.CONTROLLER) or (login.role == Login.REGISTRATOR):
+        if organization_id in (None, login.organization_id):
+            organization_id = login.organization_id
+        else:
+            organization_id = None
+
+    return None if organization_id is None \
+        else Organization.objects.filter(id=organization_id).first()
+
+
+def _load_rows(attendances, unsaved_attendances: List[DailyAttendance]) -> numpy.ndarray:
+    """(employee, local date, first in minute, last out minute, is later, presence)
+    of every attendance day of summary and unsaved days as compact structured array"""
+    rows = itertools.chain(
+        attendances.values_list('employee_id', 'date', 'first_in_minute', 'last_out_minute',
+                                'is_later', 'presence_minutes').iterator(),
+        ((a.employee_id, a.date, a.first_in_minute, a.last_out_minute, a.is_later,
+          a.presence_minutes) for a in unsaved_attendances))
+
+    return numpy.fromiter(
+        ((employee_id, day, first_in, _NO_MINUTE if last_out is None else last_out,
+          is_later, presence)
+         for employee_id, day, first_in, last_out, is_later, presence in rows),
+        dtype=_ROW_DTYPE)
+
+
+def _get_unprocessed_attendances(organization: Organization, employees_ids,
+                                 from_date: Optional[date],
+                                 to_date: Optional[date]) -> Tuple[Set[date],
+                                                                   List[DailyAttendance]]:
+    """dates of requests which are not in summary yet and attendances of these dates
+    calculated from querylog"""
+    requests = querylog_utils.filter_local_dates(EmployeeRequest.objects, from_date, to_date)\
+        .filter(employee_id__in=employees_ids,
+                device_id__in=Device2Organization.objects.filter(organization=organization)
+                .values_list('device_id', flat=True))
+    dates = attendance_utils.get_unprocessed_dates(requests)
+
+    attendances = []
+    if dates:
+        keys = set(requests.filter(local_date__in=dates).order_by()
+                   .values_list('employee_id', 'local_date').distinct())
+        attendances = [attendance for attendance in attendance_utils.build_daily_attendance(keys)
+                       if attendance.organization_id == organization.id]
+
+    return dates, attendances
+
+
+def _get_group_percentiles(values: numpy.ndarray, groups: numpy.ndarray, count: numpy.ndarray,
+                           percentiles: List[float]) -> Dict[float, numpy.ndarray]:
+    """linear interpolated percentiles of values by groups, nan for empty group"""
+    sorted_values = values[numpy.lexsort((values, groups))].astype(numpy.float64)
+    starts = numpy.cumsum(count) - count
+    present = count > 0
+
+    result = {}
+    for percentile in percentiles:
+        position = starts[present] + (count[present] - 1) * (percentile / 100)
+        lower = numpy.floor(position).astype(numpy.int64)
+        upper = numpy.ceil(position).astype(numpy.int64)
+        value = numpy.full(len(count), numpy.nan)
+        value[present] = sorted_values[lower] \
+            + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+        result.update({percentile: value})
+
+    return result
+
+
+def _aggregate(rows: numpy.ndarray, groups: numpy.ndarray, groups_count: int,
+               percentiles: List[float]) -> List[dict]:
+    """metrics of rows by group index from 0 to groups_count"""
+    days = numpy.bincount(groups, minlength=groups_count)
+    # distinct (group, employee) pairs as single key
+    key_base = int(rows['employee'].max(initial=0)) + 1
+    employees = numpy.bincount(numpy.unique(groups * key_base + rows['employee']) // key_base,
+                               minlength=groups_count)
+    later = numpy.bincount(groups, weights=rows['is_later'], minlength=groups_count)
+    presence = numpy.bincount(groups, weights=rows['presence'], minlength=groups_count)
+    first_in = rows['first_in'].astype(numpy.float64)
+    arrival_sum = numpy.bincount(groups, weights=first_in, minlength=groups_count)
+    arrival_percentiles = _get_group_percentiles(
+        rows['first_in'], groups, days, percentiles)
+
+    with_out = rows['last_out'] != _NO_MINUTE
+    departure_days = numpy.bincount(groups[with_out], minlength=groups_count)
+    departure_sum = numpy.bincount(groups[with_out],
+                                   weights=rows['last_out'][with_out].astype(numpy.float64),
+                                   minlength=groups_count)
+
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        arrival_average = arrival_sum / days
+        departure_average = departure_sum / departure_days
+        later_rate = later / days
+
+    result = []
+    for i in range(groups_count):
+        result.append({
+            'days': int(days[i]),
+            'employees': int(employees[i]),
+            'lateCount': int(later[i]),
+            'lateRate': None if days[i] == 0 else round(float(later_rate[i]), 4),
+            'arrivalAverage': _minutes_to_str(arrival_average[i]),
+            'arrivalPercentiles': {'%g' % percentile: _minutes_to_str(values[i])
+                                   for percentile, values in arrival_percentiles.items()},
+            'departureAverage': _minutes_to_str(departure_average[i]),
+            'presenceHours': round(float(presence[i]) / 60, 2),
+        })
+
+    return result
+
+
+def _get_percentiles(request) -> List[float]:
+    result = list(DEFAULT_PERCENTILES)
+    value = request_utils.get_request_param(request, 'percentiles')
+    if value is not None:
+        try:
+            result = [float(percentile) for percentile in value.split(',')
+                      if 0 <= float(percentile) <= 100]
+        except ValueError:
+            pass
+
+    return result
+
+
+@dataclass
+class AttendanceAnalytics:
+    """late arrivals, arrival and departure times and presence of organization
+    by employee, department and month"""
+
+    def __init__(self, organization: Organization, total: dict, employees: List[dict],
+                 departments: List[dict], months: List[dict]):
+        self.organization = organization.id
+        self.total = total
+        self.employees = employees
+        self.departments = departments
+        self.months = months
+
+
+def get_attendance_analytics(request) -> Optional[AttendanceAnalytics]:
+    """analytics of daily attendance summary; None if organization is not available.
+    Params: organization (for admin), department, employee, start and end as YYYYMMDD,
+    percentiles as comma separated list"""
+    organization = _get_organization(request)
+    result = None
+    if organization is not None:
+        attendances = DailyAttendance.objects.filter(organization=organization)
+        scope_employees = Employee2Organization.objects.filter(organization=organization)
+        department_id = request_utils.get_request_param(request, 'department', True)
+        if department_id is not None:
+            scope_employees = scope_employees.filter(
+                employee_id__in=Employee2Department.objects.filter(department_id=department_id)
+                .values_list('employee_id', flat=True))
+        employee_id = request_utils.get_request_param(request, 'employee', True)
+        if employee_id is not None:
+            scope_employees = scope_employees.filter(employee_id=employee_id)
+        scope_employees = scope_employees.values_list('employee_id', flat=True)
+        attendances = attendances.filter(employee_id__in=scope_employees)
+
+        from_date = None
+        from_time = request_utils.get_request_param(request, 'start')
+        if from_time is not None:
+            from_date = datetime.strptime(from_time, '%Y%m%d').date()
+            attendances = attendances.filter(date__gte=from_date)
+        to_date = None
+        to_time = request_utils.get_request_param(request, 'end')
+        if to_time is not None:
+            to_date = datetime.strptime(to_time, '%Y%m%d').date()
+            attendances = attendances.filter(date__lte=to_date)
+
+        # summary is updated by update_daily_attendance command, days of requests which
+        # are not in summary yet are calculated from querylog
+        unprocessed_dates, unsaved_attendances = _get_unprocessed_attendances(
+            organization, scope_employees, from_date, to_date)
+        if unprocessed_dates:
+            attendances = attendances.exclude(date__in=unprocessed_dates)
+
+        rows = _load_rows(attendances, unsaved_attendances)
+        percentiles = _get_percentiles(request)
+
+        employees_ids, employees_groups = numpy.unique(rows['employee'], return_inverse=True)
+        employees_groups = employees_groups.reshape(-1)
+
+        # first department (by id) of employee shown in report, as in report lines
+        departments_by_employee = {}
+        for employee, department in Employee2Department.objects\
+                .filter(employee_id__in=employees_ids.tolist(), department__show_in_report=True,
+                        department__organization=organization)\
+                .order_by('department_id').values_list('employee_id', 'department_id'):
+            departments_by_employee.setdefault(employee, department)
+        departments_ids = sorted(set(departments_by_employee.values()))
+        department_indexes = {department: i for i, department in enumerate(departments_ids)}
+        # employees without department are in last group
+        employee_departments = numpy.array(
+            [department_indexes.get(departments_by_employee.get(employee), len(departments_ids))
+             for employee in employees_ids.tolist()], dtype=numpy.int64)
+        departments_groups = employee_departments[employees_groups] \
+            if len(rows) > 0 else numpy.zeros(0, dtype=numpy.int64)
+
+        months = rows['date'].astype('datetime64[M]')
+        months_values, months_groups = numpy.unique(months, return_inverse=True)
+        months_groups = months_groups.reshape(-1)
+
+        timesheets = dict(Employee2Organization.objects
+                          .filter(organization=organization, employee_id__in=employees_ids.tolist())
+                          .values_list('employee_id', 'timesheet_start'))
+        departments = Department.objects.in_bulk(departments_ids)
+
+        employees_info = []
+        for employee, info in zip(employees_ids.tolist(), _aggregate(
+                rows, employees_groups, len(employees_ids), percentiles)):
+            info.update(employee=employee,
+                        timesheetStart=timesheets.get(employee) or organization.timesheet_start)
+            employees_info.append(info)
+
+        departments_info = []
+        for i, info in enumerate(_aggregate(
+                rows, departments_groups, len(departments_ids) + 1, percentiles)):
+            department = None if i == len(departments_ids) else departments[departments_ids[i]]
+            if (department is not None) or (info['days'] > 0):
+                info.update(department=None if department is None else department.id,
+                            name='-' if department is None else department.name)
+                departments_info.append(info)
+
+        months_info = []
+        for month, info in zip(months_values.tolist(), _aggregate(
+                rows, months_groups, len(months_values), percentiles)):
+            info.update(month=month.strftime('%Y-%m'))
+            months_info.append(info)
+
+        total = _aggregate(rows, numpy.zeros(len(rows), dtype=numpy.int64), 1, percentiles)[0]
+
+        result = AttendanceAnalytics(organization=organization, total=total,
+                                     employees=employees_info, departments=departments_info,
+                                     months=months_info)
+
+    return result
@@ -0,0 +1,104 @@
+"""batch registration of biometry"""
+import json
+from typing import Iterator, List, Optional
+
+from django.http import StreamingHttpResponse
+
+from idenick_app.models import Employee
+from idenick_rest_api_v0.classes.utils import mqtt_utils
+
+_CONTENT_TYPE = 'application/x-ndjson; charset=utf-8'
+
+
+class _BatchItem:
+    """item of batch with employee and enrollment command or error"""
+
+    def __init__(self, index: int, employee_id, employee: Optional[Employee] = None,
+                 mqtt_command: Optional[bytes] = None, error: Optional[str] = None):
+        self.index = index
+        self.employee_id = employee_id
+        self.employee = employee
+        self.mqtt_command = mqtt_command
+        self.error = error
+
+
+def _get_items(items: List[dict]) -> List[_BatchItem]:
+    """items with commands; employees of batch are loaded by one query"""
+    employees_ids = set()
+    for item in items:
+        try:
+            employees_ids.add(int(item.get('employee')))
+        except (TypeError, ValueError):
+            pass
+    employees = Employee.objects.in_bulk(employees_ids)
+
+    result = []
+    for index, item in enumerate(items):
+        employee_id = item.get('employee')
+        employee = None
+        try:
+            employee = employees.get(int(employee_id))
+        except (TypeError, ValueError):
+            pass
+
+        biometry_type = None
+        try:
+            biometry_type = mqtt_utils.BiometryType(item.get('type'))
+        except ValueError:
+            pass
+
+        mqtt_command = None
+        if (employee is not None) and (biometry_type is not None) \
+                and isinstance(item.get('biometryData'), str):
+            try:
+                mqtt_command = mqtt_utils.get_enroll_command(
+                    employee, item.get('biometryData'), biometry_type)
+            except ValueError:
+                # biometry data is not base64
+                pass
+
+        batch_item = None
+        if employee is None:
+            batch_item = _BatchItem(index, employee_id, error='Сотрудник не найден')
+        elif mqtt_command is None:
+            batch_item = _BatchItem(index, employee_id, error='Некорректные данные биометрии')
+        else:
+            batch_item = _BatchItem(index, employee_id, employee, mqtt_command)
+        result.append(batch_item)
+
+    return result
+
+
+def _get_line(item: _BatchItem, result: mqtt_utils.RegistrationResult) -> str:
+    return json.dumps(dict(index=item.index, employeeId=item.employee_id, **vars(result)),
+                      ensure_ascii=False) + '\n'
+
+
+def _iterate_results(mqtt_id: str, items: List[_BatchItem]) -> Iterator[str]:
+    """results of invalid items first, then results of enrollments as devices reply"""
+    commands = []
+    for item in items:
+        if item.error is None:
+            commands.append(item)
+        else:
+            yield _get_line(item, mqtt_utils.RegistrationResult(comment=item.error))
+
+    replies = mqtt_utils.enroll_many((mqtt_id, item.mqtt_command) for item in commands)
+    for index, reply in replies:
+        yield _get_line(commands[index], mqtt_utils.get_registration_result(reply))
+
+
+def get_batch_registration_response(request) -> Optional[StreamingHttpResponse]:
+    """registration of biometry of items (employee, type, biometryData) by device mqtt,
+    results are streamed as ndjson lines; None if request is invalid"""
+    mqtt_id = request.data.get('mqtt')
+    items = request.data.get('items')
+
+    result = None
+    if isinstance(mqtt_id, str) and isinstance(items, list) \
+            and all(isinstance(item, dict) for item in items):
+        result = StreamingHttpResponse(_iterate_results(mqtt_id, _get_items(items)),
+                                       content_type=_CONTENT_TYPE)
+        result['Cache-Control'] = 'no-cache'
+
+    return result
@@ -0,0 +1,167 @@
+"""cached and estimated counts of querysets"""
+import hashlib
+from dataclasses import dataclass
+from enum import Enum
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from idenick_app.classes.utils import querylog_utils
+from idenick_app.models import (DailyAttendance, EmployeeRequest,
+                                SummaryWatermark)
+
+_ENTITIES_VERSION_KEY = 'counts:entities_version'
+# models with changes which do not change counted entities
+_IGNORED_MODELS = (EmployeeRequest, DailyAttendance, SummaryWatermark,)
+_COUNTED_APPS = ('idenick_app', 'auth',)
+# fields of user which are saved by login only
+_LOGIN_FIELDS = frozenset(('last_login',))
+
+
+class CountMode(Enum):
+    """mode of total count"""
+    EXACT = 'exact'
+    ESTIMATED = 'estimated'
+    NONE = 'none'
+
+
+def get_count_mode(request, default: CountMode = CountMode.EXACT) -> CountMode:
+    """count mode from 'total' param"""
+    result = default
+    value = request.GET.get('total')
+    if value is not None:
+        try:
+            result = CountMode(value)
+        except ValueError:
+            pass
+
+    return result
+
+
+@dataclass
+class CountInfo:
+    """count value; exact is False for estimated value, None if count is not computed"""
+
+    def __init__(self, value: Optional[int], exact: Optional[bool]):
+        self.value = value
+        self.exact = exact
+
+
+def get_entities_version() -> int:
+    """version of entities, changed by invalidate_entities"""
+    result = cache.get(_ENTITIES_VERSION_KEY)
+    if result is None:
+        result = 0
+        cache.add(_ENTITIES_VERSION_KEY, result, None)
+
+    return result
+
+
+def invalidate_entities() -> None:
+    """drop cached counts after entities change"""
+    try:
+        cache.incr(_ENTITIES_VERSION_KEY)
+    except ValueError:
+        cache.set(_ENTITIES_VERSION_KEY, 1, None)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def _on_entity_change(sender, update_fields=None, **kwargs):
+    is_login = (sender is User) and (update_fields is not None) \
+        and (update_fields <= _LOGIN_FIELDS)
+    if (sender._meta.app_label in _COUNTED_APPS) and (sender not in _IGNORED_MODELS) \
+            and not is_login:
+        invalidate_entities()
+
+
+@receiver(querylog_utils.requests_changed)
+def _on_requests_change(sender, **kwargs):
+    """cached counts and page indexes of changed requests are dropped"""
+    invalidate_entities()
+
+
+def get_querylog_watermark(using: str = 'default') -> int:
+    """last querylog id; querylog is written by devices, so signals are not sent"""
+    return EmployeeRequest.objects.using(using).aggregate(last=Max('id'))['last'] or 0
+
+
+def _get_cache_key(queryset, mode: CountMode) -> str:
+    """key by normalized query, entities version and querylog watermark"""
+    sql, params = queryset.query.sql_with_params()
+    version = str(get_entities_version())
+    if queryset.model is EmployeeRequest:
+        version += '.' + str(get_querylog_watermark(queryset.db))
+
+    query_hash = hashlib.sha1(
+        repr((queryset.db, sql, params)).encode('utf-8')).hexdigest()
+
+    return 'counts:%s:%s:%s' % (mode.value, version, query_hash)
+
+
+def _estimate(queryset) -> Optional[int]:
+    """estimated count from table statistics or None if estimation is not supported"""
+    connection = connections[queryset.db]
+    result = None
+    if connection.vendor == 'mysql':
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                cursor.execute('SELECT TABLE_ROWS FROM information_schema.TABLES '
+                               'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                               [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+                if row is not None:
+                    result = row[0]
+            else:
+                sql, params = queryset.query.sql_with_params()
+                cursor.execute('EXPLAIN ' + sql, params)
+                columns = [column[0] for column in cursor.description]
+                estimate = None
+                for row in cursor.fetchall():
+                    plan = dict(zip(columns, row))
+                    if (plan.get('id') == 1) and (plan.get('rows') is not None):
+                        estimate = (1 if estimate is None else estimate) * plan['rows'] \
+                            * float(plan.get('filtered') or 100) / 100
+                if estimate is not None:
+                    result = int(round(estimate))
+
+    return result
+
+
+def get_count(queryset, mode: CountMode = CountMode.EXACT) -> CountInfo:
+    """count of queryset from cache; estimated mode falls back to exact count
+    when database has no statistics"""
+    result = None
+    key = None
+    if mode is CountMode.NONE:
+        result = CountInfo(None, None)
+    else:
+        try:
+            key = _get_cache_key(queryset, mode)
+        except EmptyResultSet:
+            # queryset is empty (report is not available for user)
+            result = CountInfo(0, True)
+
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            result = CountInfo(cached[0], cached[1])
+        else:
+            value = None
+            if mode is CountMode.ESTIMATED:
+                value = _estimate(queryset)
+            exact = value is None
+            if exact:
+                value = queryset.count()
+
+            cache.set(key, (value, exact), settings.COUNTS_CACHE_TTL)
+            result = CountInfo(value, exact)
+
+    return result
@@ -0,0 +1,109 @@
+"""streaming export of request events"""
+import csv
+import json
+from datetime import datetime
+from enum import Enum
+from typing import Iterator, List, Optional
+
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+from idenick_app.classes.utils import date_utils
+from idenick_rest_api_v0.classes.serializers import employee_request_serializers
+from idenick_rest_api_v0.classes.utils import report_utils
+
+
+class ExportFormat(Enum):
+    """format of streaming export"""
+    CSV = 'csv'
+    NDJSON = 'ndjson'
+
+
+_CONTENT_TYPES = {
+    ExportFormat.CSV: 'text/csv; charset=utf-8',
+    ExportFormat.NDJSON: 'application/x-ndjson; charset=utf-8',
+}
+
+_COLUMNS = ('id', 'employee', 'device', 'moment', 'request_type', 'response_type',
+            'description', 'algorithm_type', 'date', 'time', 'utc',)
+
+
+class _ExportRenderer(BaseRenderer):
+    """renderer for format negotiation of export; export is streamed by view,
+    renderer writes other responses (errors) as json"""
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+
+class CSVRenderer(_ExportRenderer):
+    media_type = 'text/csv'
+    format = ExportFormat.CSV.value
+
+
+class NDJSONRenderer(_ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = ExportFormat.NDJSON.value
+
+
+def get_export_format(request) -> Optional[ExportFormat]:
+    """export format from 'format' param or None for paginated json"""
+    result = None
+    try:
+        result = ExportFormat(request.GET.get('format'))
+    except ValueError:
+        pass
+
+    return result
+
+
+def _get_values(row: dict) -> List:
+    date_info = date_utils.get_local_date_info(row['local_moment'], row['device_timezone'])
+    return [row['id'],
+            row['employee_id'],
+            row['device_id'],
+            row['moment'].isoformat(),
+            employee_request_serializers.REQUEST_TYPES.get(row['request_type']),
+            employee_request_serializers.RESPONSE_TYPES.get(row['response_type']),
+            row['description'],
+            employee_request_serializers.ALGORITHM_TYPES.get(row['algorithm_type']),
+            date_info.day,
+            date_info.time,
+            date_info.utc]
+
+
+class _Echo:
+    """file-like object for csv writer, returns written line"""
+
+    def write(self, value):
+        return value
+
+
+def _iterate_csv(rows: Iterator[dict]) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+    yield writer.writerow(_COLUMNS)
+    for row in rows:
+        yield writer.writerow(_get_values(row))
+
+
+def _iterate_ndjson(rows: Iterator[dict]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(dict(zip(_COLUMNS, _get_values(row))), ensure_ascii=False) + '\n'
+
+
+def get_employees_requests_export(request, export_format: ExportFormat) -> StreamingHttpResponse:
+    """all request events of report as streaming csv or ndjson"""
+    name, rows = report_utils.get_employees_requests_rows(request)
+
+    content = _iterate_csv(rows) if export_format is ExportFormat.CSV \
+        else _iterate_ndjson(rows)
+
+    response = StreamingHttpResponse(
+        content, content_type=_CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = 'attachment; filename="%s"' % (
+        'Requests ' + name + ' ' + datetime.now().strftime('%Y_%m_%d') + '.'
+        + export_format.value)
+    response['Access-Control-Allow-Headers'] = 'Content-Type'
+
+    return response
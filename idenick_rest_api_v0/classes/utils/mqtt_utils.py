@@ -1,11 +1,25 @@
-"""MQTT utils"""
+"""MQTT utils
+
+Commands are sent through gateway of worker process: one connection driven by asyncio
+loop of gateway thread. search_face and enroll are awaitable from any event loop (async
+views), check_biometry and registrate_biometry wait them in calling thread.
+"""
+import asyncio
 import base64
+import concurrent.futures
+import logging
+import os
+import threading
+import time
 import uuid
+from collections import deque
 from dataclasses import dataclass
 from enum import Enum
-from typing import Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 import paho.mqtt.client as mqtt
+from django.conf import settings
+from rest_framework import exceptions, status
 
 from idenick_app.models import Employee
 from idenick_rest_api_v0.serializers import employee_serializers
@@ -19,6 +33,13 @@ PORT = 1883
 SUBSCRIBE_TOPIC_THREAD = '/BIOID/CLOUD/'
 PUBLISH_TOPIC_THREAD = '/BIOID/CLIENT/'
 PATH = '/mqtt'
+KEEPALIVE = 60
+# max delay between reconnection attempts, seconds
+RECONNECT_MAX_DELAY = 120
+# max enrollments of batch waiting for reply at once, one per device
+ENROLL_WINDOW = 16
+# max subscribed private devices of searches kept for next searches
+PRIVATE_DEVICES_IDLE = 64
 
 
 class BiometryType(Enum):
@@ -67,7 +88,7 @@ def _on_subscribe(client: mqtt.Client, userdata, mid, granted_qos, extra_action=
     print(_get_client_id(client) + ' subscribed')
 
     if extra_action is not None:
-        extra_action(client)
+        extra_action(client, mid)
 
 
 def _on_publish(client, userdata, mid):
@@ -76,81 +97,334 @@ def _on_publish(client, userdata, mid):
     print(_get_client_id(client) + ((' published (%d)') % (mid)))
 
 
-class _Connection:
-    """operation with connection"""
+_LOGGER = logging.getLogger('idenick.mqtt')
 
-    def __init__(self, client_id: str, on_connect=None, on_subscribe=None, on_message=None):
-        self.connected = None
-        self.msg_count = 0
 
-        self._client = mqtt.Client(
-            client_id=client_id, clean_session=True, transport="tcp")
+def _get_user_info(message: bytes) -> List[bytes]:
+    """last name, first name and patronymic of header of command or reply"""
+    return message.split(b'\r\n', 1)[0].strip().split(b',')[2:5]
+
+
+class _PendingCommand:
+    """command waiting for reply of device; reply with echo marker is accepted only if it
+    echoes user info of command; wait is time from publishing to reply or deadline,
+    iterations are network loop iterations of gateway during wait"""
+
+    def __init__(self, mqtt_command: bytes, reply_markers: List[bytes],
+                 echo_marker: Optional[bytes] = None):
+        self.name = mqtt_command.split(b',', 1)[0].decode('utf-8', 'replace')
+        self.reply_markers = reply_markers
+        self.echo_marker = echo_marker
+        self.user_info = _get_user_info(mqtt_command)
+        self.future = asyncio.get_running_loop().create_future()
+        self.reply = None
+        self.published_at = None
+        self.wait = 0.0
+        self.iterations = 0
 
-        def on_connect_func(client, rc):
-            if on_connect is not None:
-                on_connect(client)
-            self._set_status_connected(rc)
+    def accepts(self, payload: bytes) -> bool:
+        result = any(marker in payload for marker in self.reply_markers)
+        if result and (self.echo_marker is not None) and (self.echo_marker in payload):
+            result = _get_user_info(payload[payload.index(self.echo_marker):]) \
+                == self.user_info
 
-        def on_message_func(client, msg):
-            if on_message is not None:
-                on_message(client, msg)
-            self._msg_inc()
+        return result
+
+    def complete(self, payload: bytes) -> None:
+        if not self.future.done():
+            self.future.set_result(payload)
+
+
+@dataclass
+class GatewayStats:
+    """commands of gateway of process: replied and expired by deadline, total wait for
+    replies, seconds, and network loop iterations during waits; subscriptions are
+    subscribe round trips of reply topics"""
+
+    def __init__(self):
+        self.commands = 0
+        self.replies = 0
+        self.expired = 0
+        self.wait = 0.0
+        self.iterations = 0
+        self.subscriptions = 0
+
+
+class _Gateway:
+    """long-lived connection of worker process; reply topic of device is subscribed once,
+    commands of device are sent one at a time, so reply is matched to the only in-flight
+    command of device and reply of expired command is dropped; private device of gateway
+    gets one command at a time and is reused only after reply, so searches are not
+    waiting for subscription;
+    paho callbacks and coroutines of gateway run in loop of gateway thread only"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._connected: Optional[asyncio.Event] = None
+        # reply topic -> subscription is acknowledged
+        self._subscriptions: Dict[str, asyncio.Event] = {}
+        self._subscribe_mids: Dict[int, str] = {}
+        # reply topic -> command waiting for reply
+        self._pending: Dict[str, _PendingCommand] = {}
+        # device -> lock of its in-flight command
+        self._devices: Dict[str, asyncio.Lock] = {}
+        # subscribed private devices without command
+        self._idle_devices: List[str] = []
+        self.iterations = 0
+        self.stats = GatewayStats()
 
+        self._client = mqtt.Client(
+            client_id='%s %d gateway' % (uuid.uuid4().int, os.getpid()),
+            clean_session=CLEAN_SESSION, transport="tcp")
         self._client.on_connect = lambda client, userdata, flags, rc: _on_connect(
-            client, userdata, flags, rc, on_connect_func)
+            client, userdata, flags, rc, self._handle_connect)
         self._client.on_disconnect = lambda client, userdata, rc: _on_disconnect(
-            client, userdata, rc, self._set_status_disconnected)
+            client, userdata, rc, self._handle_disconnect)
         self._client.on_message = lambda client, userdata, msg: \
-            _on_message(client, userdata, msg, on_message_func)
+            _on_message(client, userdata, msg, self._handle_message)
         self._client.on_subscribe = lambda client, userdata, mid, granted_qos: \
-            _on_subscribe(client, userdata, mid, granted_qos, on_subscribe)
+            _on_subscribe(client, userdata, mid, granted_qos, self._handle_subscribe)
         self._client.on_publish = _on_publish
+        # socket of client is read and written by loop instead of paho network thread
+        self._client.on_socket_open = lambda client, userdata, sock: \
+            self.loop.add_reader(sock, self._iterate, client.loop_read)
+        self._client.on_socket_close = lambda client, userdata, sock: \
+            self._remove_socket(sock)
+        self._client.on_socket_register_write = lambda client, userdata, sock: \
+            self.loop.add_writer(sock, self._iterate, client.loop_write)
+        self._client.on_socket_unregister_write = lambda client, userdata, sock: \
+            self.loop.remove_writer(sock)
+        self._client.connect_async(HOST, PORT, KEEPALIVE)
+
+        threading.Thread(target=self._run, name='mqtt-gateway', daemon=True).start()
+        self._started.wait()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self._connected = asyncio.Event()
+        self.loop.create_task(self._keep_connection())
+        self._started.set()
+        self.loop.run_forever()
+
+    def _iterate(self, handler) -> int:
+        """network loop iteration: read, write or keepalive check of client"""
+        self.iterations += 1
+        return handler()
+
+    def _remove_socket(self, sock) -> None:
+        self.loop.remove_reader(sock)
+        self.loop.remove_writer(sock)
+
+    async def _keep_connection(self) -> None:
+        """connect, serve keepalive and reconnect with growing delay after connection loss;
+        socket is connected synchronously, only gateway loop waits for it"""
+        delay = 1
+        while True:
+            try:
+                self._client.reconnect()
+                delay = 1
+                while self._iterate(self._client.loop_misc) == mqtt.MQTT_ERR_SUCCESS:
+                    await asyncio.sleep(1)
+            except OSError as e:
+                print("Error  occured. Arguments {0}.".format(
+                    e.args))
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+            self._connected.clear()
+            await asyncio.sleep(delay)
+
+    def _subscribe(self, topic: str) -> None:
+        rc, mid = self._client.subscribe(topic, qos=0)
+        if rc == mqtt.MQTT_ERR_SUCCESS:
+            self._subscribe_mids.update({mid: topic})
+            self.stats.subscriptions += 1
+
+    def _handle_connect(self, client, rc: int) -> None:
+        # pylint: disable=unused-argument
+        if rc == 0:
+            # subscriptions are lost with clean session
+            self._subscribe_mids.clear()
+            for topic, subscribed in self._subscriptions.items():
+                subscribed.clear()
+                self._subscribe(topic)
+            self._connected.set()
+
+    def _handle_disconnect(self) -> None:
+        self._connected.clear()
+
+    def _handle_subscribe(self, client, mid: int) -> None:
+        # pylint: disable=unused-argument
+        topic = self._subscribe_mids.pop(mid, None)
+        # subscription of private device can be released before acknowledgement
+        if topic in self._subscriptions:
+            self._subscriptions[topic].set()
+
+    def _handle_message(self, client, msg) -> None:
+        # pylint: disable=unused-argument
+        command = self._pending.get(msg.topic)
+        if (command is not None) and command.accepts(msg.payload):
+            del self._pending[msg.topic]
+            command.complete(msg.payload)
+
+    def _get_subscription(self, topic: str) -> asyncio.Event:
+        result = self._subscriptions.get(topic)
+        if result is None:
+            result = asyncio.Event()
+            self._subscriptions.update({topic: result})
+            if self._connected.is_set():
+                self._subscribe(topic)
+
+        return result
+
+    def _release_subscription(self, topic: str) -> None:
+        self._pending.pop(topic, None)
+        self._subscriptions.pop(topic, None)
+        if self._connected.is_set():
+            self._client.unsubscribe(topic)
+
+    async def wait_connected(self, timeout: float) -> bool:
+        """wait connection of gateway, return connection status"""
+        try:
+            await asyncio.wait_for(self._connected.wait(), max(timeout, 0))
+        except asyncio.TimeoutError:
+            pass
 
-    def _set_status(self, status: bool) -> None:
-        self.connected = status
+        return self._connected.is_set()
 
-    def _set_status_connected(self, rc) -> None:
-        self._set_status(rc == 0)
+    async def _exchange(self, device_mqtt: str, command: _PendingCommand,
+                        mqtt_command: bytes) -> None:
+        reply_topic = SUBSCRIBE_TOPIC_THREAD + device_mqtt
+        await self._get_subscription(reply_topic).wait()
+        self._pending.update({reply_topic: command})
+        try:
+            self._client.publish(PUBLISH_TOPIC_THREAD + device_mqtt, mqtt_command)
+            command.published_at = (time.monotonic(), self.iterations)
+            command.reply = await command.future
+        finally:
+            if self._pending.get(reply_topic) is command:
+                del self._pending[reply_topic]
+
+    async def _request(self, device_mqtt: Optional[str], command: _PendingCommand,
+                       mqtt_command: bytes) -> None:
+        if device_mqtt is None:
+            device_mqtt = self._idle_devices.pop() if self._idle_devices \
+                else str(uuid.uuid4().int)
+            try:
+                await self._exchange(device_mqtt, command, mqtt_command)
+            finally:
+                # reply of expired command can come later, so its device is not reused
+                if (command.reply is not None) \
+                        and (len(self._idle_devices) < PRIVATE_DEVICES_IDLE):
+                    self._idle_devices.append(device_mqtt)
+                else:
+                    self._release_subscription(SUBSCRIBE_TOPIC_THREAD + device_mqtt)
+        else:
+            async with self._devices.setdefault(device_mqtt, asyncio.Lock()):
+                await self._exchange(device_mqtt, command, mqtt_command)
+
+    def _record(self, command: _PendingCommand) -> None:
+        if command.published_at is not None:
+            published_at, iterations = command.published_at
+            command.wait = time.monotonic() - published_at
+            command.iterations = self.iterations - iterations
+
+        self.stats.commands += 1
+        if command.reply is None:
+            self.stats.expired += 1
+        else:
+            self.stats.replies += 1
+        self.stats.wait += command.wait
+        self.stats.iterations += command.iterations
+
+    async def send(self, device_mqtt: Optional[str], mqtt_command: bytes,
+                   reply_markers: List[bytes], timeout: float,
+                   echo_marker: Optional[bytes] = None) -> _PendingCommand:
+        """publish command to device (private device of gateway if None) after its
+        previous command and wait its first reply containing one of markers; command is
+        completed by reply or by deadline in timeout, reply of expired command is None"""
+        command = _PendingCommand(mqtt_command, reply_markers, echo_marker)
+        try:
+            await asyncio.wait_for(
+                self._request(device_mqtt, command, mqtt_command), max(timeout, 0))
+        except asyncio.TimeoutError:
+            pass
+        self._record(command)
 
-    def _set_status_disconnected(self) -> None:
-        self._set_status(False)
+        return command
 
-    def _msg_inc(self) -> None:
-        self.msg_count += 1
 
-    def is_connected(self) -> bool:
-        """return connection status"""
-        return (self.connected is not None) and self.connected
+_GATEWAY = None
+_GATEWAY_PID = None
+_GATEWAY_LOCK = threading.Lock()
+
+
+def _get_gateway() -> _Gateway:
+    """gateway of current process; worker forked from process with gateway creates own"""
+    global _GATEWAY, _GATEWAY_PID
+    pid = os.getpid()
+    if _GATEWAY_PID != pid:
+        with _GATEWAY_LOCK:
+            if _GATEWAY_PID != pid:
+                _GATEWAY = _Gateway()
+                _GATEWAY_PID = pid
+
+    return _GATEWAY
+
+
+def _submit(coroutine):
+    """run coroutine in loop of gateway, return concurrent future of it"""
+    return asyncio.run_coroutine_threadsafe(coroutine, _get_gateway().loop)
+
+
+def connect(timeout: Optional[float] = None) -> bool:
+    """start gateway of process and wait its connection (warm up of worker) at most
+    timeout or MQTT_CONNECT_TIMEOUT seconds, return connection status"""
+    if timeout is None:
+        timeout = settings.MQTT_CONNECT_TIMEOUT
+
+    return _submit(_get_gateway().wait_connected(timeout)).result()
 
-    def loop(self) -> None:
-        """call client.loop(4.0)"""
-        try:
-            self._client.loop(timeout=4.0)
-        except Exception as e:
-            # handle any other exception
-            print("Error  occured. Arguments {0}.".format(
-                e.args))
-
-    def disconnect(self) -> None:
-        """call client.disconnect()"""
-        self._client.disconnect()
-
-    def connect(self) -> None:
-        """call client.connect()"""
-        count = 0
-        connected = False
-        while (not self.is_connected()) and (count < 5):
-            try:
-                if connected:
-                    self.loop()
-                else:
-                    self._client.connect(HOST, PORT, 60)
-                    connected = True
-            except Exception as e:
-                # handle any other exception
-                print("Error  occured. Arguments {0}.".format(
-                    e.args))
-            count += 1
+
+async def _copy_stats() -> GatewayStats:
+    result = GatewayStats()
+    vars(result).update(vars(_get_gateway().stats))
+
+    return result
+
+
+def get_stats() -> GatewayStats:
+    """stats of commands of gateway of process"""
+    return _submit(_copy_stats()).result()
+
+
+async def _send(device_mqtt: Optional[str], mqtt_command: bytes, reply_markers: List[bytes],
+                timeout: Optional[float],
+                echo_marker: Optional[bytes] = None) -> Optional[bytes]:
+    """send command in loop of gateway; whole call ends at deadline in timeout or
+    MQTT_COMMAND_TIMEOUT seconds, raise ConnectionError if gateway was not connected
+    in MQTT_CONNECT_TIMEOUT or before deadline"""
+    started = time.monotonic()
+    if timeout is None:
+        timeout = settings.MQTT_COMMAND_TIMEOUT
+    gateway = _get_gateway()
+    if not await gateway.wait_connected(min(settings.MQTT_CONNECT_TIMEOUT, timeout)):
+        raise ConnectionError('MQTT gateway is not connected')
+
+    command = await gateway.send(device_mqtt, mqtt_command, reply_markers,
+                                 started + timeout - time.monotonic(), echo_marker)
+    _LOGGER.info('%s to %s: %s, wait %.1f ms, total %.1f ms, %d loop iterations',
+                 command.name, device_mqtt or 'private device',
+                 'expired' if command.reply is None else 'replied',
+                 command.wait * 1000, (time.monotonic() - started) * 1000, command.iterations)
+
+    return command.reply
+
+
+class GatewayUnavailableError(exceptions.APIException):
+    """biometry command is not sent: gateway is not connected"""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_code = 'gateway_unavailable'
+    default_detail = 'Не удается подключиться к серверу'
 
 
 @dataclass
@@ -162,77 +436,50 @@ class CheckResult:
         self.employee = employee
 
 
-def _connect_2_topic(
-        label: str,
-        mqtt_command,
-        on_subscribe,
-        on_message,
-        on_end,
-        on_connect_failure=None,
-        device_mqtt: Optional[str] = str(uuid.uuid4().int),
-        stop_check=None,):
-    def on_connect(client):
-        client.subscribe(SUBSCRIBE_TOPIC_THREAD + device_mqtt, qos=0)
-
-    def on_subscribe_func(client):
-        client.publish(PUBLISH_TOPIC_THREAD + device_mqtt, mqtt_command)
-        on_subscribe(client)
-
-    def on_message_func(client, msg):
-        on_message(client, msg)
+# device answers found employee only, search without match ends at deadline
+_SEARCH_REPLY_MARKERS = [b'!SEARCH_OK,']
 
-    connection = _Connection(
-        client_id=(device_mqtt + ' ' + label),
-        on_connect=on_connect,
-        on_subscribe=on_subscribe_func,
-        on_message=on_message_func,)
 
-    connection.connect()
+def _get_employee_info(result_msg: str) -> List[str]:
+    """last name, first name, patronymic and id of employee of reply"""
+    return result_msg.split(',')[2:6]
 
-    _stop_check = (lambda: False) if stop_check is None else stop_check
-    if connection.is_connected():
-        waiting = 0
-        while (waiting < 20) and not _stop_check():
-            waiting += 1
-            connection.loop()
 
-        on_end()
-
-        connection.disconnect()
-    elif on_connect_failure is not None:
-        on_connect_failure()
-
-
-def check_biometry(biometry_bytes) -> CheckResult:
+async def _search_face(biometry_bytes: bytes,
+                       timeout: Optional[float]) -> Optional[CheckResult]:
     mqtt_command = ('!FACE_SEARCH,0,' +
                     '\r\n').encode('utf-8') + biometry_bytes
-    options = {'subscribed': False, 'employee': None, 'result': None, }
 
-    def on_subscribe(client):
-        options.update(subscribed=True)
+    result = None
+    try:
+        # search is sent to private device, so late reply of expired search has no
+        # command to be matched with
+        reply = await _send(None, mqtt_command, _SEARCH_REPLY_MARKERS, timeout)
+
+        employee_id = None
+        if reply is not None:
+            employee_info = _get_employee_info(reply.decode('utf-8').strip())
+            if (len(employee_info) > 3) and employee_info[3].isdigit():
+                employee_id = int(employee_info[3])
+        result = CheckResult(exists=(employee_id is not None),
+                             employee=employee_id,)
+    except ConnectionError:
+        pass
 
-    def on_message(client, msg):
-        payload_str = str(msg.payload)
-        if '!SEARCH_OK,' in payload_str:
-            result_msg = msg.payload.decode('utf-8').strip()
-            options.update(employee=employee_info[3])
+    return result
 
-            client.disconnect()
 
-    def on_end():
-        employee_id = options.get('employee')
-        options.update(result=CheckResult(exists=(employee_id is not None),
-                                          employee=employee_id,))
+async def search_face(biometry_bytes: bytes,
+                      timeout: Optional[float] = None) -> Optional[CheckResult]:
+    """search employee by face, None if gateway is not connected (callers answer it
+    with GatewayUnavailableError)"""
+    return await asyncio.wrap_future(_submit(_search_face(biometry_bytes, timeout)))
 
-    _connect_2_topic(
-        label='biometry_search',
-        mqtt_command=mqtt_command,
-        on_subscribe=on_subscribe,
-        on_message=on_message,
-        on_end=on_end
-    )
 
-    return options.get('result')
+def check_biometry(biometry_bytes: bytes,
+                   timeout: Optional[float] = None) -> Optional[CheckResult]:
+    """search_face for sync callers"""
+    return _submit(_search_face(biometry_bytes, timeout)).result()
 
 
 @dataclass
@@ -246,80 +493,147 @@ class RegistrationResult:
         self.employee = employee
 
 
-def registrate_biometry(employee: Employee, mqtt_id: str, biometry_data: str,
-                        biometry_type: BiometryType) -> RegistrationResult:
-    """registration biometry to employee"""
+@dataclass
+class EnrollmentReply:
+    """reply of device to enrollment, message is None if device did not reply in time"""
+
+    def __init__(self, connected: bool, message: Optional[str] = None):
+        self.connected = connected
+        self.message = message
 
+
+# !ENROLL_OK echoes user info of command, !DUPLICATE (with found employee) and !LOWTQ
+# are matched to in-flight command of device only
+_ENROLL_REPLY_MARKERS = [b'!DUPLICATE,', b'!ENROLL_OK,', b'!LOWTQ,']
+
+
+def get_enroll_command(employee: Employee, biometry_data: str,
+                       biometry_type: BiometryType) -> bytes:
+    """command of enrollment of biometry to employee"""
     user_info = ('%s,%s,%s'
                  % (employee.last_name, employee.first_name, employee.patronymic,))
 
-    mqtt_command = None
+    result = None
     if biometry_type is BiometryType.FACE:
         biometry_data = base64.b64decode(biometry_data)
-        mqtt_command = ('!FACE_ENROLL,0,' + user_info +
-                        '\r\n').encode('utf-8') + biometry_data
+        result = ('!FACE_ENROLL,0,' + user_info +
+                  '\r\n').encode('utf-8') + biometry_data
     elif biometry_type is BiometryType.CARD:
-        mqtt_command = ('!IDENROLL,0,' + user_info + ',' +
-                        biometry_data + '\r\n').encode('utf-8')
+        result = ('!IDENROLL,0,' + user_info + ',' +
+                  biometry_data + '\r\n').encode('utf-8')
     elif biometry_type is BiometryType.FINGER:
         biometry_data = base64.b64decode(biometry_data)
-        mqtt_command = ('!ENROLL,0,' + user_info +
-                        '\r\n').encode('utf-8') + biometry_data
+        result = ('!ENROLL,0,' + user_info +
+                  '\r\n').encode('utf-8') + biometry_data
 
-    device_mqtt = mqtt_id.replace('/', '')
+    return result
 
-    options = {'command': None, 'disabled': None,
-               'subscribed': False, 'employee': None, 'result': None, }
 
-    def on_subscribe(client):
-        options.update(subscribed=True)
+async def _enroll(mqtt_id: str, mqtt_command: bytes,
+                  timeout: Optional[float]) -> EnrollmentReply:
+    result = None
+    try:
+        reply = await _send(mqtt_id.replace('/', ''), mqtt_command,
+                            _ENROLL_REPLY_MARKERS, timeout, echo_marker=b'!ENROLL_OK,')
+        result = EnrollmentReply(
+            connected=True, message=None if reply is None else reply.decode('utf-8').strip())
+    except ConnectionError:
+        result = EnrollmentReply(connected=False)
 
-    def on_message(client, msg):
-        payload_str = str(msg.payload)
-        if ('!DUPLICATE,' in payload_str) or ('!ENROLL_OK,' in payload_str)\
-                or ('!LOWTQ,' in payload_str):
-            result_msg = msg.payload.decode('utf-8').strip()
+    return result
 
-            if '!LOWTQ,' not in payload_str:
-                employee_info = result_msg.split(',')[2:6]
 
-                employee = None
-                if '!DUPLICATE,' in result_msg:
-                    employee = Employee.objects.filter(id=employee_info[3])
-                else:
-                    employee = Employee.objects.filter(
-                        last_name=employee_info[0], first_name=employee_info[1],
-                        patronymic=employee_info[2])
+async def enroll(employee: Employee, mqtt_id: str, biometry_data: str,
+                 biometry_type: BiometryType,
+                 timeout: Optional[float] = None) -> EnrollmentReply:
+    """send enrollment of biometry of employee to device; employee is not queried,
+    so it can be awaited in async views"""
+    mqtt_command = get_enroll_command(employee, biometry_data, biometry_type)
 
-                options.update(employee=employee.first())
+    return await asyncio.wrap_future(_submit(_enroll(mqtt_id, mqtt_command, timeout)))
 
-            options.update(command=result_msg)
-            options.update(disabled='!ENROLL_OK,' not in result_msg)
 
-            client.disconnect()
+def get_registration_result(reply: EnrollmentReply) -> RegistrationResult:
+    """registration result of enrollment reply with found employee"""
+    result = None
+    if not reply.connected:
+        result = RegistrationResult(comment='Не удается подключиться к серверу',)
+    elif reply.message is None:
+        result = RegistrationResult(success=False, comment='Результат неизвестен',)
+    else:
+        result_msg = reply.message
 
-    def on_end():
-        if options.get('disabled') is None:
-            options.update(result=RegistrationResult(
-                success=False, comment='Результат неизвестен',))
-        else:
-            employee = None
-            if options.get('employee') is not None:
-                employee = employee_serializers.ModelSerializer(
-                    options.get('employee')).data
-            options.update(result=RegistrationResult(success=not options.get('disabled'),
-                                                     employee=employee,
-                                                     comment=options.get('command'),))
-
-    _connect_2_topic(
-        label='biometry_search',
-        mqtt_command=mqtt_command,
-        on_subscribe=on_subscribe,
-        on_message=on_message,
-        on_end=on_end,
-        stop_check=lambda: (options.get('disabled') is not None),
-        on_connect_failure=lambda: (options.update(result=RegistrationResult(
-            comment='Не удается подключиться к серверу',)))
-    )
-
-    return options.get('result')
+        employee = None
+        if '!LOWTQ,' not in result_msg:
+            employee_info = _get_employee_info(result_msg)
+
+            employees = None
+            if '!DUPLICATE,' in result_msg:
+                employees = Employee.objects.filter(id=employee_info[3])
+            else:
+                employees = Employee.objects.filter(
+                    last_name=employee_info[0], first_name=employee_info[1],
+                    patronymic=employee_info[2])
+            employee = employees.first()
+
+        if employee is not None:
+            employee = employee_serializers.ModelSerializer(employee).data
+        result = RegistrationResult(success='!ENROLL_OK,' in result_msg,
+                                    employee=employee,
+                                    comment=result_msg,)
+
+    return result
+
+
+def registrate_biometry(employee: Employee, mqtt_id: str, biometry_data: str,
+                        biometry_type: BiometryType,
+                        timeout: Optional[float] = None) -> RegistrationResult:
+    """registration biometry to employee"""
+    mqtt_command = get_enroll_command(employee, biometry_data, biometry_type)
+
+    return get_registration_result(_submit(_enroll(mqtt_id, mqtt_command, timeout)).result())
+
+
+def enroll_many(commands: Iterable[Tuple[str, bytes]], window: int = ENROLL_WINDOW,
+                timeout: Optional[float] = None) -> Iterator[Tuple[int, EnrollmentReply]]:
+    """pipeline enrollment commands (mqtt id, command) over connection of gateway with at
+    most window commands in flight; device gets next command after reply or expiry of
+    previous one, so deadline of command is not spent in queue of device; yield index of
+    command and reply in order of replies"""
+    commands = enumerate(commands)
+    window = max(window, 1)
+    # read commands waiting for their devices, at most window
+    queued = deque()
+    # future -> index and device of command
+    in_flight = {}
+
+    def submit_next() -> None:
+        while len(in_flight) < window:
+            if len(queued) < window:
+                item = next(commands, None)
+                if item is not None:
+                    queued.append(item)
+
+            busy = {device for _, device in in_flight.values()}
+            item = next((item for item in queued
+                         if item[1][0].replace('/', '') not in busy), None)
+            if item is None:
+                break
+            queued.remove(item)
+            index, (mqtt_id, mqtt_command) = item
+            in_flight.update({_submit(_enroll(mqtt_id, mqtt_command, timeout)):
+                              (index, mqtt_id.replace('/', ''))})
+
+    try:
+        submit_next()
+        while in_flight:
+            done, _ = concurrent.futures.wait(
+                in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                index, _ = in_flight.pop(future)
+                submit_next()
+                yield index, future.result()
+    finally:
+        # response is not read anymore
+        for future in in_flight:
+            future.cancel()
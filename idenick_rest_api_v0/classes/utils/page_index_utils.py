@@ -0,0 +1,89 @@
+"""per-day line counts of reports, maintained incrementally for pagination"""
+import hashlib
+from datetime import date
+from typing import Dict, Iterable, Optional, Set
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Count
+
+from idenick_app.models import EmployeeRequest
+from idenick_rest_api_v0.classes.utils import count_utils
+
+
+def _get_cache_key(queryset) -> str:
+    """key by normalized query of report scope and entities version; querylog changes
+    are applied to cached index by days of new requests"""
+    sql, params = queryset.query.sql_with_params()
+    query_hash = hashlib.sha1(
+        repr((queryset.db, sql, params)).encode('utf-8')).hexdigest()
+
+    return 'page_index:%s:%s' % (count_utils.get_entities_version(), query_hash)
+
+
+def _count_lines(queryset, date_field: str, requests_field: Optional[str],
+                 days: Optional[Iterable[date]] = None) -> Dict[date, int]:
+    """lines of days: requests of employee in day are paired, so employee has
+    half of requests lines rounded up; without requests_field requests of queryset
+    are counted, otherwise queryset rows are days of employees with requests count"""
+    if days is not None:
+        queryset = queryset.filter(**{date_field + '__in': list(days)})
+
+    counts = None
+    if requests_field is None:
+        counts = queryset.order_by()\
+            .values(date_field, 'employee_id')\
+            .annotate(requests=Count('id'))\
+            .values_list(date_field, 'requests')
+    else:
+        counts = queryset.order_by().values_list(date_field, requests_field)
+
+    result = {}
+    for day, requests in counts:
+        if day is not None:
+            result.update({day: result.get(day, 0) + (requests + 1) // 2})
+
+    return result
+
+
+def _get_changed_days(watermark: int) -> Set[date]:
+    """local dates of requests added after watermark"""
+    return set(EmployeeRequest.objects
+               .filter(id__gt=watermark)
+               .exclude(employee=None)
+               .values_list('local_date', flat=True)
+               .distinct())
+
+
+def get_lines_by_date(queryset, date_field: str = 'local_date',
+                      requests_field: Optional[str] = None) -> Dict[date, int]:
+    """count of report lines by date of queryset of requests or of daily summary rows;
+    cached index is updated only for days of requests added after it was built"""
+    result = {}
+    key = None
+    try:
+        key = _get_cache_key(queryset)
+    except EmptyResultSet:
+        # queryset is empty (report is not available for user)
+        pass
+
+    if key is not None:
+        watermark = count_utils.get_querylog_watermark(queryset.db)
+        index = cache.get(key)
+        if index is None:
+            index = {'watermark': watermark,
+                     'lines': _count_lines(queryset, date_field, requests_field)}
+            cache.set(key, index, settings.REPORT_PAGE_INDEX_TTL)
+        elif index['watermark'] < watermark:
+            changed_days = _get_changed_days(index['watermark'])
+            lines = index['lines']
+            for day in changed_days:
+                lines.pop(day, None)
+            if changed_days:
+                lines.update(_count_lines(queryset, date_field, requests_field, changed_days))
+            index = {'watermark': watermark, 'lines': lines}
+            cache.set(key, index, settings.REPORT_PAGE_INDEX_TTL)
+        result = index['lines']
+
+    return result
@@ -11,7 +11,7 @@ from idenick_app.models import (AbstractSimpleEntry, Department, Device,
                                 Checkpoint2Organization, Employee,
                                 Employee2Department, Employee2Organization,
                                 Login, Organization)
-from idenick_rest_api_v0.classes.utils import login_utils
+from idenick_rest_api_v0.classes.utils import count_utils, login_utils
 from idenick_rest_api_v0.serializers import (department_serializers,
                                              checkpoint_serializers,
                                              device_serializers,
@@ -208,6 +208,9 @@ def _add_or_remove_relations(request,
                 .filter(**{master_key: master_id, (slave_key + '__in'): success}) \
                 .update(dropped_at=datetime.now())
 
+    # queryset updates do not send signals
+    count_utils.invalidate_entities()
+
     failure = getted_ids.difference(success)
 
     return RelationChangeResult(success=success, failure=failure)
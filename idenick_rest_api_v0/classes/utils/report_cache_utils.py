@@ -0,0 +1,131 @@
+"""in-process cache of rendered reports with ETag support"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from rest_framework.renderers import JSONRenderer
+
+from idenick_app.models import Login
+from idenick_rest_api_v0.classes.utils import (count_utils, login_utils,
+                                               request_utils, timing_utils)
+
+# params which change report content; other params (total, cache busters) are ignored
+_REPORT_PARAMS = ('type', 'id', 'start', 'end', 'from', 'count', 'perPage',)
+_REPORT_FLAGS = ('summary',)
+
+
+@dataclass
+class _CacheEntry:
+    """rendered report and its ETag"""
+
+    def __init__(self, content: bytes, etag: str):
+        self.content = content
+        self.etag = etag
+        self.created_at = time.monotonic()
+
+    @property
+    def size(self) -> int:
+        return len(self.content)
+
+
+class _LRUCache:
+    """entries limited by total size of content, least recently used are evicted first"""
+
+    def __init__(self):
+        self._entries: 'OrderedDict[str, _CacheEntry]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[_CacheEntry]:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                if time.monotonic() - result.created_at > settings.REPORT_CACHE_TTL:
+                    self._remove(key)
+                    result = None
+                else:
+                    self._entries.move_to_end(key)
+
+        return result
+
+    def set(self, key: str, entry: _CacheEntry) -> None:
+        if entry.size <= settings.REPORT_CACHE_MAX_ENTRY_SIZE:
+            with self._lock:
+                self._remove(key)
+                self._entries[key] = entry
+                self._size += entry.size
+                while self._size > settings.REPORT_CACHE_MAX_SIZE:
+                    self._remove(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
+
+
+_CACHE = _LRUCache()
+
+
+def clear() -> None:
+    """drop all cached reports of process"""
+    _CACHE.clear()
+
+
+def _get_scope(request) -> str:
+    """reports of controller and registrator are limited by their organization"""
+    login = login_utils.get_login(request.user)
+    result = 'all'
+    if (login.role == Login.CONTROLLER) or (login.role == Login.REGISTRATOR):
+        result = 'organization:%s' % login.organization_id
+
+    return result
+
+
+def _get_cache_key(request, name: str) -> str:
+    """key by normalized params, login scope, querylog watermark and entities version"""
+    params = tuple((param, request_utils.get_request_param(request, param))
+                   for param in _REPORT_PARAMS)
+    flags = tuple(flag for flag in _REPORT_FLAGS
+                  if (flag in request.GET) or (('_' + flag) in request.GET))
+    version = (count_utils.get_querylog_watermark(), count_utils.get_entities_version())
+
+    return hashlib.sha1(repr((name, _get_scope(request), params, flags, version))
+                        .encode('utf-8')).hexdigest()
+
+
+def _get_response(request, entry: _CacheEntry) -> HttpResponse:
+    result = None
+    if request_utils.is_not_modified(request, entry.etag):
+        result = HttpResponseNotModified()
+    else:
+        result = HttpResponse(entry.content, content_type='application/json')
+    result['ETag'] = entry.etag
+    # clients revalidate every time, unchanged report is answered by 304
+    result['Cache-Control'] = 'private, no-cache'
+
+    return result
+
+
+def get_cached_response(request, name: str, get_data: Callable[[], dict]) -> HttpResponse:
+    """JSON response of get_data from cache; 304 if client has same report by If-None-Match"""
+    key = _get_cache_key(request, name)
+    entry = _CACHE.get(key)
+    if entry is None:
+        data = get_data()
+        with timing_utils.stage('render'):
+            content = JSONRenderer().render(data)
+        entry = _CacheEntry(content, '"%s"' % hashlib.sha1(content).hexdigest())
+        _CACHE.set(key, entry)
+
+    return _get_response(request, entry)
+
@@ -0,0 +1,353 @@
+"""background report jobs"""
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from enum import Enum
+from typing import Iterator, Optional
+
+import django
+from django.conf import settings
+from django.db import connections
+from django.http import FileResponse
+
+from idenick_app.models import Login
+from idenick_rest_api_v0.classes.utils import (login_utils, report_utils,
+                                               request_utils)
+
+# report params, other request params are ignored
+_REPORT_PARAMS = ('type', 'id', 'start', 'end', 'from', 'count', 'perPage', 'split',)
+_STATE_FILE = 'state.json'
+_RESULT_FILE = 'result'
+_KEYS_DIR = 'keys'
+_EVENTS_POLL_INTERVAL = 0.5
+_EVENTS_MAX_DURATION = 10 * 60
+
+_EXECUTOR = None
+
+
+class JobStatus(Enum):
+    """status of report job"""
+    QUEUED = 'QUEUED'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+
+
+class JobFormat(Enum):
+    """format of report job result"""
+    XLSX = 'xlsx'
+    JSON = 'json'
+
+
+_CONTENT_TYPES = {
+    JobFormat.XLSX: 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    JobFormat.JSON: 'application/json',
+}
+
+
+@dataclass
+class JobInfo:
+    """report job info for client"""
+
+    def __init__(self, state: dict):
+        self.id = state.get('id')
+        self.status = state.get('status')
+        self.progress = state.get('progress')
+        self.format = state.get('format')
+        self.file_name = state.get('file_name')
+        self.error = state.get('error')
+
+
+def _get_root() -> str:
+    return settings.REPORT_JOBS_ROOT
+
+
+def _get_job_dir(job_id: str) -> str:
+    return os.path.join(_get_root(), job_id)
+
+
+def _is_job_id(job_id: str) -> bool:
+    return re.fullmatch('[0-9a-f]{32}', job_id) is not None
+
+
+def _read_state(job_id: str) -> Optional[dict]:
+    result = None
+    if _is_job_id(job_id):
+        try:
+            with open(os.path.join(_get_job_dir(job_id), _STATE_FILE), encoding='utf-8') as file:
+                result = json.load(file)
+        except (OSError, ValueError):
+            pass
+
+    return result
+
+
+def _write_state(state: dict) -> None:
+    """write state atomically, pollers never see partial file"""
+    state.update(updated=time.time())
+    job_dir = _get_job_dir(state['id'])
+    temp_path = os.path.join(job_dir, _STATE_FILE + '.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(state, file)
+    os.replace(temp_path, os.path.join(job_dir, _STATE_FILE))
+
+
+def _update_state(job_id: str, **values) -> dict:
+    state = _read_state(job_id)
+    state.update(values)
+    _write_state(state)
+
+    return state
+
+
+def _get_key(login: Login, params: dict, job_format: JobFormat) -> str:
+    """key of identical submissions: same params of same user, jobs are available
+    for their users only"""
+    normalized = json.dumps({'user': login.user_id,
+                             'role': login.role,
+                             'organization': login.organization_id,
+                             'format': job_format.value,
+                             'params': sorted(params.items())})
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def _get_key_path(key: str) -> str:
+    return os.path.join(_get_root(), _KEYS_DIR, key)
+
+
+def _acquire_key(key: str, job_id: str) -> Optional[str]:
+    """return id of active job with same key or None if key is acquired by job_id"""
+    key_path = _get_key_path(key)
+    result = None
+    for _ in range(2):
+        try:
+            descriptor = os.open(key_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            active_job_id = None
+            try:
+                with open(key_path, encoding='utf-8') as file:
+                    active_job_id = file.read().strip()
+            except OSError:
+                pass
+
+            state = None if active_job_id is None else _read_state(active_job_id)
+            if state is not None:
+                state = _expire_lost(state)
+            if (state is not None) and (state.get('status') in (JobStatus.QUEUED.value,
+                                                                 JobStatus.RUNNING.value)):
+                result = active_job_id
+                break
+
+            # key of finished or lost job
+            try:
+                os.remove(key_path)
+            except OSError:
+                pass
+        else:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+                file.write(job_id)
+            result = None
+            break
+
+    return result
+
+
+def _is_lost(state: dict) -> bool:
+    """active job is lost when it is not updated for REPORT_JOBS_STALE_TIMEOUT seconds:
+    its worker or process of queue is dead"""
+    return (state.get('status') in (JobStatus.QUEUED.value, JobStatus.RUNNING.value)) \
+        and (state.get('updated', 0) < time.time() - settings.REPORT_JOBS_STALE_TIMEOUT)
+
+
+def _expire_lost(state: dict) -> dict:
+    """mark lost job as failed and release its key"""
+    result = state
+    if _is_lost(state):
+        result = _update_state(state['id'], status=JobStatus.FAILED.value,
+                               error='job is lost')
+        _release_key(state['key'], state['id'])
+
+    return result
+
+
+def _release_key(key: str, job_id: str) -> None:
+    key_path = _get_key_path(key)
+    try:
+        with open(key_path, encoding='utf-8') as file:
+            if file.read().strip() == job_id:
+                os.remove(key_path)
+    except OSError:
+        pass
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = ProcessPoolExecutor(
+            max_workers=settings.REPORT_JOBS_WORKERS,
+            mp_context=multiprocessing.get_context(
+                settings.REPORT_JOBS_START_METHOD),
+            initializer=django.setup)
+
+    return _EXECUTOR
+
+
+def _start(job_id: str) -> None:
+    global _EXECUTOR
+    try:
+        _get_executor().submit(_run_job, job_id)
+    except BrokenProcessPool:
+        _EXECUTOR = None
+        _get_executor().submit(_run_job, job_id)
+
+
+def _run_job(job_id: str) -> None:
+    """execute job in worker process"""
+    state = _update_state(job_id, status=JobStatus.RUNNING.value, progress=0)
+    try:
+        request = request_utils.get_params_request(state['params'], state['user'])
+        result_path = os.path.join(_get_job_dir(job_id), _RESULT_FILE)
+        file_name = None
+        with open(result_path, 'wb') as output_file:
+            if JobFormat(state['format']) is JobFormat.XLSX:
+                file_name = report_utils.save_report_file(
+                    request, output_file,
+                    on_progress=lambda progress: _update_state(
+                        job_id, progress=round(min(progress, 1), 3)))
+            else:
+                file_name = report_utils.save_report(request, output_file)
+
+        _update_state(job_id, status=JobStatus.DONE.value,
+                      progress=1, file_name=file_name)
+    except Exception as e:
+        _update_state(job_id, status=JobStatus.FAILED.value, error=str(e))
+    finally:
+        _release_key(state['key'], job_id)
+        connections.close_all()
+
+
+def submit_job(request) -> JobInfo:
+    """create report job or return identical active job"""
+    clean_jobs()
+
+    login = login_utils.get_login(request.user)
+    params = {}
+    for name in _REPORT_PARAMS:
+        value = request.data.get(name, request.GET.get(name))
+        if value not in (None, ''):
+            params.update({name: str(value)})
+
+    job_format = None
+    try:
+        job_format = JobFormat(request.data.get('format', JobFormat.XLSX.value))
+    except ValueError:
+        job_format = JobFormat.XLSX
+
+    os.makedirs(os.path.join(_get_root(), _KEYS_DIR), exist_ok=True)
+
+    job_id = uuid.uuid4().hex
+    key = _get_key(login, params, job_format)
+    active_job_id = _acquire_key(key, job_id)
+
+    result = None
+    if active_job_id is not None:
+        result = JobInfo(_read_state(active_job_id))
+    else:
+        os.makedirs(_get_job_dir(job_id))
+        state = {'id': job_id,
+                 'key': key,
+                 'user': request.user.id,
+                 'status': JobStatus.QUEUED.value,
+                 'progress': 0,
+                 'format': job_format.value,
+                 'params': params,
+                 'file_name': None,
+                 'error': None,
+                 'created': time.time(), }
+        _write_state(state)
+        _start(job_id)
+
+        result = JobInfo(state)
+
+    return result
+
+
+def _get_user_state(request, job_id: str) -> Optional[dict]:
+    """job state if job is available for user"""
+    state = _read_state(job_id)
+    if (state is not None) and (state.get('user') != request.user.id):
+        state = None
+    if state is not None:
+        state = _expire_lost(state)
+
+    return state
+
+
+def get_job(request, job_id: str) -> Optional[JobInfo]:
+    """job info or None if job is not exists"""
+    state = _get_user_state(request, job_id)
+    return None if state is None else JobInfo(state)
+
+
+def iterate_job_events(request, job_id: str) -> Iterator[str]:
+    """job info as server-sent events until job is finished"""
+    started = time.time()
+    last_data = None
+    while True:
+        state = _get_user_state(request, job_id)
+        data = json.dumps(None if state is None else vars(JobInfo(state)))
+        if data != last_data:
+            last_data = data
+            yield 'data: %s\n\n' % data
+
+        if (state is None) or (state.get('status') in (JobStatus.DONE.value,
+                                                        JobStatus.FAILED.value)) \
+                or ((time.time() - started) > _EVENTS_MAX_DURATION):
+            break
+
+        time.sleep(_EVENTS_POLL_INTERVAL)
+
+
+def get_job_result(request, job_id: str) -> Optional[FileResponse]:
+    """file of finished job or None"""
+    state = _get_user_state(request, job_id)
+    result = None
+    if (state is not None) and (state.get('status') == JobStatus.DONE.value):
+        result = FileResponse(
+            open(os.path.join(_get_job_dir(job_id), _RESULT_FILE), 'rb'),
+            as_attachment=True,
+            filename=state.get('file_name'),
+            content_type=_CONTENT_TYPES[JobFormat(state.get('format'))])
+        result['Access-Control-Allow-Headers'] = 'Content-Type'
+
+    return result
+
+
+def clean_jobs(ttl: Optional[int] = None) -> int:
+    """remove jobs not updated for ttl seconds, return count of removed jobs"""
+    if ttl is None:
+        ttl = settings.REPORT_JOBS_TTL
+
+    root = _get_root()
+    removed = 0
+    if os.path.isdir(root):
+        expired = time.time() - ttl
+        for job_id in os.listdir(root):
+            if _is_job_id(job_id):
+                job_dir = _get_job_dir(job_id)
+                state = _read_state(job_id)
+                updated = os.path.getmtime(job_dir) if state is None \
+                    else state.get('updated', 0)
+                if updated < expired:
+                    shutil.rmtree(job_dir, ignore_errors=True)
+                    removed += 1
+
+    return removed
@@ -0,0 +1,277 @@
+"""store of pre-generated standard report files"""
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import List, Optional
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+
+from idenick_app.models import Login, Organization
+from idenick_rest_api_v0.classes.utils import (login_utils, report_utils,
+                                               request_utils)
+
+_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+_MANIFEST_EXTENSION = '.json'
+_DATE_FORMAT = '%Y%m%d'
+_REPORT_TYPE = 'ORGANIZATION'
+# params which make report non-standard, with them report is generated live;
+# stream flag does not change content of report file
+_CUSTOM_PARAMS = ('from', 'count', 'perPage', 'split',)
+# reports are stored without summary flag, requests with it are generated live
+_SUMMARY_FLAG = 'summary'
+
+
+@dataclass
+class StandardRange:
+    """date range of report generated in advance"""
+
+    def __init__(self, name: str, start: date, end: date):
+        self.name = name
+        self.start = start
+        self.end = end
+
+
+@dataclass
+class StoredReport:
+    """report file of store and its manifest"""
+
+    def __init__(self, manifest: dict, path: str):
+        self.organization = manifest.get('organization')
+        self.start = manifest.get('start')
+        self.end = manifest.get('end')
+        self.file_name = manifest.get('file_name')
+        self.sha256 = manifest.get('sha256')
+        self.size = manifest.get('size')
+        self.created = manifest.get('created')
+        self.path = path
+
+    @property
+    def etag(self) -> str:
+        return '"%s"' % self.sha256
+
+
+def get_standard_ranges(today: Optional[date] = None) -> List[StandardRange]:
+    """yesterday and month to date; ranges end yesterday, so they are complete
+    when reports are generated at night"""
+    if today is None:
+        today = date.today()
+    yesterday = today - timedelta(days=1)
+
+    return [StandardRange('yesterday', yesterday, yesterday),
+            StandardRange('month', yesterday.replace(day=1), yesterday)]
+
+
+def _get_root() -> str:
+    return settings.REPORT_STORE_ROOT
+
+
+def _get_organization_dir(organization_id: int) -> str:
+    return os.path.join(_get_root(), str(organization_id))
+
+
+def _get_manifest_path(organization_id: int, start: str, end: str) -> str:
+    return os.path.join(_get_organization_dir(organization_id),
+                        '%s_%s%s' % (start, end, _MANIFEST_EXTENSION))
+
+
+def _get_file_name(start: str, end: str, sha256: str) -> str:
+    return '%s_%s.%s.xlsx' % (start, end, sha256)
+
+
+def _read_manifest(path: str) -> Optional[dict]:
+    result = None
+    try:
+        with open(path, encoding='utf-8') as file:
+            result = json.load(file)
+    except (OSError, ValueError):
+        pass
+
+    return result
+
+
+def _write_manifest(path: str, manifest: dict) -> None:
+    """write manifest atomically, readers never see partial file"""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file)
+    os.replace(temp_path, path)
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _get_file_hash(path: str) -> str:
+    result = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            result.update(chunk)
+
+    return result.hexdigest()
+
+
+def generate_report(organization_id: int, standard_range: StandardRange,
+                    user_id: int) -> StoredReport:
+    """generate report of organization for range and replace stored one;
+    file name contains content hash, so file being served is never overwritten"""
+    organization_dir = _get_organization_dir(organization_id)
+    os.makedirs(organization_dir, exist_ok=True)
+
+    start = standard_range.start.strftime(_DATE_FORMAT)
+    end = standard_range.end.strftime(_DATE_FORMAT)
+    request = request_utils.get_params_request(
+        {'type': _REPORT_TYPE, 'id': str(organization_id), 'start': start, 'end': end},
+        user_id)
+
+    temp_path = os.path.join(organization_dir, '%s_%s.xlsx.tmp' % (start, end))
+    with open(temp_path, 'wb') as output_file:
+        file_name = report_utils.save_report_file(request, output_file)
+    sha256 = _get_file_hash(temp_path)
+    path = os.path.join(organization_dir, _get_file_name(start, end, sha256))
+    os.replace(temp_path, path)
+
+    manifest_path = _get_manifest_path(organization_id, start, end)
+    previous = _read_manifest(manifest_path)
+    manifest = {'organization': organization_id,
+                'range': standard_range.name,
+                'start': start,
+                'end': end,
+                'summary': False,
+                'file_name': file_name,
+                'sha256': sha256,
+                'size': os.path.getsize(path),
+                'created': time.time(), }
+    _write_manifest(manifest_path, manifest)
+
+    if (previous is not None) and (previous.get('sha256') != sha256):
+        _remove_file(os.path.join(organization_dir,
+                                  _get_file_name(start, end, previous.get('sha256'))))
+
+    return StoredReport(manifest, path)
+
+
+def generate_reports(user_id: int, today: Optional[date] = None,
+                     organizations_ids: Optional[List[int]] = None) -> List[StoredReport]:
+    """generate standard reports of active organizations"""
+    organizations = Organization.objects.filter(dropped_at=None)
+    if organizations_ids is not None:
+        organizations = organizations.filter(id__in=organizations_ids)
+
+    result = []
+    ranges = get_standard_ranges(today)
+    for organization_id in organizations.order_by('id').values_list('id', flat=True):
+        for standard_range in ranges:
+            result.append(generate_report(organization_id, standard_range, user_id))
+
+    return result
+
+
+def clean_reports(today: Optional[date] = None) -> int:
+    """remove stored reports out of standard ranges and files without manifest,
+    return count of removed files"""
+    ranges = set((standard_range.start.strftime(_DATE_FORMAT),
+                  standard_range.end.strftime(_DATE_FORMAT))
+                 for standard_range in get_standard_ranges(today))
+    removed = 0
+    root = _get_root()
+    if os.path.isdir(root):
+        for organization_name in os.listdir(root):
+            organization_dir = os.path.join(root, organization_name)
+            if not os.path.isdir(organization_dir):
+                continue
+
+            actual_files = set()
+            for name in os.listdir(organization_dir):
+                if name.endswith(_MANIFEST_EXTENSION):
+                    manifest_path = os.path.join(organization_dir, name)
+                    manifest = _read_manifest(manifest_path)
+                    if (manifest is not None) \
+                            and ((manifest.get('start'), manifest.get('end')) in ranges):
+                        actual_files.add(name)
+                        actual_files.add(_get_file_name(
+                            manifest['start'], manifest['end'], manifest.get('sha256')))
+
+            for name in os.listdir(organization_dir):
+                if name not in actual_files:
+                    _remove_file(os.path.join(organization_dir, name))
+                    removed += 1
+
+    return removed
+
+
+def _get_organization_id(request) -> Optional[int]:
+    """organization of standard report request available for user or None"""
+    result = None
+    is_standard = (request_utils.get_request_param(request, 'type') == _REPORT_TYPE) \
+        and all(request_utils.get_request_param(request, param) is None
+                for param in _CUSTOM_PARAMS) \
+        and (_SUMMARY_FLAG not in request.GET)
+    if is_standard:
+        organization_id = request_utils.get_request_param(request, 'id', True)
+        login = login_utils.get_login(request.user)
+        if (organization_id is not None) and ((login.role == Login.ADMIN) or (
+                login.organization_id == organization_id)):
+            result = organization_id
+
+    return result
+
+
+def get_stored_report(request) -> Optional[StoredReport]:
+    """stored report with same organization and dates as request or None;
+    reports older than REPORT_STORE_MAX_AGE seconds are not used"""
+    result = None
+    organization_id = _get_organization_id(request)
+    start = request_utils.get_request_param(request, 'start')
+    end = request_utils.get_request_param(request, 'end')
+    if (organization_id is not None) and (start is not None) and (end is not None):
+        manifest = _read_manifest(_get_manifest_path(organization_id, start, end))
+        # reports stored before summary flag was recorded were generated with it
+        if (manifest is not None) and (manifest.get('summary', True) is False) \
+                and ((time.time() - manifest.get('created', 0)) <= settings.REPORT_STORE_MAX_AGE):
+            path = os.path.join(_get_organization_dir(organization_id),
+                                _get_file_name(start, end, manifest.get('sha256')))
+            if os.path.isfile(path):
+                result = StoredReport(manifest, path)
+
+    return result
+
+
+def _get_sendfile_response(report: StoredReport) -> HttpResponse:
+    """empty response, file is sent by web server by X-Sendfile or X-Accel-Redirect"""
+    header = settings.REPORT_STORE_SENDFILE_HEADER
+    result = HttpResponse(content_type=_CONTENT_TYPE)
+    if header == 'X-Accel-Redirect':
+        result[header] = settings.REPORT_STORE_SENDFILE_URL.rstrip('/') + '/' + '/'.join(
+            os.path.relpath(report.path, _get_root()).split(os.sep))
+    else:
+        result[header] = report.path
+    result['Content-Disposition'] = "attachment; filename*=utf-8''%s" % quote(report.file_name)
+
+    return result
+
+
+def get_stored_report_response(request) -> Optional[HttpResponse]:
+    """response with stored report file or None if request is not standard"""
+    report = get_stored_report(request)
+    result = None
+    if report is not None:
+        if request_utils.is_not_modified(request, report.etag):
+            result = HttpResponseNotModified()
+        elif settings.REPORT_STORE_SENDFILE_HEADER:
+            result = _get_sendfile_response(report)
+        else:
+            result = FileResponse(open(report.path, 'rb'), as_attachment=True,
+                                  filename=report.file_name, content_type=_CONTENT_TYPE)
+        result['ETag'] = report.etag
+        result['Cache-Control'] = 'private, no-cache'
+        result['Access-Control-Allow-Headers'] = 'Content-Type'
+
+    return result
@@ -1,25 +1,41 @@
 """report utils"""
+import base64
 import io
 import json
 import math
+import multiprocessing
+import multiprocessing.util
+import tempfile
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dataclasses import dataclass
-from datetime import datetime, time, timedelta
+from datetime import date, datetime, time, timedelta
 from enum import Enum
-from typing import Dict, List, Optional, Set
+from itertools import groupby
+from typing import Dict, Iterator, Iterable, List, Optional, Set, Tuple
 
+import django
 import xlsxwriter
-from django.db import connection, reset_queries
-from django.db.models import CharField, Count, F, Func, Value
-from django.db.models.functions import Concat
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, reset_queries
+from django.db.models import Count, Q
 from django.http import FileResponse
+from rest_framework import exceptions
 
-from idenick_app.classes.utils import date_utils
+from idenick_app.classes.utils import (attendance_utils, date_utils,
+                                       querylog_utils)
+from idenick_app.classes.utils.models_utils import \
+    get_related_entities_count_expression
 from idenick_app.models import (Checkpoint, Checkpoint2Organization,
-                                Department, Device, Device2Organization,
-                                Employee, Employee2Department,
-                                Employee2Organization, EmployeeRequest, Login,
-                                Organization)
-from idenick_rest_api_v0.classes.utils import login_utils, request_utils, utils
+                                DailyAttendance, Department, Device,
+                                Device2Organization, Employee,
+                                Employee2Department, Employee2Organization,
+                                EmployeeRequest, Login, Organization)
+from idenick_rest_api_v0.classes.utils import (count_utils, login_utils,
+                                               page_index_utils, request_utils,
+                                               timing_utils, utils)
 from idenick_rest_api_v0.serializers import (department_serializers,
                                              device_serializers,
                                              employee_request_serializers,
@@ -27,6 +43,10 @@ from idenick_rest_api_v0.serializers import (department_serializers,
                                              organization_serializers)
 
 
+# rows of request events loaded by one query in export
+EXPORT_CHUNK_SIZE = 2000
+
+
 class _ReportType(Enum):
     EMPLOYEE = 'EMPLOYEE'
     DEPARTMENT = 'DEPARTMENT'
@@ -40,19 +60,90 @@ class _ReportType(Enum):
 class _RequestsQuerysetInfo:
     def __init__(self, queryset,
                  name: str,
-                 count: int,
+                 count: Optional[int],
                  organization: Optional[Organization] = None,
-                 department: Optional[Department] = None):
+                 department: Optional[Department] = None,
+                 next_cursor: Optional[str] = None,
+                 previous_cursor: Optional[str] = None,
+                 count_exact: Optional[bool] = True,
+                 from_date: Optional[date] = None,
+                 to_date: Optional[date] = None):
         self.queryset = queryset
         self.organization = organization
         self.department = department
         self.name = name
         self.count = count
+        self.count_exact = count_exact
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.from_date = from_date
+        self.to_date = to_date
+
+
+def _encode_cursor(employee_request: dict) -> str:
+    """opaque cursor of request position in (moment, id) order"""
+    value = '%s|%d' % (employee_request['moment'].isoformat(), employee_request['id'])
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """return (moment, id) from cursor, raise ValidationError if cursor is invalid"""
+    result = None
+    try:
+        moment, request_id = base64.urlsafe_b64decode(
+            cursor.encode()).decode().split('|')
+        result = (datetime.fromisoformat(moment), int(request_id))
+    except ValueError:
+        raise exceptions.ValidationError('Некорректный курсор страницы')
+
+    return result
+
+
+def _get_cursor_page(report_queryset, per_page: Optional[int],
+                     after: Optional[str] = None, before: Optional[str] = None):
+    """return (page, next cursor, previous cursor) of queryset ordered by (-moment, -id)"""
+    after_position = None if after is None else _decode_cursor(after)
+    before_position = None if before is None else _decode_cursor(before)
+
+    queryset = None
+    if before_position is not None:
+        moment, request_id = before_position
+        queryset = report_queryset\
+            .filter(Q(moment__gt=moment) | Q(moment=moment, id__gt=request_id))\
+            .order_by('moment', 'id')
+    else:
+        queryset = report_queryset.order_by('-moment', '-id')
+        if after_position is not None:
+            moment, request_id = after_position
+            queryset = queryset.filter(
+                Q(moment__lt=moment) | Q(moment=moment, id__lt=request_id))
+
+    page = list(queryset if per_page is None else queryset[:per_page + 1])
+    has_more = (per_page is not None) and (len(page) > per_page)
+    if has_more:
+        page = page[:per_page]
+
+    next_cursor = None
+    previous_cursor = None
+    if before_position is not None:
+        page.reverse()
+        if page:
+            next_cursor = _encode_cursor(page[-1])
+            if has_more:
+                previous_cursor = _encode_cursor(page[0])
+    elif page:
+        if has_more:
+            next_cursor = _encode_cursor(page[-1])
+        if after_position is not None:
+            previous_cursor = _encode_cursor(page[0])
+
+    return page, next_cursor, previous_cursor
 
 
 def _get_employees_requests(request,
                             without_none: Optional[bool] = False,
-                            without_pagination: Optional[bool] = False) -> _RequestsQuerysetInfo:
+                            without_pagination: Optional[bool] = False,
+                            with_count: Optional[bool] = True) -> _RequestsQuerysetInfo:
     entity_id = request_utils.get_request_param(request, 'id', True)
     entity_type = _ReportType(
         request_utils.get_request_param(request, 'type'))
@@ -60,22 +151,40 @@ def _get_employees_requests(request,
     page = None
     page_count = None
     per_page = None
+    after = None
+    before = None
+    cursor_mode = False
     if not without_pagination:
         page = request_utils.get_request_param(request, 'from', True)
         page_count = request_utils.get_request_param(request, 'count', True, 1)
         per_page = request_utils.get_request_param(request, 'perPage', True)
 
+        after = request_utils.get_request_param(request, 'after')
+        before = request_utils.get_request_param(request, 'before')
+        cursor_mode = ('cursor' in request.GET) or (
+            after is not None) or (before is not None)
+
+    count_mode = count_utils.CountMode.NONE
+    if with_count:
+        count_mode = count_utils.get_count_mode(
+            request, count_utils.CountMode.NONE if cursor_mode else count_utils.CountMode.EXACT)
+
     from_date = None
     from_time = request_utils.get_request_param(request, 'start')
     if from_time is not None:
         from_date = datetime.strptime(
-            from_time, "%Y%m%d")
+            from_time, "%Y%m%d").date()
 
     to_date = None
     to_time = request_utils.get_request_param(request, 'end')
     if to_time is not None:
-        to_date = (datetime.strptime(
-            to_time, "%Y%m%d") + timedelta(days=1, microseconds=-1))
+        to_date = datetime.strptime(
+            to_time, "%Y%m%d").date()
+
+    # reports, lists and counts are built from querylog only, range starts after archive
+    first_date = querylog_utils.get_first_complete_date()
+    if (first_date is not None) and ((from_date is None) or (from_date < first_date)):
+        from_date = first_date
 
     report_queryset = EmployeeRequest.objects.all()
     if without_none:
@@ -83,6 +192,7 @@ def _get_employees_requests(request,
 
     organization = None
     department = None
+    organization_filter = None
     login = login_utils.get_login(request.user)
     if (login.role == Login.CONTROLLER) or (login.role == Login.REGISTRATOR):
         organization_filter = login.organization.id
@@ -104,7 +214,7 @@ def _get_employees_requests(request,
             department_employees = Employee2Department.objects.filter(
                 department_id=entity_id)
             if (organization is None) and department_employees.exists():
-                organization = department_employees.first().department.organization
+                organization = department_employees.first().department.organization_id
 
             employees = Employee.objects.filter(
                 id__in=department_employees.values_list('employee_id', flat=True))
@@ -127,7 +237,7 @@ def _get_employees_requests(request,
                     device_id=entity_id)
             else:
                 report_queryset = EmployeeRequest.objects.none()
-        elif entity_type == _ReportType.Checkpoint:
+        elif entity_type == _ReportType.CHECKPOINT:
             name = 'checkpoints '
 
             if (organization_filter is None) \
@@ -156,23 +266,38 @@ def _get_employees_requests(request,
 
     report_queryset = report_queryset.order_by('-moment')
 
-    if from_date is not None:
-        report_queryset = report_queryset.filter(moment__gte=from_date)
-    if to_date is not None:
-        report_queryset = report_queryset.filter(moment__lte=to_date)
+    report_queryset = querylog_utils.filter_local_dates(report_queryset, from_date, to_date)
 
+    next_cursor = None
+    previous_cursor = None
     paginated_report_queryset = report_queryset.all()
-    if (page is not None) and (per_page is not None):
+    if not without_pagination:
+        # listed requests are serialized from values with date info shifted by database
+        paginated_report_queryset = report_queryset.with_local_moment()\
+            .values(*employee_request_serializers.VALUES_FIELDS)
+    if cursor_mode:
+        paginated_report_queryset, next_cursor, previous_cursor = _get_cursor_page(
+            paginated_report_queryset,
+            None if per_page is None else int(per_page) * int(page_count),
+            after=after, before=before)
+    elif (page is not None) and (per_page is not None):
         offset = int(page) * int(per_page)
         limit = offset + int(per_page) * int(page_count)
         paginated_report_queryset = paginated_report_queryset[offset:limit]
 
+    count_info = count_utils.get_count(report_queryset, count_mode)
+
     return _RequestsQuerysetInfo(queryset=paginated_report_queryset,
                                  name=name,
-                                 count=report_queryset.count(),
+                                 count=count_info.value,
+                                 count_exact=count_info.exact,
                                  organization=None if organization is None
                                  else Organization.objects.get(id=organization),
-                                 department=department,)
+                                 department=department,
+                                 next_cursor=next_cursor,
+                                 previous_cursor=previous_cursor,
+                                 from_date=from_date,
+                                 to_date=to_date,)
 
 
 class _HeaderName(Enum):
@@ -207,63 +332,121 @@ class _HeaderInfo:
         self.sub = sub
 
 
-def _find_report_department(request: EmployeeRequest,
-                            organization: Optional[Organization] = None) -> Optional[Department]:
-    """return department from report line"""
-    department = None
-    employee = request.employee
-
-    organizations = None
-    if organization is None:
-        employee_organizations = set(Employee2Organization.objects.filter(
-            employee=employee).values_list('organization_id', flat=True))
-        if not employee_organizations:
-            return None
-
-        device = request.device
-        device_organizations = set(Device2Organization.objects.filter(
-            device=device).values_list('organization_id', flat=True))
-        employee_organizations = employee_organizations.intersection(
-            device_organizations)
-
-        if not employee_organizations:
-            return None
-
-        organizations = Organization.objects.filter(
-            id__in=employee_organizations)
-
-        if not organizations:
-            return None
-    else:
-        organizations = [organization]
+class _DepartmentResolver:
+    """departments of report lines by (employee, device), built once per report.
+    Relations are bulk loaded for new employees and devices, lines are resolved
+    from dicts: first department (by id) of employee shown in report in organization
+    of report or in common organization of employee and device"""
+
+    def __init__(self, organization: Optional[Organization] = None):
+        self._organization = organization
+        self._employee_departments: Dict[int, List[Tuple[int, int]]] = {}
+        self._employee_organizations: Dict[int, Set[int]] = {}
+        self._device_organizations: Dict[int, Set[int]] = {}
+        self._departments: Dict[int, Department] = {}
+        self._lines_departments: Dict[Tuple[int, Optional[int]], Optional[Department]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def prepare(self, lines_keys: Iterable[Tuple[int, Optional[int]]]) -> None:
+        """bulk load relations of employees and devices not loaded before"""
+        new_employees_ids = set()
+        new_devices_ids = set()
+        for employee_id, device_id in lines_keys:
+            if employee_id not in self._employee_departments:
+                new_employees_ids.add(employee_id)
+            if (self._organization is None) and (device_id not in self._device_organizations):
+                new_devices_ids.add(device_id)
+
+        if new_employees_ids:
+            self.loads += 1
+            employee_departments_info = Employee2Department.objects\
+                .filter(employee_id__in=new_employees_ids, department__show_in_report=True)
+            if self._organization is not None:
+                employee_departments_info = employee_departments_info.filter(
+                    department__organization=self._organization)
+
+            for employee_id in new_employees_ids:
+                self._employee_departments.update({employee_id: []})
+            departments_ids = set()
+            for employee_id, department_id, organization_id in employee_departments_info\
+                    .values_list('employee_id', 'department_id', 'department__organization_id')\
+                    .order_by('department_id'):
+                self._employee_departments[employee_id].append(
+                    (department_id, organization_id))
+                departments_ids.add(department_id)
+
+            new_departments_ids = departments_ids.difference(self._departments)
+            if new_departments_ids:
+                self._departments.update(
+                    Department.objects.in_bulk(new_departments_ids))
+
+            if self._organization is None:
+                for employee_id in new_employees_ids:
+                    self._employee_organizations.update({employee_id: set()})
+                for employee_id, organization_id in Employee2Organization.objects\
+                        .filter(employee_id__in=new_employees_ids)\
+                        .values_list('employee_id', 'organization_id'):
+                    self._employee_organizations[employee_id].add(
+                        organization_id)
+
+        if new_devices_ids:
+            self.loads += 1
+            for device_id in new_devices_ids:
+                self._device_organizations.update({device_id: set()})
+            for device_id, organization_id in Device2Organization.objects\
+                    .filter(device_id__in=new_devices_ids)\
+                    .values_list('device_id', 'organization_id'):
+                self._device_organizations[device_id].add(organization_id)
+
+    def resolve(self, employee_id: int, device_id: Optional[int]) -> Optional[Department]:
+        """department of line; relations of line must be prepared"""
+        key = (employee_id, device_id)
+        result = None
+        if key in self._lines_departments:
+            self.hits += 1
+            result = self._lines_departments[key]
+        else:
+            self.misses += 1
+            organizations = None
+            if self._organization is not None:
+                organizations = {self._organization.id}
+            else:
+                organizations = self._employee_organizations.get(employee_id, set())\
+                    .intersection(self._device_organizations.get(device_id, set()))
 
-    employee_departments = Employee2Department.objects.filter(
-        employee=employee).values_list('department_id', flat=True)
-    if not employee_departments.exists():
-        return None
+            for department_id, organization_id in self._employee_departments.get(employee_id, []):
+                if organization_id in organizations:
+                    result = self._departments[department_id]
+                    break
 
-    departments = Department.objects.filter(
-        id__in=employee_departments, organization_id__in=organizations, show_in_report=True)
+            self._lines_departments.update({key: result})
 
-    if departments.exists():
-        department = departments.first()
+        return result
 
-    return department
+    @property
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'loads': self.loads}
 
 
 @dataclass
 class RequestsInfo:
-    def __init__(self, queryset, count, extra):
-        self.data = employee_request_serializers.ModelSerializer(
-            queryset, many=True).data
+    def __init__(self, data: List[dict], count, extra,
+                 next_cursor: Optional[str] = None, previous_cursor: Optional[str] = None,
+                 count_exact: Optional[bool] = True):
+        self.data = data
         self.count = count
+        self.count_exact = count_exact
         self.extra = extra
+        self.next = next_cursor
+        self.previous = previous_cursor
 
 
 def get_employees_requests(request) -> RequestsInfo:
-    """get request events"""
+    """get request events; requests, employees and devices are loaded by one query each"""
     info = _get_employees_requests(request)
-    report_queryset = info.queryset
+    requests_values = list(info.queryset)
 
     login = login_utils.get_login(request.user)
 
@@ -277,10 +460,9 @@ def get_employees_requests(request) -> RequestsInfo:
 
     extra = {}
 
-    employees_ids = set(
-        report_queryset.values_list('employee_id', flat=True))
+    employees_ids = set(r['employee_id'] for r in requests_values)
     employees_queryset = Employee.objects.filter(
-        id__in=employees_ids)
+        id__in=employees_ids).with_serialized_info()
 
     extra.update(employees=utils.get_objects_by_id(
         employee_serializers.ModelSerializer, queryset=employees_queryset))
@@ -296,129 +478,476 @@ def get_employees_requests(request) -> RequestsInfo:
             Department.objects.get(id=entity_id)).data})
 
     if show_device:
-        devices_ids = set(report_queryset.values_list('device_id', flat=True))
+        devices_ids = set(r['device_id'] for r in requests_values)
+        devices_queryset = Device.objects.filter(id__in=devices_ids).annotate(
+            active_organizations_count=get_related_entities_count_expression(
+                Device2Organization, 'device', 'organization'))
         extra.update(devices=utils.get_objects_by_id(
-            device_serializers.ModelSerializer, clazz=Device, ids=devices_ids))
+            device_serializers.ModelSerializer, queryset=devices_queryset))
 
-    return RequestsInfo(queryset=report_queryset, count=info.count, extra=extra)
+    data = [employee_request_serializers.serialize_values(values) for values in requests_values]
+
+    return RequestsInfo(data=data, count=info.count, count_exact=info.count_exact,
+                        extra=extra,
+                        next_cursor=info.next_cursor, previous_cursor=info.previous_cursor)
+
+
+def get_employees_requests_rows(request,
+                                chunk_size: int = EXPORT_CHUNK_SIZE) -> Tuple[str, Iterator[dict]]:
+    """return (name, rows) of all request events without pagination;
+    rows are values loaded by keyset chunks in (-moment, -id) order"""
+    info = _get_employees_requests(
+        request, without_pagination=True, with_count=False)
+    queryset = info.queryset.with_local_moment().order_by('-moment', '-id')\
+        .values('id', 'employee_id', 'device_id', 'moment', 'request_type', 'response_type',
+                'description', 'algorithm_type', 'local_moment', 'device_timezone')
+
+    def iterate_rows():
+        position = None
+        while True:
+            chunk_queryset = queryset
+            if position is not None:
+                moment, request_id = position
+                chunk_queryset = chunk_queryset.filter(
+                    Q(moment__lt=moment) | Q(moment=moment, id__lt=request_id))
+
+            chunk = list(chunk_queryset[:chunk_size])
+            yield from chunk
+
+            if len(chunk) < chunk_size:
+                break
+            position = (chunk[-1]['moment'], chunk[-1]['id'])
+
+    return info.name, iterate_rows()
 
 
-@dataclass
 class _ReportLine:
+    """report line; shown values are computed from local moments on access,
+    employee, department and names of days are shared between lines"""
+    __slots__ = ('id', 'employee', 'department', 'utc', 'is_later', 'incoming_moment',
+                 'incoming_checkpoint', 'outcoming_moment', 'outcoming_checkpoint',)
+
     def __init__(self,
                  id: int,
                  employee: Employee,
                  department: Optional[Department],
-                 utc: str,
-                 incoming_date: date_utils.DateInfo,
-                 incoming_device: Optional[Checkpoint] = None,
+                 utc: Optional[str],
+                 incoming_moment: datetime,
+                 incoming_checkpoint: Optional[str] = None,
                  is_later: bool = False,
-                 outcoming_date: Optional[date_utils.DateInfo] = None,
-                 outcoming_device: Optional[Checkpoint] = None,
+                 outcoming_moment: Optional[datetime] = None,
+                 outcoming_checkpoint: Optional[str] = None,
                  ):
         self.id = id
         self.employee = employee
         self.department = department
-
-        self.date = incoming_date.day
-        self.month = incoming_date.month
-        self.week_day = incoming_date.week_day
         self.utc = utc
-
         self.is_later = is_later
-        self.incoming_time = incoming_date.time
-        outcoming_time = None
-        time_count = None
-        if outcoming_date is None:
-            time_count = '-'
-        else:
-            outcoming_time = outcoming_date.time
-            time_count = date_utils.duration_to_str(
-                outcoming_date.date - incoming_date.date,
-                show_positive_symbol=False)
-
-        self.outcoming_time = outcoming_time
-        self.time_count = time_count
-
-        checkpoints = None
-        if (incoming_device is not None) \
-                and (incoming_device.checkpoint is not None):
-            checkpoints = incoming_device.checkpoint.name
-        else:
-            checkpoints = '-'
-
-        if (outcoming_device is not None) \
-                and (outcoming_device.checkpoint is not None):
-            checkpoints += ' / ' + outcoming_device.checkpoint.name
-        self.checkpoints = checkpoints
+        self.incoming_moment = incoming_moment
+        self.incoming_checkpoint = incoming_checkpoint
+        self.outcoming_moment = outcoming_moment
+        self.outcoming_checkpoint = outcoming_checkpoint
+
+    @property
+    def date(self) -> str:
+        return date_utils.get_day_names(self.incoming_moment.date())[1]
+
+    @property
+    def month(self) -> str:
+        return date_utils.get_day_names(self.incoming_moment.date())[2]
+
+    @property
+    def week_day(self) -> str:
+        return date_utils.get_day_names(self.incoming_moment.date())[0]
+
+    @property
+    def incoming_time(self) -> str:
+        return date_utils.get_time_name(self.incoming_moment)
+
+    @property
+    def outcoming_time(self) -> Optional[str]:
+        return None if self.outcoming_moment is None \
+            else date_utils.get_time_name(self.outcoming_moment)
+
+    @property
+    def time_count(self) -> Optional[str]:
+        return '-' if self.outcoming_moment is None else date_utils.duration_to_str(
+            self.outcoming_moment - self.incoming_moment, show_positive_symbol=False)
+
+    @property
+    def checkpoints(self) -> str:
+        result = '-' if self.incoming_checkpoint is None else self.incoming_checkpoint
+        if self.outcoming_checkpoint is not None:
+            result += ' / ' + self.outcoming_checkpoint
+
+        return result
+
+    def serialize(self) -> dict:
+        """values of line for report JSON"""
+        week_day, day, month = date_utils.get_day_names(self.incoming_moment.date())
+
+        return {'id': self.id,
+                'employee': self.employee.id,
+                'department': None if self.department is None else self.department.id,
+                'date': day,
+                'month': month,
+                'week_day': week_day,
+                'utc': self.utc,
+                'is_later': self.is_later,
+                'incoming_time': self.incoming_time,
+                'outcoming_time': self.outcoming_time,
+                'time_count': self.time_count,
+                'checkpoints': self.checkpoints}
 
 
 @dataclass
 class _ReportLinesInfo:
-    def __init__(self, lines: List[_ReportLine], count: int, organization: Organization, name: str):
+    def __init__(self, lines: Iterable[_ReportLine], count: int, organization: Organization,
+                 name: str, visible_count: Optional[int] = None,
+                 department_resolver: Optional[_DepartmentResolver] = None):
         self.lines = lines
         self.count = count
         self.organization = organization
         self.name = name
+        self.visible_count = visible_count
+        self.department_resolver = department_resolver
 
 
 class _ShortDailyInfo:
-    def __init__(self):
-        self.incoming_sequence = []
-        self._employee_2_requests = {}
-        self.lines_count = 0
+    """lines of day: incoming request, its employee and paired outcoming request
+    (0 for last unpaired request) in arrays of same length"""
+    __slots__ = ('incoming_sequence', 'employees', 'outcomings', '_open_lines',)
 
-    def add_request(self, request, employee):
-        if employee in self._employee_2_requests:
-            self._employee_2_requests[employee].append(request)
-        else:
-            self._employee_2_requests.update({employee: [request]})
-
-        if (len(self._employee_2_requests[employee]) % 2) == 1:
+    def __init__(self):
+        self.incoming_sequence = array('q')
+        self.employees = array('q')
+        self.outcomings = array('q')
+        # line of employee waiting for outcoming request
+        self._open_lines: Dict[int, int] = {}
+
+    @property
+    def lines_count(self) -> int:
+        return len(self.incoming_sequence)
+
+    def add_request(self, request: int, employee: int):
+        """odd requests of employee are incoming, even are outcoming"""
+        line = self._open_lines.pop(employee, None)
+        if line is None:
+            self._open_lines[employee] = len(self.incoming_sequence)
             self.incoming_sequence.append(request)
-            self.lines_count += 1
-
-    def get_employee_sequence(self, employee) -> List[int]:
-        return self._employee_2_requests[employee]
+            self.employees.append(employee)
+            self.outcomings.append(0)
+        else:
+            self.outcomings[line] = request
 
 
 class _RequestSequenceByDate:
+    """daily lines by date; dates are ordered from newest to oldest"""
+    __slots__ = ('_map', '_dates', '_newest_first',)
+
     def __init__(self):
         self._map: Dict[str, _ShortDailyInfo] = {}
-        self.dates: List[str] = []
-        self.employees: Set[int] = set()
-        self.requests: Set[int] = set()
+        self._dates: List[str] = []
+        self._newest_first: Optional[List[str]] = None
+
+    @property
+    def dates(self) -> List[str]:
+        if self._newest_first is None:
+            self._newest_first = self._dates[::-1]
+
+        return self._newest_first
 
     def update(self, date: str, request: int, employee: int):
-        if not date in self._map:
-            self.dates.insert(0, date)
-            self._map.update({date: _ShortDailyInfo()})
-        self._map[date].add_request(request, employee)
-        self.employees.add(employee)
-        self.requests.add(request)
+        daily = self._map.get(date)
+        if daily is None:
+            daily = _ShortDailyInfo()
+            self._map[date] = daily
+            self._dates.append(date)
+            self._newest_first = None
+        daily.add_request(request, employee)
 
     def get_daily(self, date: str) -> _ShortDailyInfo:
         return self._map[date]
 
+    @staticmethod
+    def merge(*sequences: '_RequestSequenceByDate') -> '_RequestSequenceByDate':
+        """sequences of different dates in one"""
+        result = _RequestSequenceByDate()
+        for sequence in sequences:
+            result._map.update(sequence._map)
+        # short dates are ordered as strings
+        result._dates = sorted(result._map)
+
+        return result
+
+
+class _ReportLinesBuilder:
+    """build report lines of dates from bulk loaded requests"""
+    LAZY_CHUNK_LINES = 5000
+
+    def __init__(self, report_data: _RequestsQuerysetInfo,
+                 sequences: _RequestSequenceByDate, excludes: Set[int]):
+        self._report_data = report_data
+        self._sequences = sequences
+        self._excludes = excludes
+        self._organization_timesheet = report_data.organization.timesheet_start_as_duration
+        self._employees: Dict[int, Employee] = {}
+        self._checkpoints: Dict[str, str] = {}
+        self.department_resolver = _DepartmentResolver(report_data.organization)
+
+    def iterate(self, dates: List[str]) -> Iterator[_ReportLine]:
+        """yield lines of dates, loading requests by chunks of dates"""
+        chunk = []
+        chunk_lines = 0
+        for date in dates:
+            chunk.append(date)
+            chunk_lines += self._sequences.get_daily(date).lines_count
+            if chunk_lines >= _ReportLinesBuilder.LAZY_CHUNK_LINES:
+                yield from self.build(chunk)
+                chunk = []
+                chunk_lines = 0
+
+        if chunk:
+            yield from self.build(chunk)
+
+    def build(self, dates: List[str]) -> List[_ReportLine]:
+        """return lines of dates"""
+        sequences = self._sequences
+        excludes = self._excludes
+        report_data = self._report_data
+
+        visible_requests_ids = set()
+        for date in dates:
+            daily = sequences.get_daily(date)
+            for request_id, outcoming_request_id in zip(daily.incoming_sequence,
+                                                        daily.outcomings):
+                if request_id not in excludes:
+                    visible_requests_ids.add(request_id)
+                    if outcoming_request_id:
+                        visible_requests_ids.add(outcoming_request_id)
+
+        local_dates = [datetime.strptime(date, '%Y-%m-%d').date() for date in dates]
+        with timing_utils.stage('fetch'):
+            requests_info = {r.id: r for r in EmployeeRequest.objects
+                             .filter(querylog_utils.get_stamp_filter(
+                                 min(local_dates, default=None), max(local_dates, default=None)))
+                             .filter(id__in=visible_requests_ids)
+                             .with_local_moment()
+                             .values_list('id', 'device_id', 'local_moment', 'device_timezone',
+                                          'device__checkpoint__name', named=True)}
+
+            visible_employees_ids = set()
+            visible_lines_keys = set()
+            for date in dates:
+                daily = sequences.get_daily(date)
+                for request_id, employee_id in zip(daily.incoming_sequence, daily.employees):
+                    if request_id in requests_info:
+                        visible_employees_ids.add(employee_id)
+                        visible_lines_keys.add(
+                            (employee_id, requests_info[request_id].device_id))
+
+            new_employees_ids = visible_employees_ids.difference(self._employees)
+            if new_employees_ids:
+                self._employees.update(
+                    Employee.objects.in_bulk(new_employees_ids))
+            employees = self._employees
+
+            timesheets_start_info = Employee2Organization.objects\
+                .filter(
+                    employee_id__in=visible_employees_ids, organization=report_data.organization)\
+                .values_list('employee_id', 'timesheet_start')
+            timesheets_start_by_employee = {info[0]: None if info[1] is None
+                                            else date_utils.str_to_duration(info[1])
+                                            for info in timesheets_start_info}
+
+        get_department = None
+        if report_data.department is None:
+            with timing_utils.stage('departments'):
+                self.department_resolver.prepare(visible_lines_keys)
+            get_department = self.department_resolver.resolve
+        else:
+            get_department = lambda employee_id, device_id: report_data.department
+
+        with timing_utils.stage('lines'):
+            return self._build_lines(dates, requests_info, employees,
+                                     timesheets_start_by_employee, get_department)
+
+    def _build_lines(self, dates: List[str], requests_info: Dict[int, tuple],
+                     employees: Dict[int, Employee],
+                     timesheets_start_by_employee: Dict[int, Optional[timedelta]],
+                     get_department) -> List[_ReportLine]:
+        sequences = self._sequences
+        organization_timesheet = self._organization_timesheet
+        report_lines = []
+        # names of checkpoints are shared by lines instead of copies from every row
+        checkpoints = self._checkpoints
+        for date in dates:
+            laters_info_in_day = {}
+            daily = sequences.get_daily(date)
+            for request_id, employee_id, outcoming_request_id in zip(
+                    daily.incoming_sequence, daily.employees, daily.outcomings):
+                if request_id in requests_info:
+                    incoming_request = requests_info[request_id]
+                    incoming_moment = incoming_request.local_moment
+                    utc_value = date_utils.get_utc_name(incoming_request.device_timezone)
+
+                    outcoming_request = None
+                    if outcoming_request_id:
+                        outcoming_request = requests_info[outcoming_request_id]
+                        if utc_value is None:
+                            utc_value = date_utils.get_utc_name(
+                                outcoming_request.device_timezone)
+
+                    is_later = False
+                    employee_timesheet = timesheets_start_by_employee.get(
+                        employee_id)
+                    if (organization_timesheet is not None) or (employee_timesheet is not None):
+                        if not employee_id in laters_info_in_day:
+                            incoming_time_as_duration = timedelta(
+                                hours=incoming_moment.hour, minutes=incoming_moment.minute)
+                            timesheet = organization_timesheet if employee_timesheet is None \
+                                else employee_timesheet
+                            laters_info_in_day.update(
+                                {employee_id: (incoming_time_as_duration >
+                                               timesheet)})
+
+                        is_later = laters_info_in_day[employee_id]
+
+                    incoming_checkpoint = incoming_request.device__checkpoint__name
+                    outcoming_checkpoint = None if outcoming_request is None \
+                        else outcoming_request.device__checkpoint__name
+                    line = _ReportLine(id=request_id,
+                                       employee=employees[employee_id],
+                                       department=get_department(
+                                           employee_id, incoming_request.device_id),
+                                       is_later=is_later,
+                                       incoming_moment=incoming_moment,
+                                       incoming_checkpoint=None if incoming_checkpoint is None
+                                       else checkpoints.setdefault(incoming_checkpoint,
+                                                                   incoming_checkpoint),
+                                       outcoming_moment=None if outcoming_request is None
+                                       else outcoming_request.local_moment,
+                                       outcoming_checkpoint=None if outcoming_checkpoint is None
+                                       else checkpoints.setdefault(outcoming_checkpoint,
+                                                                   outcoming_checkpoint),
+                                       utc=utc_value)
+
+                    report_lines.append(line)
+
+        return report_lines
+
+
+def _get_summary_attendances(request, report_data: _RequestsQuerysetInfo,
+                             employees_ids: Optional[Iterable[int]] = None):
+    """daily attendance summary of report, summary is updated by update_daily_attendance
+    command; None if report is not organization employees report"""
+    entity_id = request_utils.get_request_param(request, 'id', True)
+    entity_type = _ReportType(
+        request_utils.get_request_param(request, 'type'))
 
-def _get_report_info(request) -> _ReportLinesInfo:
-    """get report info for users"""
+    result = None
+    if (report_data.organization is not None) and ((entity_id is None) or (entity_type in (
+            _ReportType.ORGANIZATION, _ReportType.EMPLOYEE, _ReportType.DEPARTMENT))):
+        attendances = DailyAttendance.objects.filter(
+            organization=report_data.organization)
+        if entity_id is not None:
+            if entity_type == _ReportType.EMPLOYEE:
+                attendances = attendances.filter(employee_id=entity_id)
+            elif entity_type == _ReportType.DEPARTMENT:
+                attendances = attendances.filter(
+                    employee_id__in=Employee2Department.objects.filter(department_id=entity_id)
+                    .values_list('employee_id', flat=True))
+        if employees_ids is not None:
+            attendances = attendances.filter(employee_id__in=employees_ids)
+
+        # summary of archived dates is kept, report is limited to dates of querylog
+        if report_data.from_date is not None:
+            attendances = attendances.filter(date__gte=report_data.from_date)
+        if report_data.to_date is not None:
+            attendances = attendances.filter(date__lte=report_data.to_date)
+
+        result = attendances
+
+    return result
+
+
+def _get_summary_sequences(attendances, from_date: Optional[date] = None,
+                           to_date: Optional[date] = None) -> _RequestSequenceByDate:
+    """sequences from daily attendance summary grouped by local date"""
+    if from_date is not None:
+        attendances = attendances.filter(date__gte=from_date)
+    if to_date is not None:
+        attendances = attendances.filter(date__lte=to_date)
+
+    result = _RequestSequenceByDate()
+    for day, attendances_of_date in groupby(
+            attendances.order_by('date').values('employee_id', 'date', 'pairs'),
+            key=lambda attendance: attendance['date']):
+        pairs = []
+        for attendance in attendances_of_date:
+            for pair in json.loads(attendance['pairs']):
+                pairs.append((pair[1], pair[0], pair[2], attendance['employee_id']))
+
+        short_date = day.isoformat()
+        for _, incoming_id, outcoming_id, employee_id in sorted(pairs):
+            result.update(short_date, incoming_id, employee_id)
+            if outcoming_id is not None:
+                result.update(short_date, outcoming_id, employee_id)
+
+    return result
+
+
+def _get_querylog_sequences(queryset, from_date: Optional[date] = None,
+                            to_date: Optional[date] = None) -> _RequestSequenceByDate:
+    """sequences of requests of queryset grouped by local date"""
+    short_requests = querylog_utils.filter_local_dates(queryset.all(), from_date, to_date)\
+        .order_by('local_date', 'moment')\
+        .values_list('id', 'employee_id', 'local_date')
+
+    result = _RequestSequenceByDate()
+    local_date = None
+    short_date = None
+    for request_id, employee_id, request_local_date in short_requests.iterator():
+        if request_local_date != local_date:
+            local_date = request_local_date
+            short_date = local_date.isoformat()
+        result.update(short_date, request_id, employee_id)
+
+    return result
+
+
+def _get_page_dates(lines_by_date: Dict[date, int], offset: int,
+                    limit: int) -> Tuple[Optional[date], Optional[date], int]:
+    """first and last date of lines from offset to limit in report order (newest date
+    first) and count of lines of newer dates; dates are None if page is empty"""
+    from_date = None
+    to_date = None
+    skipped = 0
+    lines_count = 0
+    for day in sorted(lines_by_date, reverse=True):
+        previous_count = lines_count
+        lines_count += lines_by_date[day]
+        if previous_count >= limit:
+            break
+        if lines_count > offset:
+            if to_date is None:
+                to_date = day
+                skipped = previous_count
+            from_date = day
+
+    return from_date, to_date, skipped
+
+
+def _get_report_info(request, lazy: Optional[bool] = False,
+                     employees_ids: Optional[Iterable[int]] = None) -> _ReportLinesInfo:
+    """get report info for users; with lazy mode lines are generated by chunks;
+    employees_ids limits report to lines of employees; without from and perPage
+    params all lines are returned"""
     report_data = _get_employees_requests(
-        request, without_none=True, without_pagination=True)
+        request, without_none=True, without_pagination=True, with_count=False)
+    if employees_ids is not None:
+        report_data.queryset = report_data.queryset.filter(employee_id__in=employees_ids)
 
-    short_requests = report_data.queryset.all().order_by('moment')\
-        .annotate(
-            short_date=Concat(Func(F("moment"), function="dayofyear"),
-                              Value(' '),
-                              Func(F("moment"), function="year")))\
-        .values('id', 'employee_id', 'short_date')
-
-    daily_requests_info_by_date = _RequestSequenceByDate()
-    for r in short_requests:
-        daily_requests_info_by_date.update(
-            r['short_date'], r['id'], r['employee_id'])
-
-    organization_timesheet = report_data.organization.timesheet_start_as_duration
     offset = None
     limit = None
     page = request_utils.get_request_param(
@@ -431,7 +960,52 @@ def _get_report_info(request) -> _ReportLinesInfo:
         offset = int(page) * int(per_page)
         limit = offset + int(per_page) * int(page_count)
     else:
-        pass  # TODO: exception
+        offset = 0
+        limit = math.inf
+
+    with timing_utils.stage('scan'):
+        attendances = None
+        unprocessed_queryset = None
+        if 'summary' in request.GET:
+            attendances = _get_summary_attendances(request, report_data, employees_ids)
+        if attendances is not None:
+            # dates of requests which are not in summary yet are read from querylog
+            unprocessed_dates = attendance_utils.get_unprocessed_dates(report_data.queryset)
+            if unprocessed_dates:
+                attendances = attendances.exclude(date__in=unprocessed_dates)
+                unprocessed_queryset = report_data.queryset.filter(
+                    local_date__in=unprocessed_dates)
+
+        # page is found by index of lines by date, only requests of its dates are loaded
+        total_count = None
+        page_dates = (None, None)
+        if limit != math.inf:
+            lines_by_date = None
+            if attendances is None:
+                lines_by_date = page_index_utils.get_lines_by_date(report_data.queryset)
+            else:
+                lines_by_date = page_index_utils.get_lines_by_date(
+                    attendances, 'date', 'requests_count')
+                if unprocessed_queryset is not None:
+                    lines_by_date = {**lines_by_date, **page_index_utils.get_lines_by_date(
+                        unprocessed_queryset)}
+            total_count = sum(lines_by_date.values())
+            from_date, to_date, skipped = _get_page_dates(lines_by_date, offset, limit)
+            page_dates = (from_date, to_date)
+            offset -= skipped
+            limit -= skipped
+
+        if (limit != math.inf) and (page_dates[0] is None):
+            daily_requests_info_by_date = _RequestSequenceByDate()
+        elif attendances is None:
+            daily_requests_info_by_date = _get_querylog_sequences(
+                report_data.queryset, *page_dates)
+        else:
+            daily_requests_info_by_date = _get_summary_sequences(attendances, *page_dates)
+            if unprocessed_queryset is not None:
+                daily_requests_info_by_date = _RequestSequenceByDate.merge(
+                    daily_requests_info_by_date,
+                    _get_querylog_sequences(unprocessed_queryset, *page_dates))
 
     lines_count = 0
     start_date_index = None
@@ -451,12 +1025,12 @@ def _get_report_info(request) -> _ReportLinesInfo:
                     start_diff = current_diff
                     start_date_index = i
 
-                remainder_diff = limit - current_diff
+                remainder_diff = limit - lines_count
                 if remainder_diff < 0:
                     end_diff = remainder_diff
                     end_date_index = i
-    visible_dates = None
-    request_ids_set = daily_requests_info_by_date.requests
+    visible_dates = []
+    excludes = set()
     if start_date_index is None:
         pass  # TODO: exception
     else:
@@ -473,93 +1047,32 @@ def _get_report_info(request) -> _ReportLinesInfo:
             first_incomings[:len(first_incomings) - start_diff])
         end_excludes = set() if end_diff == 0 else set(daily_requests_info_by_date.get_daily(
             end_date).incoming_sequence[end_diff:])
-        request_ids_set -= start_excludes.union(end_excludes)
-
-    timesheets_start_info = Employee2Organization.objects\
-        .filter(
-            employee_id__in=daily_requests_info_by_date.employees, organization=report_data.organization)\
-        .values_list('employee_id', 'timesheet_start')
-    timesheets_start_by_employee = {info[0]: None if info[1] is None
-                                    else date_utils.str_to_duration(info[1])
-                                    for info in timesheets_start_info}
-
-    queryset = EmployeeRequest.objects.filter(id__in=request_ids_set)
-    mapped_queryset = {e.id: e for e in queryset}
-    get_department = (lambda employee_request:
-                      _find_report_department(employee_request, report_data.organization))\
-        if report_data.department is None\
-        else lambda _line: report_data.department
-    report_lines = []
-    for date in visible_dates:
-        laters_info_in_day = {}
-        daily = daily_requests_info_by_date.get_daily(date)
-        for request_id in daily.incoming_sequence:
-            if request_id in mapped_queryset:
-                incoming_request = mapped_queryset[request_id]
-                incoming_device = incoming_request.device
-                incoming_date = incoming_request.get_date_info()
-                employee_id = incoming_request.employee.id
-
-                outcoming_device = None
-                outcoming_date = None
-                employee_sequence = daily.get_employee_sequence(employee_id)
-                outcoming_index = employee_sequence.index(request_id) + 1
-                outcoming_request_as_list = employee_sequence[outcoming_index:outcoming_index+1]
-                if len(outcoming_request_as_list) != 0:
-                    outcoming_request_id = outcoming_request_as_list[0]
-                    outcoming_request = mapped_queryset[outcoming_request_id]
-                    outcoming_date = outcoming_request.get_date_info()
-                    outcoming_device = outcoming_request.device
-
-                utc_value = incoming_date.utc
-                if (utc_value is None) and (outcoming_date is not None):
-                    utc_value = outcoming_date.utc
-
-                is_later = False
-                employee_timesheet = timesheets_start_by_employee[employee_id]
-                if (organization_timesheet is not None) or (employee_timesheet is not None):
-                    if not employee_id in laters_info_in_day:
-                        incoming_time_as_duration = date_utils.str_to_duration(
-                            incoming_date.time)
-                        timesheet = organization_timesheet if employee_timesheet is None \
-                            else employee_timesheet
-                        laters_info_in_day.update(
-                            {employee_id: (incoming_time_as_duration >
-                                           timesheet)})
-
-                    is_later = laters_info_in_day[employee_id]
-
-                line = _ReportLine(id=incoming_request.id,
-                                   employee=incoming_request.employee,
-                                   department=get_department(incoming_request),
-                                   is_later=is_later,
-                                   incoming_date=incoming_date,
-                                   incoming_device=incoming_device,
-                                   outcoming_date=outcoming_date,
-                                   outcoming_device=outcoming_device,
-                                   utc=utc_value)
-
-                report_lines.append(line)
+        excludes = start_excludes.union(end_excludes)
+
+    lines_builder = _ReportLinesBuilder(report_data=report_data,
+                                        sequences=daily_requests_info_by_date,
+                                        excludes=excludes)
+    report_lines = None
+    if lazy:
+        report_lines = lines_builder.iterate(visible_dates)
+    else:
+        report_lines = lines_builder.build(visible_dates)
+
+    visible_count = sum(daily_requests_info_by_date.get_daily(date).lines_count
+                        for date in visible_dates) - len(excludes)
 
     return _ReportLinesInfo(lines=report_lines,
-                            count=lines_count,
+                            count=lines_count if total_count is None else total_count,
                             organization=report_data.organization,
-                            name=report_data.name)
+                            name=report_data.name,
+                            visible_count=visible_count,
+                            department_resolver=lines_builder.department_resolver)
 
 
 @dataclass
 class ReportInfo:
     def __init__(self, info: _ReportLinesInfo):
-        def serialize(line: _ReportLine):
-            result = {}
-            result.update(vars(line))
-            result.update(employee=line.employee.id)
-            result.update(
-                department=None if line.department is None else line.department.id)
-
-            return result
-
-        self.data = list(map(serialize, info.lines))
+        self.data = [line.serialize() for line in info.lines]
         self.count = info.count
 
         employees = {}
@@ -582,7 +1095,43 @@ def get_report(request):
     """get report for users"""
     info = _get_report_info(request)
 
-    return ReportInfo(info)
+    with timing_utils.stage('serialize'):
+        return ReportInfo(info)
+
+
+def _get_report_file_row(line: _ReportLine, organization: Organization) -> List[str]:
+    """values of report file row in order of _ReportFileWriter.COLUMNS"""
+    plan_start = '-'
+    plan_end = '-'
+    plan_count = '-'
+
+    _plan_start = organization.timesheet_start_as_duration
+    _plan_end = organization.timesheet_end_as_duration
+    _plan_count = organization.timesheet_count
+    if not ((_plan_start is None) or (_plan_end is None) or (_plan_count is None)):
+        plan_start = organization.timesheet_start
+        plan_end = organization.timesheet_end
+        plan_count = date_utils.duration_to_str(
+            _plan_count, show_positive_symbol=False)
+
+    values = {
+        _HeaderName.CHECKPOINT: line.checkpoints,
+        _HeaderName.MONTH: line.month,
+        _HeaderName.DATE: line.date,
+        _HeaderName.WEEK_DAY: line.week_day,
+        _HeaderName.EMPLOYEE_NAME: line.employee.full_name,
+        _HeaderName.TIMESHEET_ID: 'нет в базе',
+        _HeaderName.POSITION: 'нет в базе',
+        _HeaderName.DEPARTMENT: '-' if line.department is None else line.department.name,
+        _HeaderName.FACT_TIME_START: line.incoming_time,
+        _HeaderName.FACT_TIME_END: '-' if line.outcoming_time is None else line.outcoming_time,
+        _HeaderName.FACT_TIME_COUNT: line.time_count,
+        _HeaderName.PLAN_TIME_START: plan_start,
+        _HeaderName.PLAN_TIME_END: plan_end,
+        _HeaderName.PLAN_TIME_COUNT: plan_count,
+    }
+
+    return [values.get(column) for column in _ReportFileWriter.COLUMNS]
 
 
 class _ReportFileWriter:
@@ -611,31 +1160,106 @@ class _ReportFileWriter:
             _SubHeaderInfo(_HeaderName.PLAN_TIME_COUNT),
         ]),
     ]
+    COLUMNS = [sub.caption for header in HEADERS for sub in header.sub]
+    SUMMARY_HEADERS = ['Подразделение', 'Сотрудников', 'Строк', 'Опозданий']
     LAST_HEADER_ROW_INDEX = 1
+    # streaming mode keeps file in memory up to this size, then moves it to disk
+    SPOOL_MAX_SIZE = 8 * 1024 * 1024
+    STREAMING_BLOCK_SIZE = 64 * 1024
+    # excel limits of sheet name
+    SHEET_NAME_MAX_SIZE = 31
+    SHEET_NAME_INVALID_CHARS = '[]:*?/\\'
+
+    PROGRESS_STEP = 500
+
+    def __init__(self, streaming: Optional[bool] = False, output_file=None,
+                 sheet_name: Optional[str] = None):
+        self._streaming = streaming
+
+        if streaming:
+            # rows are flushed to temporary files as soon as they are written
+            self._output_file = tempfile.SpooledTemporaryFile(
+                max_size=_ReportFileWriter.SPOOL_MAX_SIZE) if output_file is None \
+                else output_file
+            self._workbook = xlsxwriter.Workbook(
+                self._output_file, {'constant_memory': True})
+        else:
+            self._output_file = io.BytesIO()
+            self._workbook = xlsxwriter.Workbook(
+                self._output_file, {'in_memory': True})
+        self._sheets_names = set()
+        self._worksheet = None
+        self._row = None
+        self._columns_size = {}
 
-    def __init__(self):
-        self._row = _ReportFileWriter.LAST_HEADER_ROW_INDEX + 1
+        self.add_sheet(sheet_name)
+
+    def _get_sheet_name(self, name: Optional[str]) -> Optional[str]:
+        """unique valid excel sheet name; None for default name"""
+        result = None
+        if name is not None:
+            for char in _ReportFileWriter.SHEET_NAME_INVALID_CHARS:
+                name = name.replace(char, ' ')
+            name = name.strip(" '") or '-'
+
+            result = name[:_ReportFileWriter.SHEET_NAME_MAX_SIZE]
+            i = 1
+            while result.lower() in self._sheets_names:
+                i += 1
+                suffix = ' (%d)' % i
+                result = name[:_ReportFileWriter.SHEET_NAME_MAX_SIZE - len(suffix)] + suffix
+            self._sheets_names.add(result.lower())
+
+        return result
+
+    def _finish_sheet(self) -> None:
+        """write totals and column sizes of current sheet"""
+        if self._worksheet is not None:
+            self._worksheet.write(
+                self._row, 0, 'Кол-во: %d' % (self._row -
+                                              1 - _ReportFileWriter.LAST_HEADER_ROW_INDEX))
+            for index, column in enumerate(_ReportFileWriter.COLUMNS):
+                self._worksheet.set_column(
+                    index, index, self._get_column_size(column) + 4)
 
-        self._output_file = io.BytesIO()
-        self._workbook = xlsxwriter.Workbook(
-            self._output_file, {'in_memory': True})
-        self._worksheet = self._workbook.add_worksheet()
-        self._columns_map = {}
+            self._worksheet = None
+
+    def add_sheet(self, name: Optional[str] = None) -> None:
+        """finish current sheet and start new sheet of report lines"""
+        self._finish_sheet()
+
+        self._worksheet = self._workbook.add_worksheet(self._get_sheet_name(name))
+        self._row = _ReportFileWriter.LAST_HEADER_ROW_INDEX + 1
         self._columns_size = {}
 
+        # rows must be written in order for constant_memory mode
         i = 0
         for header in _ReportFileWriter.HEADERS:
             self._worksheet.merge_range(
                 first_row=0, first_col=i, last_row=0, last_col=(i + len(header.sub) - 1), data=header.caption)
-            for sub in header.sub:
-                self._worksheet.write(1, i, sub.caption.value)
-                self._columns_map.update({sub.caption: i})
-                self._columns_size.update(
-                    {sub.caption: len(sub.caption.value)})
-                i += 1
+            i += len(header.sub)
+
+        for i, column in enumerate(_ReportFileWriter.COLUMNS):
+            self._worksheet.write(1, i, column.value)
+            self._columns_size.update({column: len(column.value)})
+
+    def add_summary_sheet(self, name: str, rows: List[list]) -> None:
+        """finish current sheet and write sheet of rows with summary headers,
+        summary sheet is shown on opening of file"""
+        self._finish_sheet()
+
+        worksheet = self._workbook.add_worksheet(self._get_sheet_name(name))
+        sizes = [len(header) for header in _ReportFileWriter.SUMMARY_HEADERS]
+        for row, values in enumerate([_ReportFileWriter.SUMMARY_HEADERS] + rows):
+            for column, value in enumerate(values):
+                worksheet.write(row, column, value)
+                sizes[column] = max(sizes[column], len(str(value)))
+        for column, size in enumerate(sizes):
+            worksheet.set_column(column, column, size + 4)
+        worksheet.activate()
 
     def _get_column_index(self, column: _HeaderName):
-        return self._columns_map.get(column)
+        return _ReportFileWriter.COLUMNS.index(column)
 
     def _get_column_size(self, column: _HeaderName):
         return self._columns_size.get(column)
@@ -650,75 +1274,34 @@ class _ReportFileWriter:
         if self._columns_size.get(column) < len(value):
             self._columns_size.update({column: len(value)})
 
-    def write_lines(self, info: _ReportLinesInfo):
+    def write_row(self, values: List[str]) -> None:
+        """write row of values in order of COLUMNS"""
+        for column, value in zip(_ReportFileWriter.COLUMNS, values):
+            self._write_cell(self._row, column, value)
+
+        self._row += 1
+
+    def write_lines(self, info: _ReportLinesInfo, on_progress=None):
+        """write lines; on_progress is called with count of written lines"""
+        written = 0
         for line in info.lines:
-            self._write_cell(
-                self._row, _HeaderName.CHECKPOINT, line.checkpoints)
-
-            self._write_cell(self._row, _HeaderName.MONTH, line.month)
-            self._write_cell(self._row, _HeaderName.DATE, line.date)
-            self._write_cell(self._row, _HeaderName.WEEK_DAY, line.week_day)
-
-            self._write_cell(
-                self._row, _HeaderName.EMPLOYEE_NAME, line.employee.full_name)
-            self._write_cell(
-                self._row, _HeaderName.TIMESHEET_ID, 'нет в базе')
-            self._write_cell(self._row, _HeaderName.POSITION, 'нет в базе')
-            self._write_cell(
-                self._row, _HeaderName.DEPARTMENT, '-' if line.department is None
-                else line.department.name)
-
-            plan_start = '-'
-            plan_end = '-'
-            plan_count = '-'
-
-            _plan_start = info.organization.timesheet_start_as_duration
-            _plan_end = info.organization.timesheet_end_as_duration
-            _plan_count = info.organization.timesheet_count
-            if (_plan_start is None) or (_plan_end is None) or (_plan_count is None):
-                plan_start = '-'
-                plan_end = '-'
-                plan_count = '-'
-            else:
-                plan_start = info.organization.timesheet_start
-                plan_end = info.organization.timesheet_end
-                plan_count = date_utils.duration_to_str(
-                    _plan_count, show_positive_symbol=False)
-
-            self._write_cell(
-                self._row, _HeaderName.PLAN_TIME_START, plan_start)
-            self._write_cell(
-                self._row, _HeaderName.PLAN_TIME_END, plan_end)
-            self._write_cell(
-                self._row, _HeaderName.PLAN_TIME_COUNT, plan_count)
-
-            self._write_cell(
-                self._row, _HeaderName.FACT_TIME_START, line.incoming_time)
-            self._write_cell(
-                self._row, _HeaderName.FACT_TIME_END, '-' if line.outcoming_time is None
-                else line.outcoming_time)
-            self._write_cell(
-                self._row, _HeaderName.FACT_TIME_COUNT, line.time_count)
-
-            self._row += 1
+            self.write_row(_get_report_file_row(line, info.organization))
 
-    def close(self, name: str) -> FileResponse:
-        """save file as response"""
-        self._worksheet.write(
-            self._row, 0, 'Кол-во: %d' % (self._row -
-                                          1 - _ReportFileWriter.LAST_HEADER_ROW_INDEX))
-        for header in _ReportFileWriter.HEADERS:
-            for sub in header.sub:
-                index = self._get_column_index(sub.caption)
-                self._worksheet.set_column(
-                    index, index, self._get_column_size(sub.caption) + 4)
+            written += 1
+            if (on_progress is not None) and ((written % _ReportFileWriter.PROGRESS_STEP) == 0):
+                on_progress(written)
 
+    def finish(self) -> None:
+        """write totals and column sizes, then close workbook"""
+        self._finish_sheet()
         self._workbook.close()
+
+    def close(self, name: str) -> FileResponse:
+        """save file as response"""
+        self.finish()
         self._output_file.seek(0)
 
-        file_name = 'Report ' + \
-            name + ' ' + \
-            datetime.now().strftime('%Y_%m_%d') + '.xlsx'
+        file_name = get_report_file_name(name)
 
         response = FileResponse(
             streaming_content=self._output_file,
@@ -726,17 +1309,209 @@ class _ReportFileWriter:
             filename=file_name,
             content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
 
+        if self._streaming:
+            response.block_size = _ReportFileWriter.STREAMING_BLOCK_SIZE
+
         response['Access-Control-Allow-Headers'] = 'Content-Type'
 
         return response
 
 
-def get_report_file(request) -> FileResponse:
-    """report file"""
+def get_report_file_name(name: str, extension: Optional[str] = 'xlsx') -> str:
+    """name of report file for download"""
+    return 'Report ' + name + ' ' + datetime.now().strftime('%Y_%m_%d') + '.' + extension
+
+
+@dataclass
+class _DepartmentSheet:
+    """report file rows of employees of department"""
+
+    def __init__(self, name: str, rows: List[List[str]], employees_count: int,
+                 later_count: int):
+        self.name = name
+        self.rows = rows
+        self.employees_count = employees_count
+        self.later_count = later_count
+
+
+def _build_department_sheet(params: Dict[str, str], user_id: int, name: str,
+                            employees_ids: List[int]) -> _DepartmentSheet:
+    """rows of all report lines of employees"""
+    request = request_utils.get_params_request(params, user_id)
+    info = _get_report_info(request, lazy=True, employees_ids=employees_ids)
+
+    rows = []
+    employees = set()
+    later_count = 0
+    for line in info.lines:
+        rows.append(_get_report_file_row(line, info.organization))
+        employees.add(line.employee.id)
+        if line.is_later:
+            later_count += 1
+
+    return _DepartmentSheet(name=name, rows=rows, employees_count=len(employees),
+                            later_count=later_count)
+
+
+def _run_department_sheet(params: Dict[str, str], user_id: int, name: str,
+                          employees_ids: List[int]) -> _DepartmentSheet:
+    """build sheet in worker process"""
+    try:
+        return _build_department_sheet(params, user_id, name, employees_ids)
+    finally:
+        connections.close_all()
+
+
+_SPLIT_EXECUTOR = None
+
+
+def _get_split_executor() -> ProcessPoolExecutor:
+    global _SPLIT_EXECUTOR
+    if _SPLIT_EXECUTOR is None:
+        _SPLIT_EXECUTOR = ProcessPoolExecutor(
+            max_workers=settings.REPORT_SPLIT_WORKERS,
+            mp_context=multiprocessing.get_context(
+                settings.REPORT_SPLIT_START_METHOD),
+            initializer=django.setup)
+        # report jobs workers join child processes on exit, pool is stopped before
+        # its queues are closed by multiprocessing finalizers
+        multiprocessing.util.Finalize(
+            _SPLIT_EXECUTOR, _SPLIT_EXECUTOR.shutdown, exitpriority=100)
+
+    return _SPLIT_EXECUTOR
+
+
+def _get_department_sheets(request, on_progress=None) -> Tuple[str, Iterator[_DepartmentSheet]]:
+    """return (report name, sheets); sheets of departments shown in report (by name)
+    and sheet of employees without department are built in worker processes;
+    employee is in first department of organization by id, as in report lines"""
+    report_data = _get_employees_requests(
+        request, without_none=True, without_pagination=True, with_count=False)
+    if report_data.organization is None:
+        raise ValueError('Report by departments needs organization')
+
+    employees_ids = set(report_data.queryset.order_by()
+                        .values_list('employee_id', flat=True).distinct())
+    departments_by_employee = {}
+    for employee_id, department_id in Employee2Department.objects\
+            .filter(employee_id__in=employees_ids, department__show_in_report=True,
+                    department__organization=report_data.organization)\
+            .order_by('department_id').values_list('employee_id', 'department_id'):
+        departments_by_employee.setdefault(employee_id, department_id)
+
+    employees_by_department = {}
+    for employee_id in sorted(employees_ids):
+        employees_by_department.setdefault(
+            departments_by_employee.get(employee_id), []).append(employee_id)
+
+    parts = [(department.name, employees_by_department[department.id]) for department
+             in Department.objects.filter(id__in=[department_id for department_id
+                                                  in employees_by_department
+                                                  if department_id is not None])
+             .order_by('name', 'id')]
+    if None in employees_by_department:
+        parts.append(('Без подразделения', employees_by_department[None]))
+
+    params = {name: value for name, value in request.GET.items()
+              if name not in ('from', 'count', 'perPage', 'split', 'stream', 'format')}
+    arguments = [[params] * len(parts), [request.user.id] * len(parts),
+                 [part[0] for part in parts], [part[1] for part in parts]]
+
+    def iterate_sheets():
+        sheets = map(_build_department_sheet, *arguments)
+        if (settings.REPORT_SPLIT_WORKERS > 1) and (len(parts) > 1):
+            global _SPLIT_EXECUTOR
+            try:
+                sheets = _get_split_executor().map(_run_department_sheet, *arguments)
+            except BrokenProcessPool:
+                _SPLIT_EXECUTOR = None
+                sheets = _get_split_executor().map(_run_department_sheet, *arguments)
+
+        for i, sheet in enumerate(sheets):
+            yield sheet
+            if on_progress is not None:
+                on_progress((i + 1) / len(parts))
+
+    return report_data.name, iterate_sheets()
+
+
+def _write_department_sheets(sheets: Iterable[_DepartmentSheet], streaming: Optional[bool] = False,
+                             output_file=None) -> _ReportFileWriter:
+    """writer with sheet of every department in order of building and summary sheet"""
+    writer = None
+    summary_rows = []
+    for sheet in sheets:
+        if writer is None:
+            writer = _ReportFileWriter(
+                streaming=streaming, output_file=output_file, sheet_name=sheet.name)
+        else:
+            writer.add_sheet(sheet.name)
+        for row in sheet.rows:
+            writer.write_row(row)
+        summary_rows.append([sheet.name, sheet.employees_count, len(sheet.rows),
+                             sheet.later_count])
+    if writer is None:
+        writer = _ReportFileWriter(streaming=streaming, output_file=output_file)
+
+    writer.add_summary_sheet('Итого', summary_rows + [[
+        'Всего', sum(row[1] for row in summary_rows), sum(row[2] for row in summary_rows),
+        sum(row[3] for row in summary_rows)]])
+
+    return writer
+
+
+def _is_split_by_department(request) -> bool:
+    return request_utils.get_request_param(request, 'split') == 'department'
+
+
+def save_report_file(request, output_file, on_progress=None) -> str:
+    """write report file to output_file, return file name;
+    on_progress is called with part of written lines"""
+    name = None
+    if _is_split_by_department(request):
+        name, sheets = _get_department_sheets(request, on_progress)
+        writer = _write_department_sheets(sheets, streaming=True, output_file=output_file)
+    else:
+        info = _get_report_info(request, lazy=True)
+        name = info.name
+
+        writer = _ReportFileWriter(streaming=True, output_file=output_file)
+        written_progress = None
+        if (on_progress is not None) and info.visible_count:
+            written_progress = lambda written: on_progress(
+                written / info.visible_count)
+        writer.write_lines(info, on_progress=written_progress)
+    writer.finish()
+
+    return get_report_file_name(name)
+
+
+def save_report(request, output_file) -> str:
+    """write report as json to output_file, return file name"""
     info = _get_report_info(request)
+    output_file.write(json.dumps(vars(ReportInfo(info)), cls=DjangoJSONEncoder,
+                                 ensure_ascii=False).encode('utf-8'))
+
+    return get_report_file_name(info.name, 'json')
 
-    writer = _ReportFileWriter()
-    writer.write_lines(info)
-    response = writer.close(info.name)
+
+def get_report_file(request) -> FileResponse:
+    """report file; with split=department param lines of every department
+    are in separate sheet"""
+    streaming = 'stream' in request.GET
+    response = None
+    if _is_split_by_department(request):
+        name, sheets = _get_department_sheets(request)
+        with timing_utils.stage('xlsx'):
+            response = _write_department_sheets(sheets, streaming=streaming).close(name)
+    else:
+        info = _get_report_info(request, lazy=streaming)
+
+        # with streaming lines are built by chunks while rows are written,
+        # fetch and lines stages are not counted in xlsx stage
+        with timing_utils.stage('xlsx'):
+            writer = _ReportFileWriter(streaming=streaming)
+            writer.write_lines(info)
+            response = writer.close(info.name)
 
     return response
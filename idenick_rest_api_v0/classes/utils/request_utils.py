@@ -1,6 +1,9 @@
 """request and response utils"""
-from typing import Any, Optional, Union
+from typing import Any, Dict, Optional, Union
 
+from django.contrib.auth.models import User
+from django.http import HttpRequest, QueryDict
+from django.utils.http import parse_etags
 from rest_framework import status
 from rest_framework.response import Response
 
@@ -27,6 +30,25 @@ def get_request_param(request, name: str, is_int: bool = False, default: Union[s
     return result
 
 
+def get_params_request(params: Dict[str, str], user_id: int) -> HttpRequest:
+    """GET request of user with params, for utils called outside of views"""
+    request = HttpRequest()
+    request.method = 'GET'
+    request.GET = QueryDict(mutable=True)
+    for name, value in params.items():
+        request.GET[name] = value
+    request.user = User.objects.get(id=user_id)
+
+    return request
+
+
+def is_not_modified(request, etag: str) -> bool:
+    """If-None-Match of request matches etag"""
+    etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+
+    return ('*' in etags) or (etag in etags)
+
+
 def response(data: Any, status_value: int = status.HTTP_200_OK) -> Response:
     """response date with status with headers"""
     return Response(
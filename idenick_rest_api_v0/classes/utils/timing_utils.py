@@ -0,0 +1,244 @@
+"""per-stage timing of report pipeline: Server-Timing header and rotating log"""
+import json
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import wraps
+from logging.handlers import RotatingFileHandler
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from django.conf import settings
+from django.db import connection
+
+_LOGGER_NAME = 'idenick.report_timing'
+# time and SQL outside of stages
+_OTHER_STAGE = 'other'
+
+_LOCAL = threading.local()
+_LOG_LOCK = threading.Lock()
+_LOG_HANDLER = None
+
+
+@dataclass
+class StageTiming:
+    """wall time of stage without nested stages and its SQL queries"""
+
+    def __init__(self):
+        self.duration = 0.0
+        self.queries = 0
+        self.queries_duration = 0.0
+        self.calls = 0
+
+
+class _Recorder:
+    """stages of one report request; time of nested stage is not counted in outer stage"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stages: Dict[str, StageTiming] = {}
+        self._stack: List[str] = []
+        self._resumed_at = None
+        self.started_at = time.perf_counter()
+        self.duration = None
+
+    def _get_stage(self, name: str) -> StageTiming:
+        result = self.stages.get(name)
+        if result is None:
+            result = StageTiming()
+            self.stages.update({name: result})
+
+        return result
+
+    def _pause(self, now: float) -> None:
+        if self._stack:
+            self._get_stage(self._stack[-1]).duration += now - self._resumed_at
+
+    def enter(self, name: str) -> None:
+        now = time.perf_counter()
+        self._pause(now)
+        self._get_stage(name).calls += 1
+        self._stack.append(name)
+        self._resumed_at = now
+
+    def exit(self) -> None:
+        now = time.perf_counter()
+        self._pause(now)
+        self._stack.pop()
+        self._resumed_at = now
+
+    def execute(self, execute, sql, params, many, context):
+        """execute wrapper of connection, query is counted in current stage"""
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            stage = self._get_stage(self._stack[-1] if self._stack else _OTHER_STAGE)
+            stage.queries += 1
+            stage.queries_duration += time.perf_counter() - started_at
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self.started_at
+        staged_duration = sum(timing.duration for name, timing in self.stages.items()
+                              if name != _OTHER_STAGE)
+        self._get_stage(_OTHER_STAGE).duration = max(self.duration - staged_duration, 0)
+
+
+def _get_recorder() -> Optional[_Recorder]:
+    return getattr(_LOCAL, 'recorder', None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """measure stage of report; without active recording (jobs, commands) does nothing"""
+    recorder = _get_recorder()
+    if recorder is None:
+        yield
+    else:
+        recorder.enter(name)
+        try:
+            yield
+        finally:
+            recorder.exit()
+
+
+def _to_ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+
+def get_server_timing(recorder: _Recorder) -> str:
+    """Server-Timing header value: stages with SQL count and time in description"""
+    metrics = []
+    for name, timing in recorder.stages.items():
+        metrics.append('%s;dur=%s;desc="%d sql, %s ms"' % (
+            name, _to_ms(timing.duration), timing.queries, _to_ms(timing.queries_duration)))
+    metrics.append('total;dur=%s' % _to_ms(recorder.duration))
+
+    return ', '.join(metrics)
+
+
+def _get_log_handler() -> Optional[logging.Handler]:
+    global _LOG_HANDLER
+    if (_LOG_HANDLER is None) and settings.REPORT_TIMING_LOG:
+        with _LOG_LOCK:
+            if _LOG_HANDLER is None:
+                handler = RotatingFileHandler(settings.REPORT_TIMING_LOG,
+                                              maxBytes=settings.REPORT_TIMING_LOG_MAX_BYTES,
+                                              backupCount=settings.REPORT_TIMING_LOG_BACKUPS,
+                                              encoding='utf-8')
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                logger = logging.getLogger(_LOGGER_NAME)
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                logger.addHandler(handler)
+                _LOG_HANDLER = handler
+
+    return _LOG_HANDLER
+
+
+def _write_sample(recorder: _Recorder, status_code: int) -> None:
+    """append sample as JSON line to REPORT_TIMING_LOG"""
+    if _get_log_handler() is not None:
+        sample = {'time': round(time.time(), 3),
+                  'report': recorder.name,
+                  'status': status_code,
+                  'total': _to_ms(recorder.duration),
+                  'stages': {name: {'dur': _to_ms(timing.duration),
+                                    'sql': timing.queries,
+                                    'sql_dur': _to_ms(timing.queries_duration)}
+                             for name, timing in recorder.stages.items()}}
+        logging.getLogger(_LOGGER_NAME).info(json.dumps(sample))
+
+
+def timing_decorator(name: str):
+    """record stages of view, add Server-Timing header and write sample to log"""
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapped(*args, **kwargs):
+            recorder = _Recorder(name)
+            _LOCAL.recorder = recorder
+            try:
+                with connection.execute_wrapper(recorder.execute):
+                    result = view_func(*args, **kwargs)
+            finally:
+                _LOCAL.recorder = None
+            recorder.finish()
+
+            if settings.REPORT_TIMING_HEADER:
+                result['Server-Timing'] = get_server_timing(recorder)
+            _write_sample(recorder, result.status_code)
+
+            return result
+
+        return wrapped
+
+    return decorator
+
+
+def read_samples(path: str, backups: Optional[int] = None) -> Iterator[dict]:
+    """samples of log and its rotated backups, oldest first"""
+    if backups is None:
+        backups = settings.REPORT_TIMING_LOG_BACKUPS
+    for index in range(backups, -1, -1):
+        try:
+            with open(path if index == 0 else '%s.%d' % (path, index),
+                      encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        pass
+        except OSError:
+            pass
+
+
+def get_percentile(values: List[float], percent: float) -> Optional[float]:
+    """nearest-rank percentile of sorted values"""
+    result = None
+    if values:
+        rank = max(math.ceil(percent * len(values) / 100), 1)
+        result = values[rank - 1]
+
+    return result
+
+
+@dataclass
+class StageSummary:
+    """p50 and p95 of stage durations and SQL counts"""
+
+    def __init__(self, name: str, durations: List[float], queries: List[int]):
+        durations = sorted(durations)
+        queries = sorted(queries)
+        self.name = name
+        self.samples = len(durations)
+        self.p50 = get_percentile(durations, 50)
+        self.p95 = get_percentile(durations, 95)
+        self.sql_p50 = get_percentile(queries, 50)
+        self.sql_p95 = get_percentile(queries, 95)
+
+
+def summarize(samples: Iterable[dict], report: Optional[str] = None) -> List[StageSummary]:
+    """summary of stages and total of samples, in order of first appearance"""
+    durations: Dict[str, List[float]] = {}
+    queries: Dict[str, List[int]] = {}
+    total_durations = []
+    total_queries = []
+    for sample in samples:
+        if (report is not None) and (sample.get('report') != report):
+            continue
+
+        sample_queries = 0
+        for name, values in sample.get('stages', {}).items():
+            durations.setdefault(name, []).append(values.get('dur', 0))
+            queries.setdefault(name, []).append(values.get('sql', 0))
+            sample_queries += values.get('sql', 0)
+        total_durations.append(sample.get('total', 0))
+        total_queries.append(sample_queries)
+
+    result = [StageSummary(name, durations[name], queries[name]) for name in durations]
+    if total_durations:
+        result.append(StageSummary('total', total_durations, total_queries))
+
+    return result
@@ -6,7 +6,7 @@ from typing import Optional
 
 from idenick_app.models import (AbstractEntry, Checkpoint, Device, Employee,
                                 Login, Organization)
-from idenick_rest_api_v0.classes.utils import request_utils
+from idenick_rest_api_v0.classes.utils import count_utils, request_utils
 from idenick_rest_api_v0.serializers import user_serializers
 
 
@@ -82,7 +82,8 @@ def get_authentification(user):
 
 
 def get_counts():
-    return {'organizations': Organization.objects.filter(dropped_at=None).count(),
-            'devices': Device.objects.filter(dropped_at=None).count(),
-            'checkpoints': Checkpoint.objects.filter(dropped_at=None).count(),
-            'employees': Employee.objects.filter(dropped_at=None).count()}
+    querysets = {'organizations': Organization.objects.filter(dropped_at=None),
+                 'devices': Device.objects.filter(dropped_at=None),
+                 'checkpoints': Checkpoint.objects.filter(dropped_at=None),
+                 'employees': Employee.objects.filter(dropped_at=None)}
+    return {name: count_utils.get_count(queryset).value for name, queryset in querysets.items()}
@@ -6,8 +6,8 @@ from rest_framework import serializers, status, viewsets
 from rest_framework.response import Response
 
 from idenick_app.models import AbstractEntry, Department, Device, Login
-from idenick_rest_api_v0.classes.utils import (login_utils, request_utils,
-                                               views_utils)
+from idenick_rest_api_v0.classes.utils import (count_utils, login_utils,
+                                               request_utils, views_utils)
 
 
 class AbstractViewSet(viewsets.ViewSet):
@@ -85,9 +85,16 @@ class AbstractViewSet(viewsets.ViewSet):
         serializer = self.get_current_serializer(is_full=is_full)(paginated_queryset, many=True, context={
             'organization': organization})
 
+        count_mode = count_utils.get_count_mode(request)
+        base_count = count_utils.get_count(
+            self._get_queryset(request, base_filter=True), count_mode)
+        filtered_count = count_utils.get_count(_queryset, count_mode)
+
         return {'data': serializer.data,
-                'baseCount': self._get_queryset(request, base_filter=True).count(),
-                'filteredCount': _queryset.count()}
+                'baseCount': base_count.value,
+                'baseCountExact': base_count.exact,
+                'filteredCount': filtered_count.value,
+                'filteredCountExact': filtered_count.exact}
 
     def _retrieve(self, request, pk=None, queryset=None, is_full: Optional[bool] = False):
         return request_utils.response(self._retrieve_data(request, pk, queryset, is_full=is_full))
@@ -17,7 +17,8 @@ from idenick_app.models import (Employee, Employee2Department,
                                 IndentificationTepmplate, Login)
 from idenick_rest_api_v0.classes.utils import (login_utils, request_utils,
                                                views_utils)
-from idenick_rest_api_v0.classes.utils.mqtt_utils import check_biometry
+from idenick_rest_api_v0.classes.utils.mqtt_utils import (GatewayUnavailableError,
+                                                          check_biometry)
 from idenick_rest_api_v0.classes.views.abstract_view_set import AbstractViewSet
 from idenick_rest_api_v0.serializers import (employee_serializers,
                                              organization_serializers)
@@ -181,6 +182,8 @@ class EmployeeViewSet(AbstractViewSet):
                     template_data = base64.b64decode(
                         request.data.get('photo').encode())
                     biometry_check_result = check_biometry(template_data)
+                    if biometry_check_result is None:
+                        raise GatewayUnavailableError()
                     if (entity.has_face
                             and (biometry_check_result.employee == entity.id))\
                             or (not entity.has_face and not biometry_check_result.exists):
@@ -0,0 +1,16 @@
+"""remove expired report jobs"""
+from django.core.management.base import BaseCommand
+
+from idenick_rest_api_v0.classes.utils import report_jobs_utils
+
+
+class Command(BaseCommand):
+    help = 'Remove report jobs and their files older than REPORT_JOBS_TTL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', type=int, default=None,
+                            help='max age of job in seconds')
+
+    def handle(self, *args, **options):
+        removed = report_jobs_utils.clean_jobs(options['ttl'])
+        self.stdout.write('Removed jobs: %d' % removed)
@@ -0,0 +1,32 @@
+"""pre-generate standard reports of organizations"""
+from django.core.management.base import BaseCommand, CommandError
+
+from idenick_app.models import Login
+from idenick_rest_api_v0.classes.utils import report_store_utils
+
+
+class Command(BaseCommand):
+    help = 'Generate yesterday and month to date reports of organizations into REPORT_STORE_ROOT'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organization', type=int, action='append', default=None,
+                            help='id of organization, all active organizations by default')
+        parser.add_argument('--user', default=None,
+                            help='username of admin generating reports, first admin by default')
+
+    def handle(self, *args, **options):
+        logins = Login.objects.filter(role=Login.ADMIN, dropped_at=None)
+        if options['user'] is not None:
+            logins = logins.filter(user__username=options['user'])
+        login = logins.order_by('id').first()
+        if login is None:
+            raise CommandError('Admin login is not found')
+
+        reports = report_store_utils.generate_reports(login.user_id,
+                                                      organizations_ids=options['organization'])
+        for report in reports:
+            self.stdout.write('Organization %s %s-%s: %s (%d bytes)' % (
+                report.organization, report.start, report.end, report.sha256, report.size))
+
+        removed = report_store_utils.clean_reports()
+        self.stdout.write('Removed files: %d' % removed)
@@ -0,0 +1,28 @@
+"""summary of report timing log"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from idenick_rest_api_v0.classes.utils import timing_utils
+
+
+class Command(BaseCommand):
+    help = 'Print p50 and p95 of report stages from REPORT_TIMING_LOG and its backups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', default=None,
+                            help='path of timing log, REPORT_TIMING_LOG by default')
+        parser.add_argument('--report', default=None,
+                            help='name of report view (report, reportFile), all by default')
+
+    def handle(self, *args, **options):
+        path = options['log'] or settings.REPORT_TIMING_LOG
+        if not path:
+            raise CommandError('REPORT_TIMING_LOG is not set')
+
+        summaries = timing_utils.summarize(timing_utils.read_samples(path), options['report'])
+        self.stdout.write('%-12s %8s %10s %10s %8s %8s' % (
+            'stage', 'samples', 'p50 ms', 'p95 ms', 'sql p50', 'sql p95'))
+        for summary in summaries:
+            self.stdout.write('%-12s %8d %10.1f %10.1f %8d %8d' % (
+                summary.name, summary.samples, summary.p50, summary.p95,
+                summary.sql_p50, summary.sql_p95))
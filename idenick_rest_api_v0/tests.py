@@ -1,3 +1,646 @@
-from django.test import TestCase
-
-# Create your tests here.
+import base64
+import contextlib
+import csv
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User, update_last_login
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from benchmarks import mqtt_broker
+from idenick_app.models import (DailyAttendance, Device, Device2Organization,
+                                Employee, Employee2Organization, EmployeeRequest,
+                                Login, Organization, SummaryWatermark)
+from idenick_app.classes.utils import attendance_utils, querylog_utils
+from idenick_rest_api_v0.classes.utils import (count_utils, mqtt_utils,
+                                               report_cache_utils, report_jobs_utils,
+                                               report_store_utils, report_utils)
+from idenick_rest_api_v0.classes.views import employee_view_set
+
+EMPLOYEES_URL = '/api/v0/employees/'
+EMPLOYEES_REQUESTS_URL = '/api/v0/employeesRequests/'
+REPORT_JOBS_URL = '/api/v0/reportJobs/'
+REPORT_URL = '/api/v0/report/'
+REPORT_FILE_URL = '/api/v0/reportFile/'
+ANALYTICS_URL = '/api/v0/attendanceAnalytics/'
+BIOMETRY_REGISTRATIONS_URL = '/api/v0/biometryRegistrations/'
+START = datetime(2020, 1, 6, 8, 0)
+
+
+def create_requests(moments, device: Device, employee: Employee) -> list:
+    """requests with given moments; moment is set after insert because of auto_now_add"""
+    result = []
+    for moment in moments:
+        employee_request = EmployeeRequest.objects.create(
+            request_type=12, response_type=12, algorithm_type=2,
+            device=device, employee=employee)
+        EmployeeRequest.objects.filter(id=employee_request.id).update(moment=moment)
+        result.append(EmployeeRequest.objects.get(id=employee_request.id))
+
+    return result
+
+
+def create_user(username: str, role: str, organization: Organization = None) -> User:
+    result = User.objects.create(username=username)
+    login = Login.objects.get(user=result)
+    login.role = role
+    login.organization = organization
+    login.save()
+
+    return result
+
+
+class ApiTestCase(TestCase):
+    """organization with device, employees and requests of one week; other organization
+    has own employee and device"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(
+            name='Organization', timesheet_start='09:00', timesheet_end='18:00')
+        cls.other_organization = Organization.objects.create(name='Other')
+
+        cls.device = Device.objects.create(mqtt='device', name='Device')
+        Device2Organization.objects.create(device=cls.device, organization=cls.organization)
+        cls.other_device = Device.objects.create(mqtt='other', name='Other')
+        Device2Organization.objects.create(device=cls.other_device,
+                                           organization=cls.other_organization)
+
+        cls.employees = []
+        for index in range(3):
+            employee = Employee.objects.create(
+                last_name='Employee%d' % index, first_name='First', patronymic='Patronymic')
+            Employee2Organization.objects.create(employee=employee,
+                                                 organization=cls.organization)
+            cls.employees.append(employee)
+        cls.other_employee = Employee.objects.create(
+            last_name='Other', first_name='First', patronymic='Patronymic')
+        Employee2Organization.objects.create(employee=cls.other_employee,
+                                             organization=cls.other_organization)
+
+        cls.requests = []
+        for day in range(5):
+            for index, employee in enumerate(cls.employees):
+                moment = START + timedelta(days=day, minutes=index * 20)
+                cls.requests += create_requests(
+                    [moment, moment + timedelta(hours=9)], cls.device, employee)
+        # requests of same moment are ordered by id
+        cls.requests += create_requests([START + timedelta(days=2, hours=12)] * 3,
+                                        cls.device, cls.employees[0])
+        create_requests([START + timedelta(hours=1)], cls.other_device, cls.other_employee)
+
+        cls.admin = create_user('admin', Login.ADMIN)
+        cls.controller = create_user('controller', Login.CONTROLLER, cls.organization)
+
+    def setUp(self):
+        cache.clear()
+        report_cache_utils.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.controller)
+
+    def get_ordered_ids(self) -> list:
+        """ids of organization requests in (-moment, -id) order"""
+        return [employee_request.id for employee_request in sorted(
+            self.requests, key=lambda r: (r.moment, r.id), reverse=True)]
+
+
+class CursorPaginationTest(ApiTestCase):
+
+    def get_page(self, **params) -> dict:
+        params = dict({'type': 'ALL', 'perPage': 4}, **params)
+        response = self.client.get(EMPLOYEES_REQUESTS_URL, params)
+        self.assertEqual(response.status_code, 200)
+
+        return response.data
+
+    def test_next_pages(self):
+        page = self.get_page(cursor='')
+        self.assertIsNone(page['previous'])
+        self.assertIsNone(page['count'])
+
+        ids = []
+        while True:
+            self.assertLessEqual(len(page['data']), 4)
+            ids += [employee_request['id'] for employee_request in page['data']]
+            if page['next'] is None:
+                break
+            page = self.get_page(after=page['next'])
+
+        self.assertEqual(ids, self.get_ordered_ids())
+
+    def test_previous_page(self):
+        first_page = self.get_page(cursor='')
+        second_page = self.get_page(after=first_page['next'])
+        page = self.get_page(before=second_page['previous'])
+
+        self.assertEqual(page['data'], first_page['data'])
+        self.assertIsNone(page['previous'])
+        self.assertEqual(page['next'], first_page['next'])
+
+    def test_invalid_cursor(self):
+        cursor = self.get_page(cursor='')['next']
+        for invalid_cursor in (cursor[:-1], 'cursor', base64.urlsafe_b64encode(b'1|2').decode()):
+            response = self.client.get(EMPLOYEES_REQUESTS_URL,
+                                       {'type': 'ALL', 'perPage': 4, 'after': invalid_cursor})
+            self.assertEqual(response.status_code, 400)
+
+    def test_exact_total(self):
+        page = self.get_page(cursor='', total='exact')
+
+        self.assertEqual(page['count'], len(self.requests))
+        self.assertTrue(page['count_exact'])
+
+    def test_offset_pages(self):
+        page = self.get_page(**{'from': 1})
+
+        self.assertEqual([employee_request['id'] for employee_request in page['data']],
+                         self.get_ordered_ids()[4:8])
+        self.assertEqual(page['count'], len(self.requests))
+
+
+class AnalyticsTest(ApiTestCase):
+    """analytics of days which are not in summary yet are calculated from querylog"""
+
+    def get_analytics(self, **params) -> dict:
+        response = self.client.get(ANALYTICS_URL, dict({'start': '20200101',
+                                                        'end': '20200131'}, **params))
+        self.assertEqual(response.status_code, 200)
+
+        return response.data
+
+    def test_partial_summary(self):
+        analytics = self.get_analytics()
+        employee_analytics = self.get_analytics(employee=self.employees[1].id)
+        self.assertEqual(analytics['total']['days'], 15)
+        self.assertEqual(attendance_utils.get_watermark(), 0)
+
+        attendance_utils.update_daily_attendance(batch_size=10, max_batches=1)
+        self.assertEqual(self.get_analytics(), analytics)
+        self.assertEqual(self.get_analytics(employee=self.employees[1].id),
+                         employee_analytics)
+
+        attendance_utils.update_daily_attendance()
+        self.assertEqual(self.get_analytics(), analytics)
+        self.assertEqual(employee_analytics['total']['days'], 5)
+
+
+class TimezoneChangeTest(ApiTestCase):
+
+    def get_attendances(self) -> list:
+        return list(DailyAttendance.objects.order_by('employee_id', 'date')
+                    .values_list('employee_id', 'date', 'pairs', 'first_in', 'last_out'))
+
+    def test_timezone_change(self):
+        attendance_utils.update_daily_attendance()
+        self.device.name = 'Renamed'
+        self.device.save()
+        self.assertFalse(SummaryWatermark.objects.filter(
+            name__startswith=querylog_utils.TIMEZONE_CHANGE_WATERMARK_PREFIX).exists())
+
+        last_request = self.requests[-1]
+        self.device.timezone = timedelta(hours=10)
+        self.device.save()
+        # requests are refilled by command
+        self.assertEqual(EmployeeRequest.objects.get(id=last_request.id).local_date,
+                         last_request.local_date)
+
+        self.assertEqual(attendance_utils.apply_timezone_changes(batch_size=7),
+                         len(self.requests))
+        self.assertEqual(EmployeeRequest.objects.get(id=last_request.id).local_date,
+                         last_request.local_date + timedelta(days=1))
+        attendances = self.get_attendances()
+        attendance_utils.reset_daily_attendance()
+        attendance_utils.update_daily_attendance()
+        self.assertEqual(attendances, self.get_attendances())
+        self.assertEqual(attendance_utils.apply_timezone_changes(), 0)
+
+
+class ArchiveTest(ApiTestCase):
+
+    def test_archived_dates(self):
+        params = {'type': 'ORGANIZATION', 'id': self.organization.id, 'from': 0, 'perPage': 4}
+        self.assertEqual(self.client.get(EMPLOYEES_REQUESTS_URL, params).data['count'],
+                         len(self.requests))
+        self.assertEqual(self.client.get(REPORT_URL, params).json()['count'], 17)
+
+        self.assertEqual(querylog_utils.archive_requests(date(2020, 1, 8)), 12 + 1)
+        first_date = querylog_utils.get_first_complete_date()
+        self.assertEqual(first_date, date(2020, 1, 9))
+
+        kept_requests = [employee_request for employee_request in self.requests
+                         if employee_request.local_date >= first_date]
+        self.assertEqual(self.client.get(EMPLOYEES_REQUESTS_URL, params).data['count'],
+                         len(kept_requests))
+        self.assertEqual(self.client.get(REPORT_URL, params).json()['count'], 6)
+
+        # range is started after archived dates
+        self.assertEqual(self.client.get(REPORT_URL, dict(params, start='20200108'))
+                         .json()['count'], 6)
+        response = self.client.get(EMPLOYEES_REQUESTS_URL, dict(params, start='20200108',
+                                                                format='csv'))
+        self.assertEqual(len(b''.join(response.streaming_content).decode('utf-8')
+                             .splitlines()), len(kept_requests) + 1)
+
+
+class ReportJobsTest(ApiTestCase):
+    """jobs are not started, workers are tested by benchmarks"""
+
+    def setUp(self):
+        super().setUp()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        jobs_settings = override_settings(REPORT_JOBS_ROOT=root.name)
+        jobs_settings.enable()
+        self.addCleanup(jobs_settings.disable)
+        start_patch = mock.patch.object(report_jobs_utils, '_start')
+        start_patch.start()
+        self.addCleanup(start_patch.stop)
+
+        self.other_controller = create_user('other', Login.CONTROLLER, self.organization)
+        self.params = {'type': 'ORGANIZATION', 'id': self.organization.id,
+                       'start': '20200106', 'end': '20200110'}
+
+    def submit(self, user: User, **params) -> dict:
+        self.client.force_authenticate(user)
+        response = self.client.post(REPORT_JOBS_URL, dict(self.params, **params))
+        self.assertEqual(response.status_code, 200)
+
+        return response.data
+
+    def test_identical_submissions(self):
+        job = self.submit(self.controller)
+
+        self.assertEqual(job['status'], report_jobs_utils.JobStatus.QUEUED.value)
+        self.assertEqual(self.submit(self.controller)['id'], job['id'])
+        self.assertNotEqual(self.submit(self.controller, end='20200109')['id'], job['id'])
+
+    def test_jobs_of_other_user(self):
+        job = self.submit(self.controller)
+        other_job = self.submit(self.other_controller)
+
+        self.assertNotEqual(other_job['id'], job['id'])
+        self.assertEqual(self.client.get(REPORT_JOBS_URL + other_job['id'] + '/').status_code,
+                         200)
+        self.assertEqual(self.client.get(REPORT_JOBS_URL + job['id'] + '/').status_code, 404)
+
+    def test_lost_job(self):
+        job = self.submit(self.controller)
+        state_path = os.path.join(report_jobs_utils._get_job_dir(job['id']),
+                                  report_jobs_utils._STATE_FILE)
+        with open(state_path, encoding='utf-8') as file:
+            state = json.load(file)
+        state.update(updated=time.time() - settings.REPORT_JOBS_STALE_TIMEOUT - 1)
+        with open(state_path, 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+
+        self.assertNotEqual(self.submit(self.controller)['id'], job['id'])
+        lost_job = self.client.get(REPORT_JOBS_URL + job['id'] + '/').data
+        self.assertEqual(lost_job['status'], report_jobs_utils.JobStatus.FAILED.value)
+
+
+class SummaryReportTest(ApiTestCase):
+    """report from daily attendance summary has lines of report from querylog"""
+
+    def get_report(self, **params) -> dict:
+        params = dict({'type': 'ORGANIZATION', 'id': self.organization.id,
+                       'start': '20200101', 'end': '20200131'}, **params)
+        response = self.client.get(REPORT_URL, params)
+        self.assertEqual(response.status_code, 200)
+
+        return response.json()
+
+    def assert_summary_report(self, **params):
+        report = self.get_report(**params)
+        report_cache_utils.clear()
+
+        self.assertTrue(report['data'])
+        self.assertEqual(self.get_report(summary='', **params), report)
+
+    def test_without_summary(self):
+        self.assert_summary_report()
+
+    def test_summary(self):
+        attendance_utils.update_daily_attendance()
+        self.assertEqual(attendance_utils.get_watermark(), EmployeeRequest.objects.latest('id').id)
+
+        self.assert_summary_report()
+        self.assert_summary_report(**{'from': 1, 'perPage': 4})
+
+    def test_partial_summary(self):
+        attendance_utils.update_daily_attendance(batch_size=10, max_batches=1)
+        watermark = attendance_utils.get_watermark()
+
+        self.assert_summary_report()
+        self.assert_summary_report(**{'from': 0, 'perPage': 4})
+        self.assert_summary_report(**{'from': 2, 'perPage': 4})
+        # report does not process querylog
+        self.assertEqual(attendance_utils.get_watermark(), watermark)
+
+
+class CountModesTest(ApiTestCase):
+
+    def get_list(self, **params) -> dict:
+        params = dict({'type': 'ALL', 'from': 0, 'perPage': 4}, **params)
+        response = self.client.get(EMPLOYEES_REQUESTS_URL, params)
+        self.assertEqual(response.status_code, 200)
+
+        return response.data
+
+    def test_exact(self):
+        page = self.get_list(total='exact')
+
+        self.assertEqual(page['count'], len(self.requests))
+        self.assertTrue(page['count_exact'])
+
+    def test_estimated_without_statistics(self):
+        page = self.get_list(total='estimated')
+
+        self.assertEqual(page['count'], len(self.requests))
+        self.assertTrue(page['count_exact'])
+
+    def test_none(self):
+        page = self.get_list(total='none')
+
+        self.assertIsNone(page['count'])
+        self.assertIsNone(page['count_exact'])
+        self.assertEqual(len(page['data']), 4)
+
+    def test_login_keeps_counts(self):
+        version = count_utils.get_entities_version()
+        update_last_login(None, self.controller)
+        self.assertEqual(count_utils.get_entities_version(), version)
+
+        self.controller.last_name = 'Controller'
+        self.controller.save()
+        self.assertNotEqual(count_utils.get_entities_version(), version)
+
+    def test_cached_count(self):
+        self.get_list()
+        create_requests([START], self.device, self.employees[0])
+
+        self.assertEqual(self.get_list()['count'], len(self.requests) + 1)
+
+    def test_unavailable_entity(self):
+        page = self.get_list(type='EMPLOYEE', id=self.other_employee.id)
+
+        self.assertEqual(page['data'], [])
+        self.assertEqual(page['count'], 0)
+        self.assertTrue(page['count_exact'])
+
+
+class EmployeesRequestsQueriesTest(ApiTestCase):
+    """queries of list do not depend on count of listed requests"""
+
+    def test_queries(self):
+        params = {'type': 'ORGANIZATION', 'id': self.organization.id, 'from': 0,
+                  'showdevice': ''}
+        # login is read by decorator, by queryset of list and by list (2 queries each);
+        # organization (twice), querylog watermark, count, requests, employees and
+        # devices; first date after archive is cached
+        querylog_utils.get_first_complete_date()
+        with self.assertNumQueries(13):
+            response = self.client.get(EMPLOYEES_REQUESTS_URL, dict(params, perPage=2))
+        self.assertEqual(len(response.data['data']), 2)
+
+        cache.clear()
+        querylog_utils.get_first_complete_date()
+        with self.assertNumQueries(13):
+            response = self.client.get(EMPLOYEES_REQUESTS_URL, dict(params, perPage=30))
+        self.assertEqual(len(response.data['data']), 30)
+        self.assertEqual(len(response.data['extra']['employees']), 3)
+        self.assertEqual(len(response.data['extra']['devices']), 1)
+
+
+class ExportTest(ApiTestCase):
+
+    def get_export(self, export_format: str, **params) -> list:
+        """lines of streamed export"""
+        params = dict({'type': 'ORGANIZATION', 'id': self.organization.id,
+                       'format': export_format}, **params)
+        response = self.client.get(EMPLOYEES_REQUESTS_URL, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment', response['Content-Disposition'])
+
+        return b''.join(response.streaming_content).decode('utf-8').splitlines()
+
+    def test_csv(self):
+        rows = list(csv.reader(self.get_export('csv')))
+
+        self.assertEqual(rows[0][:4], ['id', 'employee', 'device', 'moment'])
+        self.assertEqual([int(row[0]) for row in rows[1:]], self.get_ordered_ids())
+
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.get_export('ndjson', start='20200107',
+                                                             end='20200107')]
+        requests = [employee_request for employee_request in self.requests
+                    if employee_request.moment.date() == START.date() + timedelta(days=1)]
+
+        self.assertEqual(sorted(row['id'] for row in rows),
+                         sorted(employee_request.id for employee_request in requests))
+        self.assertEqual(rows[0]['device'], self.device.id)
+        self.assertEqual(rows[0]['date'], '07.01.2020')
+
+    def test_chunks(self):
+        request = RequestFactory().get('/', {'type': 'ALL'})
+        request.user = self.controller
+        _, rows = report_utils.get_employees_requests_rows(request, chunk_size=4)
+
+        self.assertEqual([row['id'] for row in rows], self.get_ordered_ids())
+
+
+class ReportStoreTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        store_settings = override_settings(REPORT_STORE_ROOT=root.name)
+        store_settings.enable()
+        self.addCleanup(store_settings.disable)
+
+        standard_range = report_store_utils.StandardRange(
+            'month', date(2020, 1, 1), date(2020, 1, 31))
+        self.report = report_store_utils.generate_report(
+            self.organization.id, standard_range, self.admin.id)
+        self.params = {'type': 'ORGANIZATION', 'id': self.organization.id,
+                       'start': '20200101', 'end': '20200131'}
+
+    def test_stored_report(self):
+        response = self.client.get(REPORT_FILE_URL, self.params)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], self.report.etag)
+        self.assertEqual(self.client.get(REPORT_FILE_URL, self.params,
+                                         HTTP_IF_NONE_MATCH=self.report.etag).status_code, 304)
+
+    def test_live_report(self):
+        for params in (dict(self.params, summary=''), dict(self.params, perPage=10, **{'from': 0}),
+                       dict(self.params, end='20200130')):
+            response = self.client.get(REPORT_FILE_URL, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.has_header('ETag'))
+
+
+class ReportCacheTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.params = {'type': 'ORGANIZATION', 'id': self.organization.id,
+                       'start': '20200101', 'end': '20200131', 'from': 0, 'perPage': 4}
+
+    def test_not_modified(self):
+        response = self.client.get(REPORT_URL, self.params)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with self.assertNumQueries(5):
+            # login of user and querylog watermark are read only
+            cached_response = self.client.get(REPORT_URL, self.params,
+                                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached_response.status_code, 304)
+        self.assertEqual(cached_response['ETag'], etag)
+
+        cached_response = self.client.get(REPORT_URL, dict(self.params, total='none'))
+        self.assertEqual(cached_response.status_code, 200)
+        self.assertEqual(cached_response.content, response.content)
+
+    def test_timing_header(self):
+        with self.settings(REPORT_TIMING_HEADER=False):
+            self.assertFalse(self.client.get(REPORT_URL, self.params)
+                             .has_header('Server-Timing'))
+        with self.settings(REPORT_TIMING_HEADER=True):
+            self.assertIn('scan', self.client.get(REPORT_URL, dict(self.params, perPage=5))
+                          ['Server-Timing'])
+
+    def test_new_requests(self):
+        etag = self.client.get(REPORT_URL, self.params)['ETag']
+        create_requests([START + timedelta(days=4, hours=10)], self.device, self.employees[1])
+
+        response = self.client.get(REPORT_URL, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_organization_scope(self):
+        self.client.get(REPORT_URL, self.params)
+        other_controller = create_user('other', Login.CONTROLLER, self.other_organization)
+        self.client.force_authenticate(other_controller)
+
+        self.assertEqual(self.client.get(REPORT_URL, self.params).json()['data'], [])
+
+
+class GatewayTest(TestCase):
+
+    def setUp(self):
+        # broker thread is left to gateway of test until exit
+        self.broker = mqtt_broker.Broker().start()
+        # gateway of test is connected to local broker
+        for name, value in (('HOST', self.broker.host), ('PORT', self.broker.port),
+                            ('_GATEWAY', None), ('_GATEWAY_PID', None)):
+            patch = mock.patch.object(mqtt_utils, name, value)
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def search(self, script: mqtt_broker.DeviceScript):
+        mqtt_broker.DeviceSimulator(self.broker, script)
+        with contextlib.redirect_stdout(io.StringIO()):
+            mqtt_utils.connect()
+            result = mqtt_utils.check_biometry(b'template', 30)
+
+        return result
+
+    def test_enroll_many(self):
+        mqtt_broker.DeviceSimulator(self.broker, mqtt_broker.DeviceScript(
+            delay=0.01, jitter=0.01, seed=1))
+        employees = [Employee(last_name='Employee%d' % index, first_name='First',
+                              patronymic='Patronymic') for index in range(6)]
+        commands = [('device/%d' % (index % 2), mqtt_utils.get_enroll_command(
+            employee, '1234', mqtt_utils.BiometryType.CARD))
+            for index, employee in enumerate(employees)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            mqtt_utils.connect()
+            replies = list(mqtt_utils.enroll_many(commands, timeout=30))
+
+        # every reply belongs to its command
+        self.assertEqual(sorted((index, reply.message.split(',')[2])
+                                for index, reply in replies),
+                         [(index, employee.last_name)
+                          for index, employee in enumerate(employees)])
+
+    def test_found(self):
+        result = self.search(mqtt_broker.DeviceScript(delay=0, employee_id=7))
+
+        self.assertEqual((result.exists, result.employee), (True, 7))
+
+
+class PhotoCheckTest(ApiTestCase):
+
+    def test_gateway_unavailable(self):
+        self.client.force_authenticate(self.admin)
+        employee = self.employees[0]
+        photo = base64.b64encode(b'photo').decode('ascii')
+        with mock.patch.object(employee_view_set, 'check_biometry', return_value=None):
+            response = self.client.patch('%s%d/' % (EMPLOYEES_URL, employee.id),
+                                         {'last_name': 'Changed', 'first_name': 'First',
+                                          'patronymic': 'Patronymic', 'photo': photo},
+                                         format='json')
+
+        self.assertEqual(response.status_code, 503)
+        employee.refresh_from_db()
+        self.assertEqual(employee.last_name, 'Employee0')
+
+
+def enroll_many(commands, window=None, timeout=None):
+    """replies of device in reversed order of commands, employee is found by name"""
+    commands = list(commands)
+    for index in reversed(range(len(commands))):
+        header = commands[index][1].split(b'\r\n', 1)[0].decode('utf-8')
+        yield index, mqtt_utils.EnrollmentReply(
+            True, '!ENROLL_OK,0,%s,0' % ','.join(header.split(',')[2:5]))
+
+
+class BatchRegistrationTest(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+        enroll_patch = mock.patch.object(mqtt_utils, 'enroll_many', side_effect=enroll_many)
+        enroll_patch.start()
+        self.addCleanup(enroll_patch.stop)
+
+    def post(self, data) -> list:
+        response = self.client.post(BIOMETRY_REGISTRATIONS_URL, data, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        return [json.loads(line) for line in
+                b''.join(response.streaming_content).decode('utf-8').splitlines()]
+
+    def test_batch(self):
+        data = base64.b64encode(b'template').decode('ascii')
+        results = self.post({'mqtt': 'device', 'items': [
+            {'employee': self.employees[0].id, 'type': 'FINGER', 'biometryData': data},
+            {'employee': 0, 'type': 'FINGER', 'biometryData': data},
+            {'employee': self.employees[1].id, 'type': 'FACE', 'biometryData': data},
+            {'employee': self.employees[2].id, 'type': 'FINGER', 'biometryData': 'abc'},
+        ]})
+
+        self.assertEqual([result['index'] for result in results], [1, 3, 2, 0])
+        self.assertFalse(results[0]['success'])
+        self.assertFalse(results[1]['success'])
+        self.assertEqual([(result['success'], result['employee']['id'])
+                          for result in results[2:]],
+                         [(True, self.employees[1].id), (True, self.employees[0].id)])
+
+    def test_invalid_batch(self):
+        response = self.client.post(BIOMETRY_REGISTRATIONS_URL, {'mqtt': 'device',
+                                                                  'items': 'items'},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
@@ -7,10 +7,14 @@ from idenick_rest_api_v0.views import (ControllerViewSet, DepartmentViewSet,
                                        CheckpointViewSet, DeviceViewSet,
                                        EmployeeViewSet, OrganizationViewSet,
                                        RegistratorViewSet, UserViewSet,
-                                       add_relation, get_counts,
+                                       add_relation, get_attendance_analytics,
+                                       get_counts,
                                        get_current_user, get_non_related,
                                        get_report, get_employees_requests, get_report_file,
-                                       registrate_biometry, remove_relation)
+                                       get_report_job, get_report_job_events,
+                                       get_report_job_result, registrate_biometry,
+                                       registrate_biometry_batch,
+                                       remove_relation, submit_report_job)
 
 ROUTER = DefaultRouter()
 ROUTER.register(r'organizations', OrganizationViewSet, basename='Organization')
@@ -29,6 +33,11 @@ urlpatterns += [
     url('report/', get_report),
     url('employeesRequests/', get_employees_requests),
     url('reportFile/', get_report_file),
+    path('reportJobs/', submit_report_job),
+    path('reportJobs/<str:job_id>/', get_report_job),
+    path('reportJobs/<str:job_id>/events/', get_report_job_events),
+    path('reportJobs/<str:job_id>/result/', get_report_job_result),
+    path('attendanceAnalytics/', get_attendance_analytics),
     url('counts/', get_counts),
 
     url(
@@ -42,4 +51,5 @@ urlpatterns += [
         get_non_related),
     url(
         'employees/(?P<employee_id>[0-9]+)/registrateBiometry/', registrate_biometry),
+    path('biometryRegistrations/', registrate_biometry_batch),
 ]
@@ -1,11 +1,20 @@
 """views"""
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from rest_framework.decorators import api_view
+from rest_framework import status
+from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
 from idenick_app.models import Employee, Login
-from idenick_rest_api_v0.classes.utils import (login_utils, relation_utils,
-                                               report_utils, views_utils)
+from idenick_rest_api_v0.classes.utils import (analytics_utils, biometry_utils,
+                                               export_utils,
+                                               login_utils,
+                                               relation_utils,
+                                               report_cache_utils,
+                                               report_jobs_utils,
+                                               report_store_utils, report_utils,
+                                               timing_utils, views_utils)
 from idenick_rest_api_v0.classes.utils.mqtt_utils import BiometryType
 from idenick_rest_api_v0.classes.utils.mqtt_utils import \
     registrate_biometry as registrate_biometry_by_device
@@ -36,23 +45,93 @@ def get_counts(request):
 
 @api_view(['GET'])
 @login_utils.login_check_decorator(Login.CONTROLLER, Login.REGISTRATOR, Login.ADMIN)
+@timing_utils.timing_decorator('reportFile')
 def get_report_file(request):
-    """report file"""
-    return report_utils.get_report_file(request)
+    """report file; standard reports are served from report store"""
+    response = report_store_utils.get_stored_report_response(request)
+    if response is None:
+        response = report_utils.get_report_file(request)
+
+    return response
 
 
 @api_view(['GET'])
 @login_utils.login_check_decorator(Login.CONTROLLER, Login.REGISTRATOR, Login.ADMIN)
+@timing_utils.timing_decorator('report')
 def get_report(request):
-    """return report"""
-    return Response(vars(report_utils.get_report(request)))
+    """return report; repeated reports are served from cache with ETag"""
+    return report_cache_utils.get_cached_response(
+        request, 'report', lambda: vars(report_utils.get_report(request)))
 
 
 @api_view(['GET'])
+@renderer_classes(api_settings.DEFAULT_RENDERER_CLASSES
+                  + [export_utils.CSVRenderer, export_utils.NDJSONRenderer])
 @login_utils.login_check_decorator(Login.CONTROLLER, Login.REGISTRATOR, Login.ADMIN)
 def get_employees_requests(request):
-    """return report"""
-    return Response(vars(report_utils.get_employees_requests(request)))
+    """return report; with format csv or ndjson all requests are streamed"""
+    export_format = export_utils.get_export_format(request)
+    result = None
+    if export_format is None:
+        result = Response(vars(report_utils.get_employees_requests(request)))
+    else:
+        result = export_utils.get_employees_requests_export(request, export_format)
+
+    return result
+
+
+@api_view(['GET'])
+@login_utils.login_check_decorator(Login.CONTROLLER, Login.REGISTRATOR, Login.ADMIN)
+def get_attendance_analytics(request):
+    """lateness, arrival and presence by employee, department and month"""
+    analytics = analytics_utils.get_attendance_analytics(request)
+    if analytics is None:
+        raise Http404
+
+    return Response(vars(analytics))
+
+
+@api_view(['POST'])
+@login_utils.login_check_decorator(Login.CONTROLLER, Login.REGISTRATOR, Login.ADMIN)
+def submit_report_job(request):
+    """start report generation in background"""
+    return Response(vars(report_jobs_utils.submit_job(request)))
+
+
+@api_view(['GET'])
+@login_utils.login_check_decorator(Login.CONTROLLER, Login.REGISTRATOR, Login.ADMIN)
+def get_report_job(request, job_id):
+    """return report job status and progress"""
+    info = report_jobs_utils.get_job(request, job_id)
+    if info is None:
+        raise Http404
+
+    return Response(vars(info))
+
+
+@api_view(['GET'])
+@login_utils.login_check_decorator(Login.CONTROLLER, Login.REGISTRATOR, Login.ADMIN)
+def get_report_job_events(request, job_id):
+    """stream report job status until job is finished"""
+    if report_jobs_utils.get_job(request, job_id) is None:
+        raise Http404
+
+    response = StreamingHttpResponse(report_jobs_utils.iterate_job_events(request, job_id),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+
+    return response
+
+
+@api_view(['GET'])
+@login_utils.login_check_decorator(Login.CONTROLLER, Login.REGISTRATOR, Login.ADMIN)
+def get_report_job_result(request, job_id):
+    """return file of finished report job"""
+    response = report_jobs_utils.get_job_result(request, job_id)
+    if response is None:
+        raise Http404
+
+    return response
 
 
 @api_view(['POST'])
@@ -98,3 +177,14 @@ def registrate_biometry(request, employee_id):
         employee, mqtt_id, biometry_data, biometry_type)
 
     return Response(vars(result))
+
+
+@api_view(['POST'])
+@login_utils.login_check_decorator(Login.REGISTRATOR, Login.ADMIN)
+def registrate_biometry_batch(request):
+    """registrate biometry of many employees by device, results are streamed"""
+    result = biometry_utils.get_batch_registration_response(request)
+    if result is None:
+        result = Response(status=status.HTTP_400_BAD_REQUEST)
+
+    return result